@@ -6,8 +6,15 @@ from mininet.net import Mininet
 from mininet.link import TCLink
 from mininet.log import setLogLevel, info
 from mininet.cli import CLI
+import argparse
 import os
 import json
+import sys
+
+# Node scripts and their shared modules live in mininet_shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mininet_shared'))
+from run_config import RunConfig
+from relayer_set import relayer_addresses, relayer_name
 
 # Define zones and their properties (only once at the top level)
 zones = [
@@ -24,9 +31,10 @@ zones = [
 ]
 
 class CosmosTopo(Topo):
-    def __init__(self, zones, **opts):
-        # Store zones before calling super().__init__()
+    def __init__(self, zones, relayers=1, **opts):
+        # Store zones and the number of relayers per zone before calling super().__init__()
         self.zones = zones
+        self.relayers = max(1, relayers)
         super().__init__(**opts)
 
     def build(self):
@@ -57,15 +65,17 @@ class CosmosTopo(Topo):
             self.addLink(zone_val, zone_switch)
             self.addLink(zone_full, zone_switch)
             
-            # Relayer Node for the Zone
-            relayer = self.addHost(f'r{zone_id}')
-
-            # Connect Relayer to both Hub Switch and Zone Switch with latency
-            # Use zone IDs in interface names
-            self.addLink(relayer, hub_switch, cls=TCLink, delay=latency,
-                         intfName1=f'r{zone_id}-eth_hub', params1={'ip': None})
-            self.addLink(relayer, zone_switch, cls=TCLink, delay=latency,
-                         intfName1=f'r{zone_id}-eth_zone', params1={'ip': None})
+            # Relayer Nodes for the Zone: 'rz1', then 'rz1_2', ... with --relayers-per-zone N
+            for index in range(self.relayers):
+                name = relayer_name(zone_id, index)
+                relayer = self.addHost(name)
+
+                # Connect each Relayer to both Hub Switch and Zone Switch with latency, on links of its own
+                # Use relayer names in interface names
+                self.addLink(relayer, hub_switch, cls=TCLink, delay=latency,
+                             intfName1=f'{name}-eth_hub', params1={'ip': None})
+                self.addLink(relayer, zone_switch, cls=TCLink, delay=latency,
+                             intfName1=f'{name}-eth_zone', params1={'ip': None})
 
             # Store zone switches for later use
             zone_switches.append(zone_switch)
@@ -78,11 +88,24 @@ class CosmosTopo(Topo):
             self.addLink(controller_node, zone_switch,
                          intfName1=f'controller-eth{i}', params1={'ip': None})
 
-def run():
-    # Use the global zones variable
-    global zones
+        # Connect controller to the hub switch so it can scrape the hub's metrics
+        self.addLink(controller_node, hub_switch,
+                     intfName1='controller-eth_hub', params1={'ip': None})
+
+def load_zones(config_file):
+    # Topology files (small.json, medium.json, zone_configs.json) list zones with 'id', 'name' and 'latency'
+    with open(config_file, 'r') as f:
+        return [{'id': zone['id'], 'name': zone['name'], 'latency': zone['latency']} for zone in json.load(f)]
 
-    topo = CosmosTopo(zones=zones)
+def start_network(zones, config):
+    """
+    Build the topology, start the hub, zone and relayer nodes and write zone_configs.json.
+
+    The resolved run configuration is saved as run_config.json in the logs
+    directory and every node is started with it, so all processes of a run
+    agree on ports, paths and chain parameters.
+    """
+    topo = CosmosTopo(zones=zones, relayers=config.relayers_per_zone)
     net = Mininet(topo=topo, controller=Controller, link=TCLink)
     net.start()
 
@@ -100,47 +123,79 @@ def run():
         latency = zone_info['latency']
         i = int(zone_id[1:]) - 1
 
-        relayer = net.get(f'r{zone_id}')
-
-        # Assign IPs to Relayer interfaces using zone IDs
-        relayer_intf_hub = relayer.intf(f'r{zone_id}-eth_hub')
-        relayer_intf_zone = relayer.intf(f'r{zone_id}-eth_zone')
-
-        relayer_ip_hub = f'10.0.0.{10 + i}/24'        # IP on Hub network
-        relayer_ip_zone = f'10.0.{i+1}.10/24'         # IP on Zone network
-
-        relayer_intf_hub.setIP(relayer_ip_hub)
-        relayer_intf_zone.setIP(relayer_ip_zone)
-
-        # Store relayer IPs for use in scripts if needed
-
         # Append zone nodes to nodes list
         zone_val = net.get(f'{zone_id}_v1')
         zone_full = net.get(f'{zone_id}_f1')
-        nodes.extend([zone_val, zone_full, relayer])
+        nodes.extend([zone_val, zone_full])
+
+        for index in range(topo.relayers):
+            name = relayer_name(zone_id, index)
+            relayer = net.get(name)
+
+            # Assign IPs to Relayer interfaces, e.g. 10.0.0.10 on the Hub network and 10.0.1.10 on the Zone network
+            relayer_ip_hub, relayer_ip_zone = relayer_addresses(i + 1, index)
+            relayer.intf(f'{name}-eth_hub').setIP(f'{relayer_ip_hub}/24')
+            relayer.intf(f'{name}-eth_zone').setIP(f'{relayer_ip_zone}/24')
+            nodes.append(relayer)
 
     # Mount shared directory
-    shared_dir = '/home/ubuntu/IBC_Simulation/mininet_shared'
+    shared_dir = config.shared_dir
 
     # Create logs directory in shared directory
-    logs_dir = os.path.join(shared_dir, 'logs')
+    logs_dir = config.logs_dir
     if not os.path.exists(logs_dir):
         os.makedirs(logs_dir)
 
+    # Every process of the run reads the same configuration
+    run_config_file = os.path.join(logs_dir, 'run_config.json')
+    config.save(run_config_file)
+
     for node in nodes:
-        node.cmd(f'mkdir -p /home/ubuntu/IBC_Simulation/mininet_shared')
-        node.cmd(f'mount --bind {shared_dir} /home/ubuntu/IBC_Simulation/mininet_shared')
+        node.cmd(f'mkdir -p {shared_dir}')
+        node.cmd(f'mount --bind {shared_dir} {shared_dir}')
 
     # Assign IP addresses to controller interfaces
     controller_intfs = controller.intfList()
     for i, intf in enumerate(controller_intfs):
-        if intf.name != 'lo':
+        if intf.name == 'controller-eth_hub':
+            controller.setIP('10.0.0.200/24', intf=intf)
+        elif intf.name != 'lo':
             # Assign IP on the corresponding zone network
             controller.setIP(f'10.0.{i+1}.200/24', intf=intf)
 
+    # Collect zone information; nodes read it on startup, so write it before starting them
+    zone_configs = []
+    for zone_info in zones:
+        zone_id = zone_info['id']
+        zone_name = zone_info['name']
+        latency = zone_info['latency']
+        i = int(zone_id[1:]) - 1
+
+        # Retrieve node IP addresses
+        zone_val = net.get(f'{zone_id}_v1')
+        zone_val_ip = zone_val.IP()
+
+        controller_ip = f'10.0.{i+1}.200'
+
+        zone_config = {
+            'id': zone_id,
+            'name': zone_name,
+            'latency': latency,
+            'index': i,
+            'validator_ip': zone_val_ip,
+            'controller_ip': controller_ip
+            # Add more properties if needed
+        }
+        zone_configs.append(zone_config)
+
+    # Write zone configurations to a JSON file
+    zone_config_file = config.shared_path(config.zone_config_file)
+    with open(zone_config_file, 'w') as f:
+        json.dump(zone_configs, f, indent=4)
+
     # Start Cosmos Hub Nodes with logging
-    hv1.cmd('python3 /home/ubuntu/IBC_Simulation/mininet_shared/hub_node.py hv1 > /home/ubuntu/IBC_Simulation/mininet_shared/logs/hv1_log.txt 2>&1 &')
-    hv2.cmd('python3 /home/ubuntu/IBC_Simulation/mininet_shared/hub_node.py hv2 > /home/ubuntu/IBC_Simulation/mininet_shared/logs/hv2_log.txt 2>&1 &')
+    hv1.cmd(f'python3 {shared_dir}/hub_node.py hv1 --run-config {run_config_file} > {logs_dir}/hv1_log.txt 2>&1 &')
+    hv2.cmd(f'python3 {shared_dir}/hub_node.py hv2 --run-config {run_config_file} > {logs_dir}/hv2_log.txt 2>&1 &')
 
     # Start Zone Nodes and Relayers with logging
     for zone_info in zones:
@@ -150,16 +205,17 @@ def run():
 
         zone_val = net.get(f'{zone_id}_v1')
         zone_full = net.get(f'{zone_id}_f1')
-        relayer = net.get(f'r{zone_id}')
 
         # Start Zone Validator Node
-        zone_val.cmd(f'python3 /home/ubuntu/IBC_Simulation/mininet_shared/zone_node.py {zone_id}_v1 > /home/ubuntu/IBC_Simulation/mininet_shared/logs/{zone_id}_v1_log.txt 2>&1 &')
+        zone_val.cmd(f'python3 {shared_dir}/zone_node.py {zone_id}_v1 --run-config {run_config_file} > {logs_dir}/{zone_id}_v1_log.txt 2>&1 &')
 
         # Start Zone Full Node (modify as needed)
-        zone_full.cmd(f'python3 /home/ubuntu/IBC_Simulation/mininet_shared/zone_node.py {zone_id}_f1 > /home/ubuntu/IBC_Simulation/mininet_shared/logs/{zone_id}_f1_log.txt 2>&1 &')
+        zone_full.cmd(f'python3 {shared_dir}/zone_node.py {zone_id}_f1 --run-config {run_config_file} > {logs_dir}/{zone_id}_f1_log.txt 2>&1 &')
 
-        # Start Relayer Node
-        relayer.cmd(f'python3 /home/ubuntu/IBC_Simulation/mininet_shared/relayer.py r{zone_id} {zone_id} > /home/ubuntu/IBC_Simulation/mininet_shared/logs/r{zone_id}_log.txt 2>&1 &')
+        # Start Relayer Nodes
+        for index in range(topo.relayers):
+            name = relayer_name(zone_id, index)
+            net.get(name).cmd(f'python3 {shared_dir}/relayer.py {name} {zone_id} {index} --run-config {run_config_file} > {logs_dir}/{name}_log.txt 2>&1 &')
     
     info('*** Simulation running. Use the Mininet CLI to interact.\n')
 
@@ -173,39 +229,27 @@ def run():
                 ip = host.IP(intf=intf)
                 info(f"        {intf.name}: {ip}\n")
 
-    # Collect zone information
-    zone_configs = []
-    for zone_info in zones:
-        zone_id = zone_info['id']
-        zone_name = zone_info['name']
-        latency = zone_info['latency']
-        i = int(zone_id[1:]) - 1
-
-        # Retrieve node IP addresses
-        zone_val = net.get(f'{zone_id}_v1')
-        zone_val_ip = zone_val.IP()
+    return net
 
-        controller_ip = f'10.0.{i+1}.200'
+def run(config):
+    # Zones come from the configured topology file, or the list above
+    run_zones = load_zones(config.topology_file) if config.topology_file else zones
 
-        zone_config = {
-            'id': zone_id,
-            'name': zone_name,
-            'latency': latency,
-            'index': i,
-            'validator_ip': zone_val_ip,
-            'controller_ip': controller_ip
-            # Add more properties if needed
-        }
-        zone_configs.append(zone_config)
+    net = start_network(run_zones, config)
+    controller = net.get('controller')
+    run_config_file = os.path.join(config.logs_dir, 'run_config.json')
 
-    # Write zone configurations to a JSON file
-    zone_config_file = os.path.join(shared_dir, 'zone_configs.json')
-    with open(zone_config_file, 'w') as f:
-        json.dump(zone_configs, f, indent=4)
+    # Sample every node's metrics endpoint in the background for the duration of the run
+    controller.cmd(f'python3 {config.shared_dir}/metrics_scraper.py --run-config {run_config_file} '
+                   f'> {config.logs_dir}/metrics_scraper_log.txt 2>&1 &')
+    scraper_pid = controller.cmd('echo $!').strip()
 
     # Run the simulation_controller.py on h1
     print("Running simulation_controller.py on controller")
-    output = controller.cmd('python3 /home/ubuntu/IBC_Simulation/mininet_shared/simulation_controller.py')
+    output = controller.cmd(f'python3 {config.shared_dir}/simulation_controller.py --run-config {run_config_file}')
+
+    # Stop the scraper once the run is over
+    controller.cmd(f'kill {scraper_pid}')
 
     # Start CLI for user interaction
     # CLI(net)
@@ -214,5 +258,9 @@ def run():
     net.stop()
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run one IBC simulation on a Mininet topology.')
+    RunConfig.add_arguments(parser)
+    args = parser.parse_args()
+
     setLogLevel('info')
-    run()
\ No newline at end of file
+    run(RunConfig.load(args=args))
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+import traceback
+from collections import deque
+
+# Gas charged for a single IBC transfer message (roughly what a MsgTransfer costs on a Cosmos chain)
+DEFAULT_TX_GAS = 100000
+
+class BlockEngine:
+    """
+    Block production model for a chain node.
+
+    Transactions are queued in a bounded mempool and committed in blocks every
+    `block_interval` seconds. A block holds at most `max_block_txs` transactions
+    and `max_block_gas` gas; whatever does not fit waits for the next block.
+    `commit_callback(height, txs, commit_time)` is called from the block thread
+    with the payloads included in each block.
+
+    A `block_interval` of 0 disables block production: every transaction is
+    committed immediately in the caller's thread, concurrently with other callers.
+
+    The mempool is FIFO unless a `scheduler` (a fair_queue.DeficitRoundRobin)
+    is given, in which case transactions are submitted to a lane and blocks
+    are filled from the lanes in turn.
+    """
+
+    def __init__(self, commit_callback, block_interval=1.0, max_block_txs=5000,
+                 max_block_gas=500000000, mempool_size=50000, scheduler=None, log=print):
+        self.commit_callback = commit_callback
+        self.block_interval = block_interval
+        self.max_block_txs = max_block_txs
+        self.max_block_gas = max_block_gas
+        self.mempool_size = mempool_size
+        self.scheduler = scheduler
+        self.log = log
+
+        self.height = 0
+        self.mempool = deque()  # Entries are (tx, gas, submit_time)
+        self.lock = threading.Lock()
+        self.not_full = threading.Condition(self.lock)  # Notified when a block frees mempool space
+
+        # Statistics
+        self.txs_committed = 0
+        self.txs_rejected = 0
+        self.total_queue_delay = 0.0
+
+    @classmethod
+    def from_config(cls, config, commit_callback, scheduler=None, log=print):
+        return cls(
+            commit_callback,
+            block_interval=config.block_interval,
+            max_block_txs=config.block_max_txs,
+            max_block_gas=config.block_max_gas,
+            mempool_size=config.mempool_size,
+            scheduler=scheduler,
+            log=log,
+        )
+
+    def start(self):
+        if self.block_interval > 0:
+            threading.Thread(target=self.produce_blocks, daemon=True).start()
+            self.log(f"Block engine started: interval {self.block_interval}s, "
+                     f"max {self.max_block_txs} txs / {self.max_block_gas} gas per block, "
+                     f"mempool size {self.mempool_size}")
+        else:
+            self.log("Block engine disabled: transactions are committed immediately")
+
+    def submit(self, tx, gas=DEFAULT_TX_GAS, wait=0, lane=None):
+        """
+        Add a transaction to the mempool. Returns False if it was rejected. With
+        `wait` > 0 a full mempool is waited on for up to that many seconds first.
+        `lane` picks the scheduler lane, if there is a scheduler.
+        """
+        if self.block_interval <= 0:
+            with self.lock:
+                self.height += 1
+                height = self.height
+                self.txs_committed += 1
+            self.commit_callback(height, [tx], time.time())
+            return True
+
+        with self.lock:
+            if self.mempool_full(lane) and wait > 0:
+                deadline = time.time() + wait
+                while self.mempool_full(lane) and time.time() < deadline:
+                    self.not_full.wait(deadline - time.time())
+            if self.mempool_full(lane):
+                self.txs_rejected += 1
+                if self.scheduler:
+                    self.scheduler.lane(lane).rejected += 1
+                return False
+            if self.scheduler:
+                self.scheduler.push(lane, (tx, gas, time.time()))
+            else:
+                self.mempool.append((tx, gas, time.time()))
+        return True
+
+    def mempool_full(self, lane=None):
+        if self.scheduler:
+            return not self.scheduler.has_room(lane)
+        return len(self.mempool) >= self.mempool_size
+
+    def mempool_depth(self):
+        if self.scheduler:
+            return self.scheduler.depth
+        return len(self.mempool)
+
+    def free_slots(self):
+        # Transactions the mempool can take right now
+        if self.block_interval <= 0:
+            return self.mempool_size
+        return max(0, self.mempool_size - self.mempool_depth())
+
+    def produce_blocks(self):
+        next_block_time = time.time() + self.block_interval
+        while True:
+            time_to_sleep = next_block_time - time.time()
+            if time_to_sleep > 0:
+                time.sleep(time_to_sleep)
+            next_block_time += self.block_interval
+            try:
+                self.commit_block()
+            except Exception:
+                # A failed commit must not stop block production; the node would accept transactions forever
+                self.log(f"Error committing block {self.height}: {traceback.format_exc()}")
+
+    def reap(self):
+        # Take as many transactions from the head of the mempool as fit in one block
+        txs = []
+        gas_used = 0
+        queue_delay = 0.0
+        now = time.time()
+        with self.lock:
+            if self.scheduler:
+                for tx, gas, submit_time in self.scheduler.pop_block(self.max_block_txs, self.max_block_gas, now):
+                    txs.append(tx)
+                    gas_used += gas
+                    queue_delay += now - submit_time
+            while self.mempool and len(txs) < self.max_block_txs:
+                tx, gas, submit_time = self.mempool[0]
+                if txs and gas_used + gas > self.max_block_gas:
+                    break
+                self.mempool.popleft()
+                txs.append(tx)
+                gas_used += gas
+                queue_delay += now - submit_time
+            if txs:
+                self.not_full.notify_all()
+        return txs, gas_used, queue_delay
+
+    def commit_block(self):
+        txs, gas_used, queue_delay = self.reap()
+        self.height += 1
+        commit_time = time.time()
+        if txs:
+            self.commit_callback(self.height, txs, commit_time)
+            self.txs_committed += len(txs)
+            self.total_queue_delay += queue_delay
+            self.log(f"Committed block {self.height} with {len(txs)} txs ({gas_used} gas), "
+                     f"avg queue delay {queue_delay / len(txs) * 1000:.2f} ms, "
+                     f"mempool {self.mempool_depth()}")
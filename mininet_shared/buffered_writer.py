@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+import time
+
+class BufferedWriter:
+    """
+    Append-only line writer that keeps file I/O off the caller's thread.
+
+    `write` only appends to an in-memory buffer under a lock. A background
+    thread swaps the buffer out and appends it to the file every
+    `flush_interval` seconds, or sooner once `max_buffered` lines are waiting.
+    The writer times its own flushes so their overhead can be reported.
+    """
+
+    def __init__(self, path, header=None, flush_interval=0.5, max_buffered=10000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        if header and not os.path.exists(path):
+            with open(path, 'w') as f:
+                f.write(header)
+        self.file = open(path, 'a')
+        self.lock = threading.Lock()     # Guards the buffer
+        self.io_lock = threading.Lock()  # Serializes flushes
+        self.buffer = []
+        self.wakeup = threading.Event()
+        self.closed = False
+
+        # Statistics
+        self.lines_written = 0
+        self.flushes = 0
+        self.flush_time = 0.0
+        self.max_flush_time = 0.0
+
+        self.thread = threading.Thread(target=self.flush_loop, daemon=True)
+        self.thread.start()
+
+    def write(self, line):
+        with self.lock:
+            self.buffer.append(line)
+            full = len(self.buffer) >= self.max_buffered
+        if full:
+            self.wakeup.set()
+
+    def flush_loop(self):
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self.io_lock:
+            with self.lock:
+                lines, self.buffer = self.buffer, []
+            if not lines:
+                return
+            start = time.perf_counter()
+            self.file.writelines(lines)
+            self.file.flush()
+            elapsed = time.perf_counter() - start
+            self.lines_written += len(lines)
+            self.flushes += 1
+            self.flush_time += elapsed
+            self.max_flush_time = max(self.max_flush_time, elapsed)
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+        self.thread.join()
+        self.flush()
+        self.file.close()
+
+    def stats(self):
+        avg_flush = self.flush_time / self.flushes * 1000 if self.flushes else 0.0
+        return (f"{self.lines_written} lines in {self.flushes} flushes, "
+                f"total {self.flush_time * 1000:.2f} ms, avg {avg_flush:.3f} ms, max {self.max_flush_time * 1000:.3f} ms")
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import argparse
 import csv
 from datetime import datetime
 import os
@@ -7,21 +8,101 @@ import sys
 import json
 import statistics
 
+from run_config import RunConfig
+
 def parse_timestamp(timestamp_str):
+    # Block commit timestamps carry microseconds; older logs only have whole seconds
+    if '.' in timestamp_str:
+        return datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S.%f")
     return datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
 
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def moving_average(values, width):
+    half = width // 2
+    averaged = []
+    for i in range(len(values)):
+        window = values[max(0, i - half):i + half + 1]
+        averaged.append(sum(window) / len(window))
+    return averaged
+
+def steady_state_window(send_rate_per_second, throughput_per_second, tolerance=0.1, smoothing=3, min_length=3):
+    """
+    Return the (first, last) second of the run's steady state, or None if it has none.
+
+    Only seconds in which transfers were being sent are candidates, so the
+    drain after the controller stops is always excluded. Throughput is smoothed
+    over `smoothing` seconds; warm-up ends at the first second that reaches
+    (1 - tolerance) of the median smoothed throughput and cool-down starts
+    after the last one. A saturated run is steady at its capacity, not at the
+    offered rate.
+    """
+    if not send_rate_per_second or not throughput_per_second:
+        return None
+    seconds = list(range(min(send_rate_per_second), max(send_rate_per_second) + 1))
+    smoothed = moving_average([throughput_per_second.get(second, 0) for second in seconds], smoothing)
+    reference = statistics.median(smoothed)
+    if reference <= 0:
+        return None
+    steady = [second for second, value in zip(seconds, smoothed) if value >= (1 - tolerance) * reference]
+    if steady[-1] - steady[0] + 1 < min_length:
+        return None
+    return steady[0], steady[-1]
+
+def zone_statistics(transactions, latency_data, duration):
+    """
+    Per source zone: transfers sent and completed, throughput over the run's
+    `duration` in seconds, and latency percentiles, to check how well zones
+    are isolated from each other's load.
+    """
+    sent = {}
+    for tx in transactions.values():
+        sent[tx['source_zone']] = sent.get(tx['source_zone'], 0) + 1
+    latencies = {}
+    for data in latency_data:
+        latencies.setdefault(data['source_zone'], []).append(data['latency'])
+    rows = []
+    for zone in sorted(sent):
+        zone_latencies = sorted(latencies.get(zone, []))
+        completed = len(zone_latencies)
+        rows.append({
+            'source_zone': zone,
+            'sent': sent[zone],
+            'completed': completed,
+            'error_rate': (sent[zone] - completed) / sent[zone] * 100,
+            'throughput': completed / duration if duration > 0 else 0.0,
+            'mean_latency': sum(zone_latencies) / completed if completed else 0.0,
+            'p50_latency': percentile(zone_latencies, 0.50),
+            'p99_latency': percentile(zone_latencies, 0.99),
+        })
+    return rows
+
 def main():
+    parser = argparse.ArgumentParser(description='Summarise the latency and throughput of the last simulation run.')
+    parser.add_argument('--steady-tolerance', type=float, default=0.1,
+                        help='Throughput may dip this fraction below the median and still count as steady state')
+    parser.add_argument('--smoothing', type=int, default=3, help='Seconds of throughput averaged when detecting steady state')
+    RunConfig.add_arguments(parser)
+    args = parser.parse_args()
+    config = RunConfig.load(args=args)
+
     # Paths to the shared directory
-    shared_dir = '/home/ubuntu/IBC_Simulation/mininet_shared'
+    shared_dir = config.shared_dir
+    logs_dir = config.logs_dir
     
     # Ensure the logs directory exists
-    os.makedirs(os.path.join(shared_dir, 'logs'), exist_ok=True)
+    os.makedirs(logs_dir, exist_ok=True)
     
     # Path to the simulation transactions log file
-    sim_log_file = os.path.join(shared_dir, 'logs', 'simulation_transactions.csv')
+    sim_log_file = os.path.join(logs_dir, 'simulation_transactions.csv')
     
     # Read zone configurations from shared JSON file
-    config_file = os.path.join(shared_dir, 'zone_configs.json')
+    config_file = config.shared_path(config.zone_config_file)
 
     if not os.path.exists(config_file):
         print(f"Configuration file '{config_file}' not found.")
@@ -43,7 +124,11 @@ def main():
 
     # Generate the result_files list based on the validator node names
     result_files = [
-        os.path.join(shared_dir, 'logs', f'{node_name}_transaction_results.csv')
+        os.path.join(logs_dir, f'{node_name}_transaction_results.csv')
+        for node_name in validator_node_names
+    ]
+    ack_files = [
+        os.path.join(logs_dir, f'{node_name}_ack_results.csv')
         for node_name in validator_node_names
     ]
     
@@ -68,6 +153,8 @@ def main():
                 'destination_zone': row['destination_zone'],
                 'amount': int(row['amount']),
                 'completion_time': None,  # Placeholder for completion time
+                'ack_time': None,         # When the source zone processed the acknowledgement
+                'ack_result': None,
             }
     
     # Read transaction results (completion times)
@@ -84,6 +171,19 @@ def main():
                         print(f"Warning: Transaction ID {transaction_id} found in {result_file} but not in simulation log.")
         except FileNotFoundError:
             print(f"File {result_file} not found. Skipping.")
+
+    # Read acknowledgements (round-trip completion times) written by the source zones
+    for ack_file in ack_files:
+        try:
+            with open(ack_file, 'r') as f:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    transaction_id = row['transaction_id']
+                    if transaction_id in transactions:
+                        transactions[transaction_id]['ack_time'] = parse_timestamp(row['timestamp'])
+                        transactions[transaction_id]['ack_result'] = row['result']
+        except FileNotFoundError:
+            print(f"File {ack_file} not found. Skipping.")
     
     # Calculate latency and collect rates per second
     latency_data = []
@@ -121,16 +221,40 @@ def main():
     if simulation_end_time is None:
         simulation_end_time = max(tx['init_time'] for tx in transactions.values())
 
+    # Latency percentiles of the transfers completing in each second
+    latencies_per_second = {}
+    for data in latency_data:
+        completion_seconds = int(data['completion_time'].timestamp())
+        latencies_per_second.setdefault(completion_seconds, []).append(data['latency'])
+    for second_latencies in latencies_per_second.values():
+        second_latencies.sort()
+
+    # Steady state: trim the warm-up and drain tails before averaging
+    steady_window = steady_state_window(send_rate_per_second, throughput_per_second,
+                                        args.steady_tolerance, args.smoothing)
+    if steady_window:
+        steady_start, steady_end = steady_window
+        steady_throughputs = [throughput_per_second.get(second, 0) for second in range(steady_start, steady_end + 1)]
+        steady_throughput = sum(steady_throughputs) / len(steady_throughputs)
+        std_dev_steady_throughput = statistics.stdev(steady_throughputs) if len(steady_throughputs) > 1 else 0.0
+        steady_latencies = sorted(data['latency'] for data in latency_data
+                                  if steady_start <= int(data['init_time'].timestamp()) <= steady_end)
+    else:
+        print("Warning: no steady state detected; steady-state statistics are zero.")
+        steady_start = steady_end = None
+        steady_throughput = std_dev_steady_throughput = 0.0
+        steady_latencies = []
+
     # Write latency data to CSV
-    latency_csv_file = os.path.join(shared_dir, 'logs', 'latency_results.csv')
+    latency_csv_file = os.path.join(logs_dir, 'latency_results.csv')
     with open(latency_csv_file, 'w', newline='') as f:
         fieldnames = ['transaction_id', 'latency', 'source_zone', 'destination_zone', 'amount', 'init_time', 'completion_time']
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
         for data in latency_data:
             # Convert datetime objects to strings for CSV output
-            data['init_time'] = data['init_time'].strftime('%Y-%m-%d %H:%M:%S')
-            data['completion_time'] = data['completion_time'].strftime('%Y-%m-%d %H:%M:%S')
+            data['init_time'] = data['init_time'].strftime('%Y-%m-%d %H:%M:%S.%f')
+            data['completion_time'] = data['completion_time'].strftime('%Y-%m-%d %H:%M:%S.%f')
             writer.writerow(data)
     
     # Collect latencies for summary statistics
@@ -207,6 +331,16 @@ def main():
     else:
         max_latency = 0.0
 
+    # 13. Average round-trip latency (initiation until the acknowledgement is processed by the source zone)
+    round_trips = [
+        (tx['ack_time'] - tx['init_time']).total_seconds()
+        for tx in transactions.values() if tx['ack_time'] and tx['ack_result'] == 'ok'
+    ]
+    average_round_trip = sum(round_trips) / len(round_trips) if round_trips else 0.0
+
+    # 14. Transactions refunded after an error acknowledgement or timeout
+    transactions_refunded = len([tx for tx in transactions.values() if tx['ack_result'] not in (None, 'ok')])
+
     # Print summary statistics
     print("\nSummary Statistics:")
     print("-------------------")
@@ -222,35 +356,67 @@ def main():
     print(f"Error Rate for Entire Run: {error_rate:.2f}%")
     print(f"Average Latency: {average_latency:.4f} seconds")
     print(f"Maximum Latency: {max_latency:.4f} seconds")
+    print(f"Average Round-Trip Latency: {average_round_trip:.4f} seconds")
+    print(f"Total Transactions Refunded: {transactions_refunded}")
+    if steady_window:
+        print(f"Steady State: {steady_end - steady_start + 1} seconds starting "
+              f"{steady_start - int(simulation_start_time.timestamp())} seconds into the run")
+    print(f"Steady-State Throughput: {steady_throughput:.4f} transactions/second (std dev {std_dev_steady_throughput:.4f})")
+    print(f"Steady-State Latency: p50 {percentile(steady_latencies, 0.50):.4f}, "
+          f"p90 {percentile(steady_latencies, 0.90):.4f}, p99 {percentile(steady_latencies, 0.99):.4f} seconds")
+
+    # Isolation between zones: per-source-zone throughput and latency
+    zone_rows = zone_statistics(transactions, latency_data,
+                                throughput_duration if throughput_per_second else simulation_duration)
+    print("\nPer-Zone Statistics:")
+    print(f"{'zone':<6} {'sent':>8} {'completed':>9} {'error %':>8} {'tx/s':>9} {'mean s':>8} {'p50 s':>8} {'p99 s':>8}")
+    for row in zone_rows:
+        print(f"{row['source_zone']:<6} {row['sent']:>8} {row['completed']:>9} {row['error_rate']:>8.2f} "
+              f"{row['throughput']:>9.2f} {row['mean_latency']:>8.4f} {row['p50_latency']:>8.4f} {row['p99_latency']:>8.4f}")
+    zone_csv_file = os.path.join(logs_dir, 'zone_statistics.csv')
+    with open(zone_csv_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['source_zone', 'sent', 'completed', 'error_rate', 'throughput',
+                                               'mean_latency', 'p50_latency', 'p99_latency'])
+        writer.writeheader()
+        writer.writerows(zone_rows)
 
     # Generate a run identifier (e.g., timestamp)
     run_id = datetime.now().strftime('%Y%m%d%H%M%S')
 
     # Optionally, write send rate and throughput per second to a CSV file
-    rates_csv_file = os.path.join(shared_dir, 'logs', 'rates_per_second.csv')
+    rates_csv_file = os.path.join(logs_dir, 'rates_per_second.csv')
     # Check if the CSV file exists and if it's empty
     file_exists = os.path.isfile(rates_csv_file)
     file_is_empty = not os.path.exists(rates_csv_file) or os.path.getsize(rates_csv_file) == 0
 
     # Open the CSV file in append mode
     with open(rates_csv_file, 'a', newline='') as f:
-        fieldnames = ['run_id', 'second', 'time', 'send_rate', 'throughput']
+        fieldnames = ['run_id', 'second', 'time', 'send_rate', 'throughput', 'backlog',
+                      'latency_p50', 'latency_p90', 'latency_p99', 'steady_state']
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         # Write the header only if the file doesn't exist or is empty
         if not file_exists or file_is_empty:
             writer.writeheader()
-        # Get the union of all seconds
+        # Every second from the first send to the last completion, so the backlog curve has no gaps
         all_seconds = set(send_rate_per_second.keys()).union(throughput_per_second.keys())
-        for second in sorted(all_seconds):
+        backlog = 0
+        for second in range(min(all_seconds), max(all_seconds) + 1):
             time_str = datetime.fromtimestamp(second).strftime('%Y-%m-%d %H:%M:%S')
             send_rate = send_rate_per_second.get(second, 0)
             throughput = throughput_per_second.get(second, 0)
+            backlog += send_rate - throughput  # Sent but not (yet) completed
+            second_latencies = latencies_per_second.get(second, [])
             writer.writerow({
                 'run_id': run_id,
                 'second': second,
                 'time': time_str,
                 'send_rate': send_rate,
-                'throughput': throughput
+                'throughput': throughput,
+                'backlog': backlog,
+                'latency_p50': f"{percentile(second_latencies, 0.50):.4f}" if second_latencies else '',
+                'latency_p90': f"{percentile(second_latencies, 0.90):.4f}" if second_latencies else '',
+                'latency_p99': f"{percentile(second_latencies, 0.99):.4f}" if second_latencies else '',
+                'steady_state': int(steady_window is not None and steady_start <= second <= steady_end),
             })
 
     # Write summary statistics to CSV
@@ -274,11 +440,29 @@ def main():
         'Error Rate for Entire Run (%)': f"{error_rate:.2f}",
         'Average Latency (seconds)': f"{average_latency:.4f}",
         'Maximum Latency (seconds)': f"{max_latency:.4f}",
+        'Average Round-Trip Latency (seconds)': f"{average_round_trip:.4f}",
+        'Total Transactions Refunded': transactions_refunded,
+        'Steady-State Duration (seconds)': steady_end - steady_start + 1 if steady_window else 0,
+        'Steady-State Throughput (transactions/second)': f"{steady_throughput:.4f}",
+        'Standard Deviation of Steady-State Throughput': f"{std_dev_steady_throughput:.4f}",
+        'Steady-State p50 Latency (seconds)': f"{percentile(steady_latencies, 0.50):.4f}",
+        'Steady-State p90 Latency (seconds)': f"{percentile(steady_latencies, 0.90):.4f}",
+        'Steady-State p99 Latency (seconds)': f"{percentile(steady_latencies, 0.99):.4f}",
     }
 
     # List of field names (keys) for the CSV header
     fieldnames = list(summary_data.keys())
 
+    # Summaries written before the current set of columns are kept aside rather than misaligned
+    if file_exists and not file_is_empty:
+        with open(summary_csv_file, 'r', newline='') as f:
+            header = next(csv.reader(f), [])
+        if header != fieldnames:
+            old_summary_file = summary_csv_file.replace('.csv', f'_before_{run_id}.csv')
+            os.rename(summary_csv_file, old_summary_file)
+            print(f"Existing summary has different columns; moved it to {old_summary_file}")
+            file_is_empty = True
+
     # Open the CSV file in append mode
     with open(summary_csv_file, 'a', newline='') as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames)
@@ -288,6 +472,11 @@ def main():
         # Write the summary data
         writer.writerow(summary_data)
 
+    # Keep the configuration of every summarised run next to its results
+    run_configs_dir = os.path.join(shared_dir, 'run_configs')
+    os.makedirs(run_configs_dir, exist_ok=True)
+    config.save(os.path.join(run_configs_dir, f'{run_id}.json'))
+
     print(f"\nSummary statistics have been appended to {summary_csv_file}")
     print(f"Rates per second have been appended to {rates_csv_file}")
 
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from ibc_packet import (PROOF_SEPARATOR, RECV_PACKET, TRACE_SEPARATOR, encode_header, header_signature,
+                        message_type, split_proof)
+
+def leaf_hash(body):
+    return hashlib.sha256(b'\x00' + body.encode()).digest()
+
+def node_hash(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+class CommitmentTree:
+    """
+    Merkle tree over the messages a chain commits in one block, in block order.
+
+    Leaves and inner nodes are hashed with different prefixes, and the last
+    node of an odd-sized level is carried up unchanged. Unlike IAVL, which
+    keeps one versioned tree of the whole store, every block gets a tree of
+    its own new commitments; receivers keep one root per height, the way an
+    IBC light client keeps one consensus state per height.
+    """
+
+    def __init__(self, bodies):
+        level = [leaf_hash(body) for body in bodies]
+        self.count = len(level)
+        self.levels = [level]
+        while len(level) > 1:
+            level = [node_hash(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                     for i in range(0, len(level), 2)]
+            self.levels.append(level)
+        self.root = level[0] if level else hashlib.sha256(b'').digest()
+
+    def proof(self, index):
+        # Format: '<leaf index>:<leaf count>:<sibling>.<sibling>...', siblings in hex from the leaf up
+        siblings = []
+        position = index
+        for level in self.levels[:-1]:
+            sibling = position ^ 1
+            if sibling < len(level):
+                siblings.append(level[sibling].hex())
+            position //= 2
+        return f"{index}:{self.count}:{'.'.join(siblings)}"
+
+def proof_root(body, proof, verified=None):
+    """
+    Root that the proof of `body` leads to. `verified` maps (level, index) to
+    nodes already known to lead to the trusted root; the walk stops at the
+    first of them, which is how proofs in a batch share their upper levels.
+    Returns (root or matching known node, nodes on the path).
+    """
+    index, count, siblings = proof.split(':')
+    index, width = int(index), int(count)
+    siblings = iter(siblings.split('.')) if siblings else iter(())
+    node = leaf_hash(body)
+    path = []
+    level = 0
+    while width > 1:
+        sibling = index ^ 1
+        if sibling < width:
+            sibling_hash = bytes.fromhex(next(siblings))
+            node = node_hash(node, sibling_hash) if index % 2 == 0 else node_hash(sibling_hash, node)
+        index //= 2
+        width = (width + 1) // 2
+        level += 1
+        if verified is not None and (level, index) in verified:
+            return node, path, verified[(level, index)]
+        path.append(((level, index), node))
+    return node, path, None
+
+def walk_proof(message):
+    """
+    Walk the proof of a decoded packet or acknowledgement up to the root it
+    leads to and keep it in `proof_root`. Listener workers do this, so the
+    node process only has to compare roots in ProofVerifier.verify_batch.
+    """
+    try:
+        message.proof_root = proof_root(*message.proof)[0]
+    except (ValueError, StopIteration):
+        message.proof_root = b''  # Malformed: leads to no root
+
+class CommitmentProver:
+    """
+    Chain side of commitment proofs (--commitment-proofs 1).
+
+    For every committed block the node builds a CommitmentTree over the
+    messages it sends, prefixes them with a BLOCK_HEADER carrying the root
+    and attaches each message's membership proof. This is the work of the
+    full node a real relayer queries for proofs; relayers here forward the
+    proofs and headers with the messages. Headers and the proofs of packets
+    not yet acknowledged are kept so packet clearing can relay them again.
+    """
+
+    def __init__(self, chain_id, max_headers=10000, tree_histogram=None, proof_histogram=None):
+        self.chain_id = chain_id
+        self.max_headers = max_headers
+        self.tree_histogram = tree_histogram
+        self.proof_histogram = proof_histogram
+        self.headers = OrderedDict()  # Height -> BLOCK_HEADER message
+        self.packet_proofs = {}       # (source channel, sequence) -> packet message with its proof
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, chain_id, metrics):
+        # Proofs are opt-in; returns None when disabled
+        if not config.commitment_proofs:
+            return None
+        return cls(chain_id,
+                   tree_histogram=metrics.histogram('commitment_tree_seconds', 'Time to build the commitment tree of a block'),
+                   proof_histogram=metrics.histogram('proof_generation_seconds', 'Time to generate the proofs of a block'))
+
+    def prove_block(self, height, messages):
+        """Return the block header and `messages` with their proofs attached."""
+        start = time.perf_counter()
+        split = [split_proof(message) for message in messages]
+        tree = CommitmentTree([body for body, _, _ in split])
+        built = time.perf_counter()
+
+        header = encode_header(self.chain_id, height, tree.root.hex())
+        proved = []
+        for index, (body, _, trace_id) in enumerate(split):
+            message = f"{body}{PROOF_SEPARATOR}{tree.proof(index)}"
+            proved.append(f"{message}{TRACE_SEPARATOR}{trace_id}" if trace_id else message)
+        with self.lock:
+            self.headers[height] = header
+            while len(self.headers) > self.max_headers:
+                self.headers.popitem(last=False)
+            for message in proved:
+                if message_type(message) == RECV_PACKET:
+                    fields = message.split(',', 4)
+                    self.packet_proofs[(fields[3], int(fields[2]))] = message
+        if self.tree_histogram:
+            self.tree_histogram.observe(built - start)
+            self.proof_histogram.observe(time.perf_counter() - built)
+        return header, proved
+
+    def pending_messages(self, packets):
+        """Packet messages with their proofs, preceded by the headers of their heights, for packet clearing."""
+        with self.lock:
+            messages = [self.packet_proofs.get((packet.source_channel, packet.sequence)) or packet.encode()
+                        for packet in packets]
+            headers = [self.headers[height] for height in sorted({packet.height for packet in packets})
+                       if height in self.headers]
+        return headers + messages
+
+    def forget(self, channel_id, sequence):
+        # The packet was acknowledged; its proof is no longer needed
+        with self.lock:
+            self.packet_proofs.pop((channel_id, sequence), None)
+
+class ProofVerifier:
+    """
+    Receiver side of commitment proofs.
+
+    Block headers are checked (an HMAC stands in for the validator
+    signatures a light client verifies) and their roots kept per
+    (chain, height). Messages are verified in batches against those roots:
+    proofs under the same root share their upper levels, which are hashed
+    once per batch. Verified headers and leaves are remembered in an LRU
+    cache of `cache_size` entries, so headers and packets relayed more than
+    once (by packet clearing or redundant relayers) are not verified again.
+    """
+
+    def __init__(self, cache_size=100000, max_roots=10000, metrics=None):
+        self.cache_size = cache_size
+        self.max_roots = max_roots
+        self.roots = OrderedDict()  # (chain, height) -> root
+        self.cache = OrderedDict()  # Verified ('header', chain, height, root) and ('leaf', body, root) keys
+        self.lock = threading.Lock()
+        if metrics:
+            self.header_time = metrics.histogram('header_verification_seconds', 'Time to verify one block header')
+            self.proof_time = metrics.histogram('proof_verification_seconds', 'Time to verify the proofs of one block')
+            self.verified = metrics.counter('proofs_verified_total', 'Headers and proofs verified, by kind')
+            self.cache_hits = metrics.counter('proof_cache_hits_total', 'Headers and proofs found in the verification cache, by kind')
+            self.failures = metrics.counter('proof_failures_total', 'Headers and proofs that failed verification, by kind')
+        else:
+            self.header_time = self.proof_time = self.verified = self.cache_hits = self.failures = None
+
+    @classmethod
+    def from_config(cls, config, metrics):
+        # Proofs are opt-in; returns None when disabled
+        if not config.commitment_proofs:
+            return None
+        return cls(cache_size=config.proof_cache_size, metrics=metrics)
+
+    def cached(self, key):
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return True
+        return False
+
+    def remember(self, key):
+        with self.lock:
+            self.cache[key] = True
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def count(self, counter, kind, amount=1):
+        if counter is not None and amount:
+            counter.inc(amount, kind=kind)
+
+    def verify_header(self, chain_id, height, root, signature):
+        """Check a block header and trust its root. Returns False if the signature does not match."""
+        start = time.perf_counter()
+        key = ('header', chain_id, height, root)
+        if self.cached(key):
+            self.count(self.cache_hits, 'header')
+        elif hmac.compare_digest(signature, header_signature(chain_id, height, root)):
+            self.remember(key)
+            self.count(self.verified, 'header')
+        else:
+            self.count(self.failures, 'header')
+            return False
+        with self.lock:
+            self.roots[(chain_id, height)] = bytes.fromhex(root)
+            while len(self.roots) > self.max_roots:
+                self.roots.popitem(last=False)
+        if self.header_time:
+            self.header_time.observe(time.perf_counter() - start)
+        return True
+
+    def verify_batch(self, items):
+        """
+        Verify (chain, height, body, proof[, walked root]) items. Returns a
+        list of booleans; an item fails if its proof is missing, malformed or
+        does not lead to the root trusted for its chain and height. An item
+        whose proof walk_proof() already walked only has its root compared.
+        """
+        start = time.perf_counter()
+        results = []
+        verified = {}  # Root -> {(level, index): node} of paths already checked in this batch
+        hits = checked = 0
+        for chain_id, height, body, proof, *walked in items:
+            walked_root = walked[0] if walked else None
+            with self.lock:
+                root = self.roots.get((chain_id, height))
+            if root is None or proof is None:
+                results.append(False)
+                continue
+            key = ('leaf', body, root)
+            if self.cached(key):
+                hits += 1
+                results.append(True)
+                continue
+            if walked_root is not None:
+                valid = walked_root == root
+            else:
+                known = verified.setdefault(root, {})
+                try:
+                    node, path, expected = proof_root(body, proof, known)
+                except (ValueError, StopIteration):
+                    results.append(False)
+                    continue
+                valid = node == (expected if expected is not None else root)
+                if valid:
+                    known.update(path)
+            if valid:
+                self.remember(key)
+                checked += 1
+            results.append(valid)
+        self.count(self.cache_hits, 'proof', hits)
+        self.count(self.verified, 'proof', checked)
+        self.count(self.failures, 'proof', results.count(False))
+        if self.proof_time and items:
+            self.proof_time.observe(time.perf_counter() - start)
+        return results
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+
+"""
+Compare a candidate set of runs against a baseline and flag regressions.
+
+Each run contributes one value per metric, either from a row of a
+summary_statistics.csv file or computed from a run's logs directory
+(latency_results.csv and simulation_transactions.csv). For every metric the
+report shows the mean of both sets, the relative change with a bootstrap
+confidence interval and a two-sided Mann-Whitney U test. A metric regresses
+when it moved in the bad direction by more than --threshold and the chosen
+test (--method) finds the difference significant at --alpha. The script exits
+with status 1 if any metric regressed, so it can gate automated benchmarks.
+
+Usage: python3 compare_runs.py --baseline RUNS... --candidate RUNS... [--method bootstrap|mannwhitney]
+"""
+
+import argparse
+import csv
+import math
+import os
+import random
+import sys
+from functools import lru_cache
+
+# Metric -> (description, True if higher is better)
+METRICS = {
+    'throughput': ('Average throughput (tx/s)', True),
+    'steady_throughput': ('Steady-state throughput (tx/s)', True),
+    'mean_latency': ('Average latency (s)', False),
+    'p50_latency': ('p50 latency (s)', False),
+    'p90_latency': ('p90 latency (s)', False),
+    'p99_latency': ('p99 latency (s)', False),
+    'max_latency': ('Maximum latency (s)', False),
+    'round_trip_latency': ('Average round-trip latency (s)', False),
+    'steady_p50_latency': ('Steady-state p50 latency (s)', False),
+    'steady_p99_latency': ('Steady-state p99 latency (s)', False),
+    'error_rate': ('Error rate (%)', False),
+}
+
+# summary_statistics.csv columns written by calculate_latency.py
+SUMMARY_COLUMNS = {
+    'Average Throughput per Second (transactions/second)': 'throughput',
+    'Average Latency (seconds)': 'mean_latency',
+    'Maximum Latency (seconds)': 'max_latency',
+    'Average Round-Trip Latency (seconds)': 'round_trip_latency',
+    'Error Rate for Entire Run (%)': 'error_rate',
+    'Steady-State Throughput (transactions/second)': 'steady_throughput',
+    'Steady-State p50 Latency (seconds)': 'steady_p50_latency',
+    'Steady-State p99 Latency (seconds)': 'steady_p99_latency',
+}
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list; None for an empty one
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def summary_runs(path):
+    """One metrics dict per row of a summary_statistics.csv file."""
+    runs = []
+    with open(path, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            metrics = {}
+            for column, metric in SUMMARY_COLUMNS.items():
+                try:
+                    metrics[metric] = float(row[column])
+                except (KeyError, TypeError, ValueError):
+                    pass
+            runs.append(metrics)
+    return runs
+
+def logs_run(logs_dir):
+    """Metrics of one run computed from its logs directory."""
+    latencies = []
+    completion_seconds = set()
+    with open(os.path.join(logs_dir, 'latency_results.csv'), 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            latencies.append(float(row['latency']))
+            completion_seconds.add(row['completion_time'][:19])  # Truncated to the second
+    latencies.sort()
+
+    sent = len(latencies)
+    sim_log_file = os.path.join(logs_dir, 'simulation_transactions.csv')
+    if os.path.exists(sim_log_file):
+        with open(sim_log_file, 'r') as f:
+            sent = max(0, sum(1 for _ in f) - 1)
+
+    metrics = {'error_rate': (sent - len(latencies)) / sent * 100 if sent else 0.0}
+    if latencies:
+        metrics.update({
+            'throughput': len(latencies) / len(completion_seconds),
+            'mean_latency': sum(latencies) / len(latencies),
+            'p50_latency': percentile(latencies, 0.50),
+            'p90_latency': percentile(latencies, 0.90),
+            'p99_latency': percentile(latencies, 0.99),
+            'max_latency': latencies[-1],
+        })
+    return metrics
+
+def is_logs_dir(directory):
+    return os.path.exists(os.path.join(directory, 'latency_results.csv'))
+
+def find_runs(paths, is_run=is_logs_dir, files=False):
+    """
+    Run directories under `paths`. A path may be a run directory or a
+    directory whose subdirectories (or their logs/ directories) hold one run
+    each; `is_run` tells whether a directory holds a run. With `files`, paths
+    that are files (summary_statistics.csv) are returned as they are.
+    """
+    runs = []
+    for path in paths:
+        if files and os.path.isfile(path):
+            runs.append(path)
+        elif os.path.isdir(path) and is_run(path):
+            runs.append(path)
+        elif os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                for logs_dir in (os.path.join(path, name), os.path.join(path, name, 'logs')):
+                    if os.path.isdir(logs_dir) and is_run(logs_dir):
+                        runs.append(logs_dir)
+                        break
+        else:
+            raise FileNotFoundError(f"No runs found at '{path}'")
+    return runs
+
+def load_runs(paths):
+    """
+    Metrics dicts for every run found under `paths`. A path may be a
+    summary_statistics.csv file, a logs directory or a directory whose
+    subdirectories (or their logs/ directories) hold one run each.
+    """
+    runs = []
+    for path in find_runs(paths, files=True):
+        if os.path.isfile(path):
+            runs.extend(summary_runs(path))
+        else:
+            runs.append(logs_run(path))
+    return runs
+
+def mean(values):
+    return sum(values) / len(values)
+
+@lru_cache(maxsize=None)
+def u_distribution(m, n):
+    """Number of orderings of m and n untied values giving each U statistic."""
+    if m == 0 or n == 0:
+        return (1,)
+    counts = [0] * (m * n + 1)
+    for u, ways in enumerate(u_distribution(m - 1, n)):
+        counts[u + n] += ways
+    for u, ways in enumerate(u_distribution(m, n - 1)):
+        counts[u] += ways
+    return tuple(counts)
+
+def mann_whitney(baseline, candidate):
+    """Two-sided Mann-Whitney U test; exact for small samples without ties, normal approximation otherwise."""
+    m, n = len(baseline), len(candidate)
+    combined = sorted([(value, 0) for value in baseline] + [(value, 1) for value in candidate])
+    ranks = [0.0] * len(combined)
+    tie_term = 0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        tie_term += (j - i + 1) ** 3 - (j - i + 1)
+        i = j + 1
+    rank_sum = sum(rank for rank, (_, group) in zip(ranks, combined) if group == 0)
+    u = rank_sum - m * (m + 1) / 2
+
+    if tie_term == 0 and m * n <= 400:
+        counts = u_distribution(m, n)
+        total = sum(counts)
+        low = sum(counts[:int(math.floor(min(u, m * n - u))) + 1])
+        return u, min(1.0, 2 * low / total)
+
+    mu = m * n / 2
+    sigma = math.sqrt(m * n / 12 * ((m + n + 1) - tie_term / ((m + n) * (m + n - 1))))
+    if sigma == 0:
+        return u, 1.0
+    z = (abs(u - mu) - 0.5) / sigma
+    return u, min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2)))
+
+def bootstrap_change(baseline, candidate, confidence, resamples, rng):
+    """Confidence interval of the relative change in the mean, resampling runs within each set."""
+    changes = []
+    for _ in range(resamples):
+        base = mean(rng.choices(baseline, k=len(baseline)))
+        cand = mean(rng.choices(candidate, k=len(candidate)))
+        if base != 0:
+            changes.append(cand / base - 1)
+    if not changes:
+        return None, None
+    changes.sort()
+    tail = (1 - confidence) / 2
+    return percentile(changes, tail), percentile(changes, 1 - tail)
+
+def compare(baseline_runs, candidate_runs, args):
+    rng = random.Random(args.seed)
+    results = []
+    for metric, (description, higher_is_better) in METRICS.items():
+        baseline = [run[metric] for run in baseline_runs if metric in run]
+        candidate = [run[metric] for run in candidate_runs if metric in run]
+        if not baseline or not candidate:
+            continue
+
+        base_mean, cand_mean = mean(baseline), mean(candidate)
+        change = cand_mean / base_mean - 1 if base_mean else 0.0
+        worse = change < 0 if higher_is_better else change > 0
+
+        low = high = p_value = None
+        if len(baseline) >= 2 and len(candidate) >= 2:
+            low, high = bootstrap_change(baseline, candidate, 1 - args.alpha, args.resamples, rng)
+            _, p_value = mann_whitney(baseline, candidate)
+        if args.method == 'bootstrap':
+            significant = low is not None and (low > 0 or high < 0)
+        else:
+            significant = p_value is not None and p_value < args.alpha
+
+        if significant and worse and abs(change) > args.threshold:
+            verdict = 'REGRESSION'
+        elif significant and not worse and abs(change) > args.threshold:
+            verdict = 'improvement'
+        else:
+            verdict = ''
+        results.append({
+            'metric': metric,
+            'description': description,
+            'baseline_runs': len(baseline),
+            'candidate_runs': len(candidate),
+            'baseline_mean': base_mean,
+            'candidate_mean': cand_mean,
+            'change': change,
+            'ci_low': low,
+            'ci_high': high,
+            'p_value': p_value,
+            'verdict': verdict,
+        })
+    return results
+
+def format_percent(value):
+    return '-' if value is None else f'{value * 100:+.1f}%'
+
+def print_report(results, args):
+    confidence = f'{(1 - args.alpha) * 100:g}% CI'
+    print(f"{'metric':<32} {'baseline':>12} {'candidate':>12} {'change':>8} {confidence:>20} {'p (M-W)':>8}")
+    for result in results:
+        ci = '-' if result['ci_low'] is None else \
+            f"[{format_percent(result['ci_low'])}, {format_percent(result['ci_high'])}]"
+        p_value = '-' if result['p_value'] is None else f"{result['p_value']:.4f}"
+        print(f"{result['description']:<32} {result['baseline_mean']:>12.4f} {result['candidate_mean']:>12.4f} "
+              f"{format_percent(result['change']):>8} {ci:>20} {p_value:>8}  {result['verdict']}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Flag statistically significant regressions between two sets of runs.')
+    parser.add_argument('--baseline', nargs='+', required=True,
+                        help='summary_statistics.csv files, logs directories or directories of runs')
+    parser.add_argument('--candidate', nargs='+', required=True)
+    parser.add_argument('--method', choices=['bootstrap', 'mannwhitney'], default='bootstrap',
+                        help='Test that decides significance (both are reported)')
+    parser.add_argument('--alpha', type=float, default=0.05, help='Significance level')
+    parser.add_argument('--threshold', type=float, default=0.02,
+                        help='Smallest relative change reported as a regression (0.02 = 2%%)')
+    parser.add_argument('--resamples', type=int, default=10000, help='Bootstrap resamples')
+    parser.add_argument('--seed', type=int, default=1, help='Bootstrap random seed, for reproducible reports')
+    parser.add_argument('--output', help='Also write the comparison to this CSV file')
+    args = parser.parse_args()
+
+    baseline_runs = load_runs(args.baseline)
+    candidate_runs = load_runs(args.candidate)
+    print(f"Baseline: {len(baseline_runs)} runs, candidate: {len(candidate_runs)} runs")
+    if len(baseline_runs) < 2 or len(candidate_runs) < 2:
+        print("Warning: significance needs at least 2 runs per set; no regression can be flagged", file=sys.stderr)
+
+    results = compare(baseline_runs, candidate_runs, args)
+    print_report(results, args)
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()) if results else ['metric'])
+            writer.writeheader()
+            writer.writerows(results)
+
+    regressions = [result['metric'] for result in results if result['verdict'] == 'REGRESSION']
+    if regressions:
+        print(f"\nRegressions: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo significant regressions")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+TRANSFER_PORT = 'transfer'
+
+def native_denom(zone_id):
+    # Every zone has one native token, e.g. 'uz1'
+    return f"u{zone_id}"
+
+def voucher_path(hops, base_denom):
+    """Full trace of `base_denom` after the (port, channel) hops it was received over, the last hop first."""
+    return '/'.join([f"{port}/{channel}" for port, channel in hops] + [base_denom])
+
+class DenomTracer:
+    """
+    ICS-20 denominations on one chain (--denom-tracing 1).
+
+    Packets carry the full trace of the tokens they move, such as
+    'transfer/channel-0/uz1'. A chain sending a denom that is not prefixed
+    with the sending port and channel is its source along that channel and
+    escrows the tokens; otherwise it is returning vouchers and burns them.
+    The receiver strips its counterparty's prefix to unwind a returning
+    token, or adds its own prefix and mints a voucher. Vouchers are held
+    under 'ibc/<SHA-256 of the trace>' and the chain keeps the trace of
+    every such denom it has minted.
+
+    Hashing a trace is memoized in an LRU cache of `cache_size` traces.
+    `seconds` adds up the time spent building, unwinding, hashing and looking
+    up denoms, so the per-packet cost can be compared with the cache hit rate.
+    """
+
+    def __init__(self, cache_size=10000):
+        self.cache_size = cache_size
+        self.hashes = OrderedDict()  # Trace -> ibc/ denom, least recently used first
+        self.traces = {}             # ibc/ denom -> trace, for every voucher minted here
+        self.lock = threading.Lock()
+
+        # Statistics
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.seconds = 0.0
+
+    @classmethod
+    def from_config(cls, config):
+        # Denominations are opt-in; returns None when every transfer moves the one unnamed token
+        if not config.denom_tracing:
+            return None
+        return cls(config.denom_cache_size)
+
+    def ibc_denom(self, trace):
+        with self.lock:
+            denom = self.hashes.get(trace)
+            if denom is not None:
+                self.hashes.move_to_end(trace)
+                self.cache_hits += 1
+                return denom
+            self.cache_misses += 1
+        denom = 'ibc/' + hashlib.sha256(trace.encode()).hexdigest().upper()
+        with self.lock:
+            self.hashes[trace] = denom
+            self.traces[denom] = trace
+            if len(self.hashes) > self.cache_size:
+                self.hashes.popitem(last=False)
+        return denom
+
+    def local_denom(self, trace):
+        # Native tokens keep their base denom; vouchers are held under their hash
+        if '/' not in trace:
+            return trace
+        return self.ibc_denom(trace)
+
+    def full_trace(self, denom):
+        # Raises KeyError for an ibc/ denom that was never minted here
+        if denom.startswith('ibc/'):
+            return self.traces[denom]
+        return denom
+
+    def send(self, denom, channel_id):
+        """
+        Prepare tokens of `denom` (a local denom or a full trace) to be sent over
+        `channel_id`. Returns (local denom, trace for the packet, whether this
+        chain is the source and escrows them rather than burning them).
+        """
+        start = time.perf_counter()
+        trace = self.full_trace(denom)
+        local = self.local_denom(trace)
+        source = not trace.startswith(f"{TRANSFER_PORT}/{channel_id}/")
+        self.seconds += time.perf_counter() - start
+        return local, trace, source
+
+    def receive(self, trace, source_channel, destination_channel):
+        """
+        Resolve a received packet's denom trace. Returns (local denom, whether
+        the tokens are returning to this chain and come out of escrow rather
+        than being minted).
+        """
+        start = time.perf_counter()
+        prefix = f"{TRANSFER_PORT}/{source_channel}/"
+        if trace.startswith(prefix):
+            result = self.local_denom(trace[len(prefix):]), True
+        else:
+            result = self.local_denom(f"{TRANSFER_PORT}/{destination_channel}/{trace}"), False
+        self.seconds += time.perf_counter() - start
+        return result
+
+    def register_metrics(self, registry):
+        registry.gauge('denom_trace_seconds_total', 'Time spent building, unwinding and hashing denom traces', fn=lambda: self.seconds)
+        registry.gauge('denom_cache_hits_total', 'Denom trace hashes found in the cache', fn=lambda: self.cache_hits)
+        registry.gauge('denom_cache_misses_total', 'Denom trace hashes computed', fn=lambda: self.cache_misses)
+        registry.gauge('denom_traces', 'IBC voucher denoms minted on this chain', fn=lambda: len(self.traces))
+
+    def stats(self):
+        lookups = self.cache_hits + self.cache_misses
+        hit_rate = self.cache_hits / lookups if lookups else 0.0
+        return (f"{len(self.traces)} traces, {lookups} hash lookups ({hit_rate:.1%} cached), "
+                f"{self.seconds * 1e6 / lookups if lookups else 0:.1f}us per lookup")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+from collections import deque
+
+from block_engine import DEFAULT_TX_GAS
+
+def parse_zone_values(text, cast=float):
+    # 'z1=2,z2=0.5' -> {'z1': 2.0, 'z2': 0.5}
+    return {zone.strip(): cast(value) for zone, value in
+            (item.split('=', 1) for item in text.split(',') if item.strip())}
+
+class Lane:
+    def __init__(self, weight=1.0, rate_limit=0.0):
+        self.weight = weight
+        self.rate_limit = rate_limit  # Transactions per second; 0 is unlimited
+        self.queue = deque()          # Entries are (tx, gas, submit_time)
+        self.deficit = 0
+        self.tokens = rate_limit      # Up to one second of burst
+        self.refilled = None
+
+        # Statistics
+        self.committed = 0
+        self.rejected = 0  # Counted by the BlockEngine, which checks for room first
+        self.total_queue_delay = 0.0
+
+class DeficitRoundRobin:
+    """
+    Mempool with one FIFO lane per source zone, reaped by deficit round-robin.
+
+    Each visit adds `quantum * weight` gas to a lane's deficit and the lane
+    may take transactions from its head while they fit in it, so under load
+    every zone gets block space in proportion to its weight however many
+    transactions it submits. A lane emptied in its turn forfeits the rest of
+    its deficit. A lane may hold at most its weighted share of `capacity`,
+    so a hot zone cannot fill the mempool for everyone else either, and an
+    optional per-lane rate limit (a token bucket refilled every block) caps
+    the transactions it gets into blocks per second.
+
+    Not thread-safe: the BlockEngine calls it under its lock.
+    """
+
+    def __init__(self, capacity, weights=None, rate_limits=None, quantum=10 * DEFAULT_TX_GAS):
+        # A lane of weight 0, or a quantum of 0, would never build up the deficit to take anything
+        if quantum <= 0:
+            raise ValueError(f"Fair scheduling quantum must be positive, got {quantum}")
+        for name, weight in (weights or {}).items():
+            if weight <= 0:
+                raise ValueError(f"Fair scheduling weight of zone '{name}' must be positive, got {weight}")
+        for name, rate_limit in (rate_limits or {}).items():
+            if rate_limit < 0:
+                raise ValueError(f"Fair scheduling rate limit of zone '{name}' must not be negative, got {rate_limit}")
+        self.capacity = capacity
+        self.weights = weights or {}
+        self.rate_limits = rate_limits or {}
+        self.quantum = quantum
+        self.lanes = {}
+        self.active = deque()  # Lanes with queued transactions, in round-robin order
+        self.depth = 0
+        for name in set(self.weights) | set(self.rate_limits):
+            self.lane(name)
+
+    @classmethod
+    def from_config(cls, config, lanes=()):
+        # Fair scheduling is opt-in (--fair-scheduling 1); returns None for a FIFO mempool
+        if not config.fair_scheduling:
+            return None
+        scheduler = cls(config.mempool_size, weights=parse_zone_values(config.fair_weights),
+                        rate_limits=parse_zone_values(config.fair_rate_limits),
+                        quantum=config.fair_quantum * DEFAULT_TX_GAS)
+        for name in lanes:
+            scheduler.lane(name)
+        return scheduler
+
+    def lane(self, name):
+        lane = self.lanes.get(name)
+        if lane is None:
+            lane = self.lanes[name] = Lane(self.weights.get(name, 1.0), self.rate_limits.get(name, 0.0))
+        return lane
+
+    def lane_capacity(self, lane):
+        total_weight = sum(other.weight for other in self.lanes.values())
+        return max(1, int(self.capacity * lane.weight / total_weight))
+
+    def push(self, name, entry):
+        """Queue (tx, gas, submit_time) in the lane `name`. Returns False if the lane is full."""
+        lane = self.lane(name)
+        if not self.has_room(name):
+            return False
+        if not lane.queue:
+            self.active.append(name)
+        lane.queue.append(entry)
+        self.depth += 1
+        return True
+
+    def has_room(self, name):
+        lane = self.lane(name)
+        return self.depth < self.capacity and len(lane.queue) < self.lane_capacity(lane)
+
+    def refill(self, lane, now):
+        if lane.rate_limit:
+            if lane.refilled is not None:
+                lane.tokens = min(lane.rate_limit, lane.tokens + lane.rate_limit * (now - lane.refilled))
+            lane.refilled = now
+
+    def pop_block(self, max_txs, max_gas, now):
+        """Take the transactions for one block. Returns a list of (tx, gas, submit_time)."""
+        for lane in self.lanes.values():
+            self.refill(lane, now)
+        entries = []
+        gas_used = 0
+        full = False
+        # Lanes visited in a row that took nothing. After a whole pass of them the block is done; the
+        # deficits they built up carry over, so a transaction larger than a quantum still gets in later
+        idle = 0
+        while self.active and idle < len(self.active):
+            name = self.active[0]
+            lane = self.lanes[name]
+            lane.deficit += self.quantum * lane.weight
+            took = 0
+            while lane.queue:
+                tx, gas, submit_time = lane.queue[0]
+                if len(entries) >= max_txs or (entries and gas_used + gas > max_gas):
+                    full = True
+                    break
+                if gas > lane.deficit or (lane.rate_limit and lane.tokens < 1):
+                    break
+                lane.queue.popleft()
+                lane.deficit -= gas
+                if lane.rate_limit:
+                    lane.tokens -= 1
+                lane.committed += 1
+                lane.total_queue_delay += now - submit_time
+                entries.append((tx, gas, submit_time))
+                gas_used += gas
+                took += 1
+            if full:
+                break  # The lane keeps its turn and its deficit for the next block
+            if not lane.queue:
+                lane.deficit = 0
+                self.active.popleft()
+            else:
+                self.active.rotate(-1)
+            if lane.rate_limit and lane.tokens < 1 and not took:
+                lane.deficit = min(lane.deficit, self.quantum * lane.weight)  # No credit builds up while throttled
+            idle = 0 if took else idle + 1
+        self.depth -= len(entries)
+        return entries
+
+    def stats(self):
+        return ', '.join(f"{name}: {len(lane.queue)} queued, {lane.committed} committed, {lane.rejected} rejected"
+                         for name, lane in sorted(self.lanes.items(), key=lambda item: str(item[0])))
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+from collections import deque
+
+class PeerQueue:
+    """
+    Bounded queue of IBC messages waiting to be sent to one peer.
+
+    Producers (a node's block thread, a relayer's listener) put() batches of
+    messages and a sender thread delivers them in order through `send`, merging
+    queued batches up to `max_batch` messages. A failed send is retried with
+    exponential backoff instead of dropping the batch.
+
+    put() blocks while the queue holds `capacity` messages, so a slow peer slows
+    down whoever feeds it: the block thread stops committing and the mempool
+    fills up, or the relayer stops reading and TCP pushes back on its sender.
+    A batch that still does not fit after `timeout` seconds is dropped and
+    counted, which breaks waits that go around the hub and back. `credits` is
+    the room left in the queue and is what a zone reports to the controller.
+    """
+
+    def __init__(self, peer, send, capacity, timeout=5.0, max_batch=1000, retry_interval=0.05,
+                 max_retry_interval=2.0, delay_histogram=None, log=print):
+        self.peer = peer
+        self.send = send  # Called with a list of messages; raising or returning False means it failed
+        self.capacity = capacity
+        self.timeout = timeout
+        self.max_batch = max_batch
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.delay_histogram = delay_histogram
+        self.log = log
+
+        self.queue = deque()  # Entries are (enqueue_time, messages)
+        self.depth = 0        # Messages queued or being sent
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+
+        # Statistics
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.retries = 0
+        self.blocked_time = 0.0  # Time producers spent waiting for room
+
+    @classmethod
+    def from_config(cls, config, peer, send, delay_histogram=None, log=print):
+        # Queues are opt-in (--backpressure 1); returns None when disabled
+        if not config.backpressure:
+            return None
+        queue = cls(peer, send, config.peer_queue_size, timeout=config.backpressure_timeout,
+                    delay_histogram=delay_histogram, log=log)
+        queue.start()
+        return queue
+
+    def start(self):
+        threading.Thread(target=self.sender_loop, daemon=True).start()
+
+    @property
+    def credits(self):
+        return max(0, self.capacity - self.depth)
+
+    def put(self, messages):
+        """Queue a batch for sending. Returns False if it was dropped because the queue stayed full."""
+        start = time.time()
+        deadline = start + self.timeout
+        with self.lock:
+            # A batch larger than the whole queue is let in once the queue is empty
+            while self.depth and self.depth + len(messages) > self.capacity:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.messages_dropped += len(messages)
+                    self.blocked_time += time.time() - start
+                    return False
+                self.not_full.wait(remaining)
+            now = time.time()
+            self.blocked_time += now - start
+            self.queue.append((now, messages))
+            self.depth += len(messages)
+            self.not_empty.notify()
+        return True
+
+    def sender_loop(self):
+        while True:
+            with self.lock:
+                while not self.queue:
+                    self.not_empty.wait()
+                enqueue_times = []
+                batch = []
+                while self.queue and (not batch or len(batch) + len(self.queue[0][1]) <= self.max_batch):
+                    enqueue_time, messages = self.queue.popleft()
+                    enqueue_times.append(enqueue_time)
+                    batch.extend(messages)
+
+            now = time.time()
+            if self.delay_histogram:
+                for enqueue_time in enqueue_times:
+                    self.delay_histogram.observe(now - enqueue_time, peer=self.peer)
+            self.deliver(batch)
+
+            with self.lock:
+                self.depth -= len(batch)
+                self.messages_sent += len(batch)
+                self.not_full.notify_all()
+
+    def deliver(self, batch):
+        # Keep trying until the peer takes the batch; producers are held back by the full queue meanwhile
+        interval = self.retry_interval
+        while True:
+            try:
+                if self.send(batch) is not False:
+                    return
+            except Exception as e:
+                self.log(f"Error sending {len(batch)} messages to {self.peer}: {e}")
+            self.retries += 1
+            time.sleep(interval)
+            interval = min(interval * 2, self.max_retry_interval)
+
+    def stats(self):
+        return (f"{self.peer}: {self.depth} queued, {self.messages_sent} sent, {self.messages_dropped} dropped, "
+                f"{self.retries} retries, {self.blocked_time:.2f}s blocked")
+
+def register_queue_metrics(registry, queues):
+    """
+    Expose the backlog of every PeerQueue in `queues` (a dict that may grow
+    later), labelled by peer. Returns the histogram to pass to new queues as
+    their `delay_histogram`.
+    """
+    def by_peer(value):
+        return lambda: {(('peer', queue.peer),): value(queue) for queue in list(queues.values()) if queue}
+
+    registry.gauge('peer_queue_depth', 'Messages queued for each peer', fn=by_peer(lambda queue: queue.depth))
+    registry.gauge('peer_queue_credits', 'Room left in the queue for each peer', fn=by_peer(lambda queue: queue.credits))
+    registry.gauge('peer_queue_dropped_total', 'Messages dropped after waiting for room, by peer',
+                   fn=by_peer(lambda queue: queue.messages_dropped))
+    registry.gauge('peer_queue_retries_total', 'Failed sends that were retried, by peer', fn=by_peer(lambda queue: queue.retries))
+    registry.gauge('peer_queue_blocked_seconds_total', 'Time producers spent waiting for room, by peer',
+                   fn=by_peer(lambda queue: queue.blocked_time))
+    return registry.histogram('peer_queue_delay_seconds', 'Time each queued batch waited before being sent, by peer')
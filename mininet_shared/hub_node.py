@@ -1,36 +1,114 @@
 #!/usr/bin/env python3
 
+import argparse
 import sys
 import threading
 import socket
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+from block_engine import BlockEngine
+from commitment import CommitmentProver, ProofVerifier
+from denom import DenomTracer
+from fair_queue import DeficitRoundRobin
+from flow_control import PeerQueue, register_queue_metrics
+from listener_workers import ListenerWorkers
+from ledger import Ledger
+from state_store import StateStore
+from metrics import MetricsRegistry, start_metrics_server
+from profiler import Profiler
+from receipts import EXPIRED, ReceiptWindows, export_receipts, import_receipts, register_receipt_metrics
+from relayer_set import RelayerSet
+from tracing import Tracer
+from run_config import RunConfig
+from ibc_packet import (Packet, Acknowledgement, QUERY_COMMITMENTS, ACK_SUCCESS, ACK_ERROR, MessageStream, decode_message,
+                        iter_messages, message_type, recv_messages, send_messages)
+
+UNKNOWN_ZONE = 'unknown'  # Mempool lane of messages on a channel the hub does not know
 
 class HubNode:
-    def __init__(self, node_name):
+    def __init__(self, node_name, config=None):
         self.node_name = node_name
-        self.balances = {}  # Token balances for each zone
-        self.listen_port = 8000
-        self.zone_relayers = {}  # Mapping of zones to relayer IPs
+        self.config = config or RunConfig.load()
+        self.balances = Ledger()  # Token balances for each zone
+        # With --denom-tracing 1, tokens forwarded through the hub are escrowed or burned per ICS-20
+        self.denoms = DenomTracer.from_config(self.config)
+        self.escrow = Ledger()    # (channel, denom) -> tokens escrowed for packets forwarded on the channel
+        self.listen_port = self.config.ibc_port
+        self.query_port = self.config.query_port  # Relayers query pending packet commitments here
+        self.zone_relayers = {}  # Zone ID -> RelayerSet of its relayers' hub-side IPs
+
+        # IBC state: one client, connection and transfer channel per zone
+        self.ibc_clients = {}
+        self.connections = {}
+        self.channels = {}
+        self.zone_channels = {}       # Mapping of zone IDs to the hub's channel towards them
+        self.channel_zones = {}       # The reverse: the hub's channel -> zone ID
+        self.packet_commitments = {}  # (channel, sequence) -> Packet forwarded and not yet acknowledged
+        # (channel, sequence) -> acknowledgement result, 'pending' while forwarding; with --receipt-window N
+        # only the latest N sequences of each channel are kept, in bitmaps
+        self.packet_receipts = ReceiptWindows.from_config(self.config) or {}
+        self.forwarded_packets = {}   # (channel, sequence) of a forwarded packet -> inbound Packet it came from
+        self.ibc_lock = threading.Lock()  # Guards sequences, commitments and receipts
+
+        # Connections are handled concurrently by a pool of worker threads
+        self.listener_pool = ThreadPoolExecutor(max_workers=self.config.listener_workers)
+        self.relayer_streams = {}  # Relayer IP -> MessageStream, with --relayer-passthrough 1
+        self.relayer_streams_lock = threading.Lock()
+
+        # Optional listener worker processes (--node-workers N); this process remains the only writer
+        self.listener_workers = ListenerWorkers.from_config(self.config, log=self.log)
 
         # Set up logging
-        self.logs_dir = '/home/ubuntu/IBC_Simulation/mininet_shared/logs'
+        self.logs_dir = self.config.logs_dir
         if not os.path.exists(self.logs_dir):
             os.makedirs(self.logs_dir)
         self.log_file = os.path.join(self.logs_dir, f'{self.node_name}_transfer_log.txt')
         self.log('Hub node initialized.')
+        self.tracer = Tracer.from_config(self.config, self.node_name)
+
+        # Optional profiling (--profile 1): hot paths are wrapped before anything binds them
+        self.profiler = Profiler.from_config(self.config, self.node_name, log=self.log)
+        if self.profiler:
+            self.profiler.instrument(self, ['log', 'handle_ibc_connection', 'handle_ibc_message', 'commit_block',
+                                            'recv_packet', 'acknowledge_packet', 'forward_to_zone', 'verify_proofs'])
 
         # Initialize relayer IPs dynamically
         self.initialize_zone_relayers()
 
+        # Packets are applied when the block that includes them is committed. With --fair-scheduling 1
+        # each zone's inbound messages get a lane of the mempool and blocks are filled from the lanes in turn.
+        self.scheduler = DeficitRoundRobin.from_config(self.config, lanes=self.zone_relayers)
+        self.block_engine = BlockEngine.from_config(self.config, self.commit_block, scheduler=self.scheduler, log=self.log)
+        self.init_metrics()
+
+        # Optional backpressure (--backpressure 1): one bounded queue per zone's relayer, and
+        # IBC messages wait for mempool space instead of being dropped
+        self.submit_wait = self.config.backpressure_timeout if self.config.backpressure else 0
+        for zone_id in self.zone_relayers:
+            self.relayer_queues[zone_id] = PeerQueue.from_config(
+                self.config, zone_id, lambda messages, zone_id=zone_id: self.deliver_to_zone(messages, zone_id),
+                delay_histogram=self.queue_delay, log=self.log)
+
+        # Optional commitment proofs (--commitment-proofs 1): each block's messages to the zones carry
+        # membership proofs against its commitment tree, and messages from zones are verified before they apply
+        self.prover = CommitmentProver.from_config(self.config, 'hub', self.metrics)
+        self.verifier = ProofVerifier.from_config(self.config, self.metrics)
+
+        # Optional durable state: committed blocks are logged and replayed on restart
+        self.commit_lock = threading.Lock()
+        self.state_store = StateStore.from_config(self.config, self.node_name, log=self.log)
+        if self.state_store:
+            self.restore_state()
+
     def initialize_zone_relayers(self):
         """
-        Initialize the mapping of zone IDs to their relayer IPs on the hub network.
-        Assumes relayer IPs are assigned as per the updated IP scheme.
+        Initialize the mapping of zone IDs to their relayers on the hub network.
+        Relayer IPs follow relayer_set.relayer_addresses, as in the topology.
         """
         # Read zone configurations from shared JSON file
-        shared_dir = '/home/ubuntu/IBC_Simulation/mininet_shared'
-        config_file = os.path.join(shared_dir, 'zone_configs.json')
+        config_file = self.config.shared_path(self.config.zone_config_file)
 
         if not os.path.exists(config_file):
             self.log(f"Configuration file '{config_file}' not found.")
@@ -43,8 +121,15 @@ class HubNode:
         for zone_config in zone_configs:
             zone_id = zone_config['id']  # e.g., 'z1'
             i = zone_config['index']     # Zero-based index
-            relayer_ip = f'10.0.0.{10 + i}'  # Same as in relayer and topology
-            self.zone_relayers[zone_id] = relayer_ip
+            self.zone_relayers[zone_id] = RelayerSet.from_config(self.config, i + 1, 'hub')
+
+            # Every zone uses channel-0 towards the hub
+            self.ibc_clients[f'07-tendermint-{i}'] = {'chain_id': zone_id, 'latest_height': 0}
+            self.connections[f'connection-{i}'] = {'client_id': f'07-tendermint-{i}', 'counterparty_connection_id': 'connection-0'}
+            self.channels[f'channel-{i}'] = {'port_id': 'transfer', 'connection_id': f'connection-{i}',
+                                             'counterparty_channel_id': 'channel-0', 'next_sequence_send': 1}
+            self.zone_channels[zone_id] = f'channel-{i}'
+            self.channel_zones[f'channel-{i}'] = zone_id
 
         self.log(f"Initialized zone relayers: {self.zone_relayers}")
 
@@ -54,13 +139,66 @@ class HubNode:
             f.write(f"{timestamp} {message}\n")
         print(f"{timestamp} {message}")
 
+    def init_metrics(self):
+        self.metrics = MetricsRegistry(self.node_name)
+        self.packets_in = self.metrics.counter('ibc_packets_in_total', 'IBC messages received, by type')
+        self.packets_out = self.metrics.counter('ibc_packets_out_total', 'IBC messages sent, by type')
+        self.bytes_in = self.metrics.counter('ibc_bytes_in_total', 'Bytes of IBC messages received')
+        self.bytes_out = self.metrics.counter('ibc_bytes_out_total', 'Bytes of IBC messages sent')
+        self.forward_errors = self.metrics.counter('ibc_forward_errors_total', 'IBC messages that could not be sent')
+        self.block_processing = self.metrics.histogram('block_processing_seconds', 'Time to apply a committed block and send its messages')
+        self.metrics.gauge('block_height', 'Latest committed block height', fn=lambda: self.block_engine.height)
+        self.metrics.gauge('mempool_depth', 'Transactions waiting in the mempool', fn=self.block_engine.mempool_depth)
+        self.metrics.gauge('mempool_rejected_total', 'Transactions rejected because the mempool was full', fn=lambda: self.block_engine.txs_rejected)
+        self.metrics.gauge('pending_packet_commitments', 'Packets sent and not yet acknowledged', fn=lambda: len(self.packet_commitments))
+        self.metrics.gauge('zone_balance', 'Net tokens moved to each zone through the hub',
+                           fn=lambda: {(('zone', zone_id),): amount for zone_id, amount in self.balances.snapshot().items()})
+        if self.denoms:
+            self.denoms.register_metrics(self.metrics)
+            self.metrics.gauge('escrowed_tokens', 'Tokens escrowed for forwarded transfers, by channel and denom',
+                               fn=lambda: {(('channel', channel), ('denom', denom)): amount
+                                           for (channel, denom), amount in self.escrow.snapshot().items()})
+        if self.scheduler:
+            lanes = self.scheduler.lanes
+            self.metrics.gauge('lane_depth', 'Inbound messages queued in the mempool, by source zone',
+                               fn=lambda: {(('zone', zone),): len(lane.queue) for zone, lane in list(lanes.items())})
+            self.metrics.gauge('lane_committed_total', 'Inbound messages committed, by source zone',
+                               fn=lambda: {(('zone', zone),): lane.committed for zone, lane in list(lanes.items())})
+            self.metrics.gauge('lane_rejected_total', 'Inbound messages rejected by a full lane, by source zone',
+                               fn=lambda: {(('zone', zone),): lane.rejected for zone, lane in list(lanes.items())})
+            self.metrics.gauge('lane_queue_seconds_total', 'Time committed messages waited in the mempool, by source zone',
+                               fn=lambda: {(('zone', zone),): lane.total_queue_delay for zone, lane in list(lanes.items())})
+        self.duplicates = self.metrics.counter('duplicate_messages_total', 'Packets and acknowledgements received more than once, by type')
+        if isinstance(self.packet_receipts, ReceiptWindows):
+            register_receipt_metrics(self.metrics, lambda: self.packet_receipts)
+        self.relayer_queues = {}  # Zone ID -> PeerQueue towards its relayers, with --backpressure 1
+        self.queue_delay = register_queue_metrics(self.metrics, self.relayer_queues)
+
     def start(self):
-        threading.Thread(target=self.ibc_listener, daemon=True).start()
+        if self.listener_workers:
+            # Forked before the block, metrics and listener threads start
+            self.listener_workers.start(self.handle_worker_batch)
+        if self.profiler:
+            self.profiler.start()
+        self.block_engine.start()
+        start_metrics_server(self.metrics, self.config.metrics_port, self.log)
+        if not self.listener_workers:
+            threading.Thread(target=self.ibc_listener, daemon=True).start()
+        threading.Thread(target=self.query_listener, daemon=True).start()
         self.run_node()
 
     def run_node(self):
         while True:
-            self.log("Running Hub node.")
+            self.log(f"Running Hub node. Height: {self.block_engine.height}, mempool: {self.block_engine.mempool_depth()}")
+            if self.state_store:
+                self.log(f"State store: {self.state_store.stats()}")
+            if self.denoms:
+                self.log(f"Denoms: {self.denoms.stats()}")
+            if self.scheduler:
+                self.log(f"Mempool lanes: {self.scheduler.stats()}")
+            for queue in self.relayer_queues.values():
+                if queue:
+                    self.log(f"Peer queue {queue.stats()}")
             time.sleep(10)
 
     def ibc_listener(self):
@@ -71,54 +209,388 @@ class HubNode:
             self.log(f"Listening for IBC messages on port {self.listen_port}")
             while True:
                 conn, addr = s.accept()
-                data = conn.recv(1024)
-                if data:
-                    message = data.decode()
-                    self.log(f"Received IBC message: {message} from {addr}")
-                    self.handle_ibc_message(message)
+                if self.config.relayer_passthrough:
+                    # Pass-through relayers keep their connection open, so it gets a reader of its own
+                    threading.Thread(target=self.handle_ibc_connection, args=(conn, addr), daemon=True).start()
+                else:
+                    self.listener_pool.submit(self.handle_ibc_connection, conn, addr)
+
+    def relayer_stream(self, relayer_ip):
+        # Long-lived connection to a pass-through relayer
+        with self.relayer_streams_lock:
+            stream = self.relayer_streams.get(relayer_ip)
+            if stream is None:
+                stream = self.relayer_streams[relayer_ip] = MessageStream(relayer_ip, self.config.ibc_port)
+            return stream
+
+    def handle_ibc_connection(self, conn, addr):
+        try:
+            for message in iter_messages(conn):
+                self.log(f"Received IBC message: {message} from {addr}")
+                self.packets_in.inc(type=message_type(message))
+                self.bytes_in.inc(len(message) + 1)
+                self.handle_ibc_message(message)
+        except Exception as e:
+            self.log(f"Error handling connection from {addr}: {e}")
+        finally:
+            conn.close()
+
+    def handle_worker_batch(self, txs, counts, size):
+        # Messages read, logged and decoded by a listener worker process
+        for msg_type, count in counts.items():
+            self.packets_in.inc(count, type=msg_type)
+        self.bytes_in.inc(size)
+        for tx in txs:
+            self.submit_tx(tx)
+
+    def query_listener(self):
+        # Answer relayer queries for packets that are committed but not yet acknowledged
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.bind(('', self.query_port))
+            s.listen()
+            self.log(f"Listening for queries on port {self.query_port}")
+            while True:
+                conn, addr = s.accept()
+                try:
+                    response = []
+                    for query in recv_messages(conn):
+                        parts = query.strip().split(',')
+                        if parts[0] == QUERY_COMMITMENTS and len(parts) == 2:
+                            response.extend(self.pending_messages(parts[1]))
+                        else:
+                            self.log(f"Unknown query: {query}")
+                    if response:
+                        conn.sendall(('\n'.join(response) + '\n').encode())
+                except Exception as e:
+                    self.log(f"Error answering query from {addr}: {e}")
                 conn.close()
 
+    def pending_packets(self, channel_id):
+        # Copy first: commitments are modified by the block thread
+        commitments = dict(self.packet_commitments)
+        return [commitments[key] for key in sorted(commitments) if key[0] == channel_id]
+
+    def pending_messages(self, channel_id):
+        packets = self.pending_packets(channel_id)
+        if self.prover:
+            return self.prover.pending_messages(packets)
+        return [packet.encode() for packet in packets]
+
     def handle_ibc_message(self, message):
-        # Simplified message handling
-        if message.startswith('IBC_TRANSFER'):
-            # Message format: 'IBC_TRANSFER,<amount>,<sender_zone>,<sender>,<destination_zone>,<transaction_id>'
-            parts = message.strip().split(',')
-            if len(parts) == 6:
-                _, amount_str, sender_zone, sender, destination_zone, transaction_id = parts
-                amount = int(amount_str)
-
-                # Update balances (for simulation purposes)
-                self.balances[sender_zone] = self.balances.get(sender_zone, 0) - amount
-                self.balances[destination_zone] = self.balances.get(destination_zone, 0) + amount
-
-                self.log(f"Processed transfer {transaction_id} of {amount} tokens from Zone {sender_zone} to Zone {destination_zone}.")
-                self.log(f"Balances: {self.balances}")
-
-                # Forward the IBC message to the destination zone via its relayer
-                self.forward_to_zone(message, destination_zone)
-            else:
-                self.log(f"Malformed IBC_TRANSFER message: {message}")
+        # Validate the message and queue it for the next block
+        try:
+            tx = decode_message(message)
+        except ValueError as e:
+            self.log(str(e))
+            return
+        self.submit_tx(tx)
+
+    def submit_tx(self, tx):
+        if tx[0] in ('recv', 'ack') and tx[1].trace_id:
+            self.tracer.begin(tx[1].trace_id, f'block {tx[0]}')
+        if not self.block_engine.submit(tx, wait=self.submit_wait, lane=self.source_zone(tx)):
+            self.log(f"Mempool full, dropping IBC message: {self.encode_tx(tx)}")
+
+    def source_zone(self, tx):
+        # The zone a message came from, which is the mempool lane it is scheduled in
+        kind, payload = tx
+        if kind in ('update_client', 'header'):
+            return payload[0]
+        if kind == 'recv':
+            return self.channel_zones.get(payload.destination_channel, UNKNOWN_ZONE)
+        # Acknowledgement of a packet the hub sent on that channel
+        return self.channel_zones.get(payload.source_channel, UNKNOWN_ZONE)
+
+    def commit_block(self, height, txs, commit_time):
+        start = time.perf_counter()
+        if self.state_store is None:
+            self.finish_block(height, self.apply_block(height, txs, commit_time))
         else:
-            self.log(f"Unknown message type: {message}")
+            # With durable state, blocks are applied and logged one at a time, before their effects leave the node
+            with self.commit_lock:
+                outgoing = self.apply_block(height, txs, commit_time)
+                self.state_store.append_block(height, commit_time, [self.encode_tx(tx) for tx in txs])
+                if self.state_store.snapshot_due():
+                    self.state_store.snapshot(self.export_state(height))
+            self.finish_block(height, outgoing)
+        self.block_processing.observe(time.perf_counter() - start)
+
+    def apply_block(self, height, txs, commit_time, verify=True):
+        # Apply a block's transactions. Returns the messages to send, grouped by zone.
+        outgoing = {}  # Zone ID -> messages for its relayer
+        if self.verifier and verify:
+            txs = self.verify_proofs(txs)
+        for kind, payload in txs:
+            if kind in ('recv', 'ack') and payload.trace_id:
+                self.tracer.end(payload.trace_id, f'block {kind}', commit_time)
+            if kind == 'recv':
+                zone_id, message = self.recv_packet(payload, height, commit_time)
+            elif kind == 'ack':
+                zone_id, message = self.acknowledge_packet(payload, height)
+            else:
+                if kind == 'update_client':
+                    self.update_client(*payload)
+                continue
+            if message:
+                outgoing.setdefault(zone_id, []).append(message)
+        self.log(f"Balances: {self.balances}")
+        return outgoing
+
+    def verify_proofs(self, txs):
+        # Trust the roots of the zones' headers in the block, then check the proofs of their packets and
+        # acknowledgements in one batch. Returns the transactions that passed.
+        for kind, payload in txs:
+            if kind == 'header' and not self.verifier.verify_header(*payload):
+                self.log(f"Invalid header from Zone {payload[0]} at height {payload[1]}")
+        messages = [(self.source_zone((kind, payload)), payload) for kind, payload in txs if kind in ('recv', 'ack')]
+        valid = iter(self.verifier.verify_batch([(zone_id, message.height, *(message.proof or (None, None)), message.proof_root)
+                                                 for zone_id, message in messages]))
+        verified = []
+        for kind, payload in txs:
+            if kind in ('recv', 'ack') and not next(valid):
+                self.log(f"Invalid proof for {kind} {payload.source_channel}/{payload.sequence} "
+                         f"(transaction {payload.transaction_id}) at height {payload.height}, dropping it")
+            elif kind != 'header':
+                verified.append((kind, payload))
+        return verified
+
+    def finish_block(self, height, outgoing):
+        # Forward packets and acknowledgements to each zone via its relayer
+        if self.prover and outgoing:
+            # One commitment tree per block; every zone gets the header and the proofs of its own messages
+            zones = list(outgoing)
+            header, proved = self.prover.prove_block(height, [m for zone_id in zones for m in outgoing[zone_id]])
+            start = 0
+            for zone_id in zones:
+                count = len(outgoing[zone_id])
+                outgoing[zone_id] = [header] + proved[start:start + count]
+                start += count
+        for zone_id, messages in outgoing.items():
+            self.forward_to_zone(messages, zone_id)
+
+    def recv_packet(self, packet, height, commit_time):
+        """
+        Receive a packet from a zone and forward it to its destination zone.
+        The acknowledgement to the source is only written once the destination
+        acknowledges the forwarded packet. Returns (zone_id, message) to send.
+        """
+        key = (packet.destination_channel, packet.sequence)
+        channel_id = self.zone_channels.get(packet.destination_zone)
+        forward = None
+        denom = None
+        with self.ibc_lock:
+            result = self.packet_receipts.get(key)
+            if result is None and not packet.has_timed_out(commit_time):
+                if channel_id is not None:
+                    denom = self.receive_denom(packet)
+                if denom is None:
+                    self.packet_receipts[key] = ACK_ERROR
+                else:
+                    channel = self.channels[channel_id]
+                    sequence = channel['next_sequence_send']
+                    channel['next_sequence_send'] += 1
+                    forward = Packet(sequence, channel_id, channel['counterparty_channel_id'], packet.amount,
+                                     packet.sender_zone, packet.sender, packet.destination_zone,
+                                     packet.transaction_id, packet.timeout_timestamp, height, packet.trace_id,
+                                     packet.receiver, self.send_denom(denom, channel_id, packet.amount))
+                    self.packet_commitments[(channel_id, sequence)] = forward
+                    self.forwarded_packets[(channel_id, sequence)] = packet
+                    self.packet_receipts[key] = 'pending'
+
+        if result == 'pending':
+            self.duplicates.inc(type='recv')
+            self.log(f"Duplicate packet {packet.destination_channel}/{packet.sequence} (transaction {packet.transaction_id}) still in flight")
+            return None, None
+        if result == EXPIRED:
+            # Older than the receipt window: it may or may not have been received, so it is dropped unanswered
+            self.duplicates.inc(type='recv')
+            self.log(f"Packet {packet.destination_channel}/{packet.sequence} (transaction {packet.transaction_id}) is below the receipt window, dropping it")
+            return None, None
+        if result is not None:
+            self.duplicates.inc(type='recv')
+            self.log(f"Duplicate packet {packet.destination_channel}/{packet.sequence} (transaction {packet.transaction_id})")
+            return packet.sender_zone, Acknowledgement.for_packet(packet, result, height).encode()
+        if packet.has_timed_out(commit_time):
+            self.log(f"Packet {packet.destination_channel}/{packet.sequence} (transaction {packet.transaction_id}) timed out")
+            return packet.sender_zone, Acknowledgement.for_packet(packet, 'timeout', height).encode()
+        if forward is None:
+            if channel_id is None:
+                self.log(f"No channel found for Zone {packet.destination_zone}")
+            else:
+                self.log(f"Escrow cannot cover {packet.amount} {packet.denom} returning in packet {packet.destination_channel}/{packet.sequence} (transaction {packet.transaction_id})")
+            return packet.sender_zone, Acknowledgement.for_packet(packet, ACK_ERROR, height).encode()
+
+        # Update balances (for simulation purposes)
+        self.balances.transfer(packet.sender_zone, packet.destination_zone, packet.amount, allow_overdraft=True)
+
+        self.log(f"Processed transfer {packet.transaction_id} of {packet.amount} tokens from Zone {packet.sender_zone} to Zone {packet.destination_zone} in block {height}, forwarding as packet {channel_id}/{forward.sequence}.")
+        return packet.destination_zone, forward.encode()
+
+    def acknowledge_packet(self, ack, height):
+        """
+        Handle the destination zone's acknowledgement of a forwarded packet and
+        write the acknowledgement for the original packet back to its source zone.
+        """
+        key = (ack.source_channel, ack.sequence)
+        with self.ibc_lock:
+            forward = self.packet_commitments.pop(key, None)
+            packet = self.forwarded_packets.pop(key, None)
+            result = ACK_SUCCESS if ack.success else ACK_ERROR
+            if packet is not None:
+                self.packet_receipts[(packet.destination_channel, packet.sequence)] = result
+        if forward is None:
+            self.duplicates.inc(type='ack')
+            self.log(f"No commitment for packet {ack.source_channel}/{ack.sequence}, ignoring {ack.result} acknowledgement")
+            return None, None
+        if self.prover:
+            self.prover.forget(ack.source_channel, ack.sequence)
+
+        if not ack.success:
+            # Revert the forwarded transfer; the source zone refunds the sender on the error acknowledgement
+            self.balances.transfer(packet.destination_zone, packet.sender_zone, packet.amount, allow_overdraft=True)
+            self.revert_denoms(packet, forward)
+            self.log(f"Forwarded transfer {ack.transaction_id} failed at Zone {packet.destination_zone} ({ack.result})")
+        return packet.sender_zone, Acknowledgement.for_packet(packet, result, height).encode()
 
-    def forward_to_zone(self, message, zone_id):
-        # Forward the IBC message to the destination zone's relayer
-        relayer_ip = self.zone_relayers.get(zone_id)
-        if relayer_ip:
-            port = 8000
+    def receive_denom(self, packet):
+        # Denom of a packet's tokens on the hub. Tokens returning to the hub come out of escrow; None if the
+        # escrow cannot cover them. Anything else is minted as a voucher (and escrowed or burned when forwarded).
+        if not self.denoms:
+            return ''
+        denom, returning = self.denoms.receive(packet.denom, packet.source_channel, packet.destination_channel)
+        if returning and not self.escrow.debit((packet.destination_channel, denom), packet.amount):
+            return None
+        return denom
+
+    def send_denom(self, denom, channel_id, amount):
+        # Trace to forward tokens of `denom` under, escrowing them if the hub is their source along the channel
+        if not self.denoms:
+            return ''
+        denom, trace, source = self.denoms.send(denom, channel_id)
+        if source:
+            self.escrow.credit((channel_id, denom), amount)
+        return trace
+
+    def revert_denoms(self, packet, forward):
+        # Undo the escrow movements of a forwarded transfer that failed
+        if not self.denoms:
+            return
+        denom, _, source = self.denoms.send(forward.denom, forward.source_channel)
+        if source:
+            self.escrow.debit((forward.source_channel, denom), forward.amount, allow_overdraft=True)
+        denom, returning = self.denoms.receive(packet.denom, packet.source_channel, packet.destination_channel)
+        if returning:
+            self.escrow.credit((packet.destination_channel, denom), packet.amount)
+
+    def encode_tx(self, tx):
+        kind, payload = tx
+        if kind in ('recv', 'ack'):
+            return [kind, payload.encode()]
+        return [kind, list(payload)]
+
+    def decode_tx(self, record):
+        kind, payload = record
+        if kind == 'recv':
+            return kind, Packet.decode(payload)
+        if kind == 'ack':
+            return kind, Acknowledgement.decode(payload)
+        return kind, tuple(payload)
+
+    def export_state(self, height):
+        with self.ibc_lock:
+            return {
+                'height': height,
+                'balances': self.balances.snapshot(),
+                'escrow': [[channel, denom, amount] for (channel, denom), amount in self.escrow.snapshot().items()],
+                'denom_traces': dict(self.denoms.traces) if self.denoms else {},
+                'ibc_clients': {k: dict(v) for k, v in self.ibc_clients.items()},
+                'channels': {k: dict(v) for k, v in self.channels.items()},
+                'packet_commitments': [packet.encode() for packet in self.packet_commitments.values()],
+                'packet_receipts': export_receipts(self.packet_receipts),
+                'forwarded_packets': [[channel, sequence, packet.encode()] for (channel, sequence), packet in self.forwarded_packets.items()],
+            }
+
+    def import_state(self, state):
+        self.balances = Ledger(state['balances'])
+        self.escrow = Ledger({(channel, denom): amount for channel, denom, amount in state.get('escrow', [])})
+        if self.denoms:
+            self.denoms.traces.update(state.get('denom_traces', {}))
+        self.ibc_clients = state['ibc_clients']
+        self.channels = state['channels']
+        self.packet_commitments = {}
+        for message in state['packet_commitments']:
+            packet = Packet.decode(message)
+            self.packet_commitments[(packet.source_channel, packet.sequence)] = packet
+        self.packet_receipts = import_receipts(state['packet_receipts'], self.config.receipt_window)
+        self.forwarded_packets = {(channel, sequence): Packet.decode(message) for channel, sequence, message in state['forwarded_packets']}
+
+    def restore_state(self):
+        # Load the latest snapshot and replay the blocks logged after it; effects were already sent before the restart
+        state, blocks = self.state_store.load()
+        height = 0
+        if state:
+            self.import_state(state)
+            height = state['height']
+        for block in blocks:
+            self.apply_block(block['height'], [self.decode_tx(tx) for tx in block['txs']], block['time'], verify=False)
+            height = max(height, block['height'])
+        self.block_engine.height = height
+        self.log(f"Restored state at height {height}, replayed {len(blocks)} blocks. Balances: {self.balances}")
+
+    def update_client(self, chain_id, height):
+        with self.ibc_lock:
+            for client in self.ibc_clients.values():
+                if client['chain_id'] == chain_id and height > client['latest_height']:
+                    client['latest_height'] = height
+
+    def forward_to_zone(self, messages, zone_id):
+        # Forward IBC messages to the destination zone's relayer
+        if zone_id not in self.zone_relayers:
+            self.forward_errors.inc(len(messages))
+            self.log(f"No relayer found for Zone {zone_id}")
+            return
+        queue = self.relayer_queues.get(zone_id)
+        if queue:
+            # Blocks the block thread while this zone's relayer is behind; retried by the queue's sender
+            if not queue.put(messages):
+                self.forward_errors.inc(len(messages))
+                self.log(f"Queue for Zone {zone_id}'s relayer full for {self.config.backpressure_timeout}s, "
+                         f"dropping {len(messages)} IBC messages")
+            return
+        try:
+            self.deliver_to_zone(messages, zone_id)
+        except Exception as e:
+            self.forward_errors.inc(len(messages))
+            self.log(f"Error forwarding to Zone {zone_id}'s relayer: {e}")
+
+    def deliver_to_zone(self, messages, zone_id):
+        # With redundant relayers, a relayer that cannot be reached is skipped and its messages left to
+        # packet clearing; only a lone relayer's errors are raised to the caller
+        port = self.config.ibc_port
+        start = time.time()
+        routes = self.zone_relayers[zone_id].routes(messages)
+        for relayer_ip, batch in routes:
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.connect((relayer_ip, port))
-                    s.sendall(message.encode())
-                    self.log(f"Forwarded IBC packet to relayer for Zone {zone_id} at {relayer_ip}:{port}")
+                if self.config.relayer_passthrough:
+                    self.relayer_stream(relayer_ip).send(batch)
+                else:
+                    send_messages(relayer_ip, port, batch)
             except Exception as e:
-                self.log(f"Error forwarding to Zone {zone_id}'s relayer: {e}")
-        else:
-            self.log(f"No relayer found for Zone {zone_id}")
+                if len(routes) == 1:
+                    raise
+                self.forward_errors.inc(len(batch))
+                self.log(f"Error forwarding to Zone {zone_id}'s relayer at {relayer_ip}: {e}")
+                continue
+            for message in batch:
+                self.packets_out.inc(type=message_type(message))
+            self.bytes_out.inc(sum(len(message) + 1 for message in batch))
+            self.log(f"Forwarded {len(batch)} IBC messages to relayer for Zone {zone_id} at {relayer_ip}:{port}")
+        self.tracer.trace_messages(messages, 'forward', start)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python3 hub_node.py <node_name>")
-        sys.exit(1)
-    node = HubNode(sys.argv[1])
+    parser = argparse.ArgumentParser(description='Run a hub node.')
+    parser.add_argument('node_name', help="Node name, e.g. 'hv1'")
+    RunConfig.add_arguments(parser)
+    args = parser.parse_args()
+    node = HubNode(args.node_name, RunConfig.load(args=args))
     node.start()
\ No newline at end of file
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+"""
+Measure hub throughput against the number of listener worker processes.
+
+For every worker count a hub is started on loopback with --node-workers N.
+Stand-in relayers in separate processes send RECV_PACKET messages for
+transfers from z1 to z2 in batches, one connection per batch like the
+default relayer, and the packets the hub forwards to z2's relayer are
+counted by a stand-in relayer. Throughput is forwarded packets per second of
+wall-clock time, from the first batch sent to the last packet forwarded.
+
+Workers take over reading, logging and decoding incoming messages (and,
+with --commitment-proofs, walking their proofs); submitting them and
+applying blocks still runs in the hub process, so the speedup levels off at
+the share of work that stays there. It also needs at least as many idle cores as worker
+processes plus one, so run it on the same hardware as the simulation.
+
+Usage: python3 hub_scaling_benchmark.py [--workers 1 2 4] [--packets N] [--senders N]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from ibc_packet import Packet, send_messages
+from relayer_benchmark import Sink, SINK_IP
+from run_config import RunConfig
+
+HUB_IP = '127.0.0.1'
+
+def run_hub(config, sink_port):
+    from hub_node import HubNode
+
+    sys.stdout = open(os.devnull, 'w')  # The hub echoes its log to stdout
+    hub = HubNode('hbench', config)
+    # Forwarded packets go to the stand-in relayer instead of z2's relayer on the hub network
+    hub.deliver_to_zone = lambda messages, zone_id: send_messages(SINK_IP, sink_port, messages)
+    hub.start()
+
+def run_sender(index, packets, batch_size, port):
+    # Sequences are unique per sender so the hub never sees a duplicate
+    first = index * packets + 1
+    for start in range(first, first + packets, batch_size):
+        batch = [Packet(sequence, 'channel-0', 'channel-0', 1, 'z1', 'z1_v1', 'z2', str(sequence),
+                        time.time() + 600, 1).encode()
+                 for sequence in range(start, min(start + batch_size, first + packets))]
+        send_messages(HUB_IP, port, batch)
+
+def wait_until_listening(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            send_messages(HUB_IP, port, [])
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('Hub did not start listening')
+
+def write_zone_configs(shared_dir, count=2):
+    # zone_configs.json for zones z1..z<count>, as the topology writes it
+    zones = [{'id': f'z{i + 1}', 'name': f'Zone {i + 1}', 'index': i, 'validator_ip': f'10.0.{i + 1}.1',
+              'controller_ip': f'10.0.{i + 1}.200'} for i in range(count)]
+    with open(os.path.join(shared_dir, 'zone_configs.json'), 'w') as f:
+        json.dump(zones, f)
+
+def measure(workers, args):
+    shared_dir = tempfile.mkdtemp(prefix='hub_scaling_benchmark_')
+    write_zone_configs(shared_dir)
+    config = RunConfig(shared_dir=shared_dir, ibc_port=args.port, query_port=args.port + 2, metrics_port=0,
+                       block_interval=args.block_interval, mempool_size=args.packets * 2, block_max_txs=args.packets,
+                       block_max_gas=args.packets * 100000, trace_sample_rate=0, node_workers=workers)
+    config.resolve_paths()
+    sink = Sink(args.port + 1)
+    hub = multiprocessing.Process(target=run_hub, args=(config, args.port + 1))  # Not daemonic: it forks its workers
+    hub.start()
+    try:
+        wait_until_listening(args.port)
+        per_sender = args.packets // args.senders
+        senders = [multiprocessing.Process(target=run_sender, args=(i, per_sender, args.batch, args.port))
+                   for i in range(args.senders)]
+        start = time.perf_counter()
+        for sender in senders:
+            sender.start()
+        complete = sink.wait_for(per_sender * args.senders, args.timeout)
+        elapsed = time.perf_counter() - start
+        for sender in senders:
+            sender.join()
+    finally:
+        hub.terminate()  # Its workers notice and exit
+        hub.join()
+        sink.close()
+
+    if not complete:
+        print(f"{workers} workers: only {sink.received} of {per_sender * args.senders} packets forwarded within {args.timeout}s")
+    return {
+        'workers': workers,
+        'packets': sink.received,
+        'seconds': elapsed,
+        'packets_per_second': sink.received / elapsed if elapsed else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure hub throughput against the number of listener worker processes.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help='Worker counts to measure; 1 is the single-process hub')
+    parser.add_argument('--packets', type=int, default=50000)
+    parser.add_argument('--senders', type=int, default=4, help='Stand-in relayer processes sending to the hub')
+    parser.add_argument('--batch', type=int, default=100, help='Messages per connection')
+    parser.add_argument('--block-interval', type=float, default=0.1)
+    parser.add_argument('--port', type=int, default=18300)
+    parser.add_argument('--timeout', type=float, default=300, help='Seconds to wait for all packets to be forwarded')
+    parser.add_argument('--output', help='Also write the results to this CSV file')
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs available")
+    results = []
+    for workers in args.workers:
+        results.append(measure(workers, args))
+        args.port += 10  # Sockets of the previous hub may linger in TIME_WAIT
+
+    baseline = results[0]['packets_per_second']
+    print(f"{'workers':>7} {'packets':>9} {'seconds':>8} {'packets/s':>10} {'speedup':>8}")
+    for result in results:
+        speedup = result['packets_per_second'] / baseline if baseline else 0.0
+        result['speedup'] = speedup
+        print(f"{result['workers']:>7} {result['packets']:>9} {result['seconds']:>8.2f} "
+              f"{result['packets_per_second']:>10.0f} {speedup:>7.2f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write('workers,packets,seconds,packets_per_second,speedup\n')
+            for result in results:
+                f.write(f"{result['workers']},{result['packets']},{result['seconds']:.3f},"
+                        f"{result['packets_per_second']:.1f},{result['speedup']:.3f}\n")
+
+if __name__ == '__main__':
+    main()
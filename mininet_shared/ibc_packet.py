@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+import hashlib
+import hmac
+import socket
+import threading
+
+# Message types exchanged between zones, relayers and the hub.
+# Every message is one line of comma-separated fields. Packet messages share the
+# header '<type>,<height>,<sequence>,<source_channel>,<destination_channel>' so that
+# relayers can route them without parsing the rest of the line.
+# Packets and acknowledgements of sampled transfers also carry a trace context
+# after TRACE_SEPARATOR: '<message>|<trace_id>'. The trace ID is the transaction ID.
+# With commitment proofs on, packets and acknowledgements carry a membership proof
+# after PROOF_SEPARATOR, before any trace context: '<message>;<proof>[|<trace_id>]',
+# and every block's messages are preceded by the BLOCK_HEADER holding their root.
+RECV_PACKET = 'RECV_PACKET'
+ACK_PACKET = 'ACK_PACKET'
+TIMEOUT_PACKET = 'TIMEOUT_PACKET'
+UPDATE_CLIENT = 'UPDATE_CLIENT'
+QUERY_COMMITMENTS = 'QUERY_COMMITMENTS'  # Answered on the query port with the pending packets of a channel
+BLOCK_HEADER = 'BLOCK_HEADER'
+
+ACK_SUCCESS = 'ok'
+ACK_ERROR = 'error'
+
+TRACE_SEPARATOR = '|'
+PROOF_SEPARATOR = ';'
+
+class Packet:
+    """ICS-20 token transfer packet committed on the sending chain under (source_channel, sequence)."""
+
+    def __init__(self, sequence, source_channel, destination_channel, amount, sender_zone,
+                 sender, destination_zone, transaction_id, timeout_timestamp, height=0, trace_id=None, receiver='',
+                 denom=''):
+        self.sequence = sequence
+        self.source_channel = source_channel
+        self.destination_channel = destination_channel
+        self.amount = amount
+        self.sender_zone = sender_zone
+        self.sender = sender
+        self.destination_zone = destination_zone
+        self.receiver = receiver  # Account on the destination zone; empty for the zone's node account
+        self.denom = denom        # ICS-20 denom trace of the tokens; empty for the one unnamed token
+        self.transaction_id = transaction_id
+        self.timeout_timestamp = timeout_timestamp
+        self.height = height  # Height of the sending chain when the packet was committed
+        self.trace_id = trace_id  # Set if the transfer is sampled for tracing
+        self.proof = None  # (committed message, proof) when received with a commitment proof
+        self.proof_root = None  # Root the proof leads to, once a listener worker has walked it
+
+    def __reduce__(self):
+        # Listener workers pass decoded packets on pickled as constructor arguments, not attribute dicts
+        return restore_message, (Packet, (self.sequence, self.source_channel, self.destination_channel, self.amount,
+                                          self.sender_zone, self.sender, self.destination_zone, self.transaction_id,
+                                          self.timeout_timestamp, self.height, self.trace_id, self.receiver,
+                                          self.denom), self.proof, self.proof_root)
+
+    def encode(self):
+        # Format: 'RECV_PACKET,<height>,<sequence>,<source_channel>,<destination_channel>,<amount>,
+        #          <sender_zone>,<sender>,<destination_zone>,<transaction_id>,<timeout_timestamp>,<receiver>,<denom>[|<trace_id>]'
+        return with_trace(f"{RECV_PACKET},{self.height},{self.sequence},{self.source_channel},{self.destination_channel},"
+                          f"{self.amount},{self.sender_zone},{self.sender},{self.destination_zone},"
+                          f"{self.transaction_id},{self.timeout_timestamp:.6f},{self.receiver},{self.denom}", self.trace_id)
+
+    @classmethod
+    def decode(cls, message):
+        message, proof, trace_id = split_proof(message.strip())
+        parts = message.split(',')
+        if len(parts) != 13 or parts[0] != RECV_PACKET:
+            raise ValueError(f"Malformed {RECV_PACKET} message: {message}")
+        (_, height, sequence, source_channel, destination_channel, amount, sender_zone,
+         sender, destination_zone, transaction_id, timeout_timestamp, receiver, denom) = parts
+        packet = cls(int(sequence), source_channel, destination_channel, int(amount), sender_zone,
+                     sender, destination_zone, transaction_id, float(timeout_timestamp), int(height), trace_id, receiver,
+                     denom)
+        if proof:
+            packet.proof = (message, proof)
+        return packet
+
+    def has_timed_out(self, now):
+        return now >= self.timeout_timestamp
+
+class Acknowledgement:
+    """
+    Acknowledgement written by the receiving chain for a packet, relayed back to its source.
+
+    A result of 'timeout' stands for a MsgTimeout: the receiving chain refused the packet
+    because it arrived after its timeout, which is what the relayer's proof of non-receipt
+    would show.
+    """
+
+    def __init__(self, sequence, source_channel, destination_channel, transaction_id, result, height=0, trace_id=None):
+        self.sequence = sequence
+        self.source_channel = source_channel
+        self.destination_channel = destination_channel
+        self.transaction_id = transaction_id
+        self.result = result
+        self.height = height  # Height of the receiving chain when the acknowledgement was written
+        self.trace_id = trace_id
+        self.proof = None
+        self.proof_root = None
+
+    def __reduce__(self):
+        return restore_message, (Acknowledgement, (self.sequence, self.source_channel, self.destination_channel,
+                                                   self.transaction_id, self.result, self.height, self.trace_id),
+                                 self.proof, self.proof_root)
+
+    @property
+    def is_timeout(self):
+        return self.result == 'timeout'
+
+    @property
+    def success(self):
+        return self.result == ACK_SUCCESS
+
+    def encode(self):
+        # Format: 'ACK_PACKET,<height>,<sequence>,<source_channel>,<destination_channel>,<transaction_id>,<result>'
+        #     or: 'TIMEOUT_PACKET,<height>,<sequence>,<source_channel>,<destination_channel>,<transaction_id>'
+        # followed by '|<trace_id>' if the transfer is traced
+        header = f"{self.height},{self.sequence},{self.source_channel},{self.destination_channel},{self.transaction_id}"
+        if self.is_timeout:
+            return with_trace(f"{TIMEOUT_PACKET},{header}", self.trace_id)
+        return with_trace(f"{ACK_PACKET},{header},{self.result}", self.trace_id)
+
+    @classmethod
+    def decode(cls, message):
+        message, proof, trace_id = split_proof(message.strip())
+        parts = message.split(',')
+        if parts[0] == ACK_PACKET and len(parts) == 7:
+            _, height, sequence, source_channel, destination_channel, transaction_id, result = parts
+        elif parts[0] == TIMEOUT_PACKET and len(parts) == 6:
+            _, height, sequence, source_channel, destination_channel, transaction_id = parts
+            result = 'timeout'
+        else:
+            raise ValueError(f"Malformed acknowledgement message: {message}")
+        ack = cls(int(sequence), source_channel, destination_channel, transaction_id, result, int(height), trace_id)
+        if proof:
+            ack.proof = (message, proof)
+        return ack
+
+    @classmethod
+    def for_packet(cls, packet, result, height):
+        return cls(packet.sequence, packet.source_channel, packet.destination_channel,
+                   packet.transaction_id, result, height, packet.trace_id)
+
+def restore_message(cls, args, proof, proof_root):
+    message = cls(*args)
+    message.proof = proof
+    message.proof_root = proof_root
+    return message
+
+def with_trace(message, trace_id):
+    return f"{message}{TRACE_SEPARATOR}{trace_id}" if trace_id else message
+
+def split_trace(message):
+    # Returns (message without trace context, trace ID or None)
+    message, _, trace_id = message.partition(TRACE_SEPARATOR)
+    return message, trace_id or None
+
+def split_proof(message):
+    # Returns (message without proof and trace context, proof or None, trace ID or None)
+    message, trace_id = split_trace(message)
+    message, _, proof = message.partition(PROOF_SEPARATOR)
+    return message, proof or None, trace_id
+
+def message_trace(message):
+    # Cheap check for relayers, which route messages without decoding them
+    if TRACE_SEPARATOR not in message:
+        return None
+    return message.rpartition(TRACE_SEPARATOR)[2].strip()
+
+def encode_client_update(chain_id, height):
+    # Format: 'UPDATE_CLIENT,<chain_id>,<height>'
+    return f"{UPDATE_CLIENT},{chain_id},{height}"
+
+def decode_client_update(message):
+    parts = message.strip().split(',')
+    if len(parts) != 3 or parts[0] != UPDATE_CLIENT:
+        raise ValueError(f"Malformed {UPDATE_CLIENT} message: {message}")
+    return parts[1], int(parts[2])
+
+def header_signature(chain_id, height, root):
+    # Stands in for the validators' signatures over a block header
+    key = hashlib.sha256(chain_id.encode()).digest()
+    return hmac.new(key, f"{chain_id},{height},{root}".encode(), hashlib.sha256).hexdigest()
+
+def encode_header(chain_id, height, root):
+    # Format: 'BLOCK_HEADER,<height>,0,<chain_id>,<root>,<signature>', with the packet header layout
+    return f"{BLOCK_HEADER},{height},0,{chain_id},{root},{header_signature(chain_id, height, root)}"
+
+def decode_header(message):
+    # Returns (chain_id, height, root, signature)
+    parts = split_trace(message.strip())[0].split(',')
+    if len(parts) != 6 or parts[0] != BLOCK_HEADER:
+        raise ValueError(f"Malformed {BLOCK_HEADER} message: {message}")
+    return parts[3], int(parts[1]), parts[4], parts[5]
+
+def message_type(message):
+    return message.split(',', 1)[0]
+
+def decode_message(message):
+    """
+    The (kind, payload) block transaction an incoming IBC message stands for.
+    Raises ValueError if the message is malformed or of an unknown type.
+    """
+    msg_type = message_type(message)
+    if msg_type == RECV_PACKET:
+        return 'recv', Packet.decode(message)
+    if msg_type in (ACK_PACKET, TIMEOUT_PACKET):
+        return 'ack', Acknowledgement.decode(message)
+    if msg_type == UPDATE_CLIENT:
+        return 'update_client', decode_client_update(message)
+    if msg_type == BLOCK_HEADER:
+        return 'header', decode_header(message)
+    raise ValueError(f"Unknown IBC message type: {message}")
+
+def message_height(message):
+    # Packet messages and acknowledgements carry the sending chain's height as their second field
+    return int(message.split(',', 2)[1])
+
+def message_sequence(message):
+    return int(message.split(',', 3)[2])
+
+def recv_messages(conn):
+    """Read newline-separated messages from a connection until the peer closes it."""
+    chunks = []
+    while True:
+        data = conn.recv(65536)
+        if not data:
+            break
+        chunks.append(data)
+    return [line for line in b''.join(chunks).decode().split('\n') if line.strip()]
+
+def iter_messages(conn):
+    """
+    Yield newline-separated messages as they arrive, so connections that stay
+    open between batches are processed without waiting for the peer to close.
+    An unterminated line left when the peer disconnects is discarded.
+    """
+    pending = b''
+    while True:
+        data = conn.recv(65536)
+        if not data:
+            break
+        *lines, pending = (pending + data).split(b'\n')
+        for line in lines:
+            if line.strip():
+                yield line.decode()
+
+def frame_headers(buffer, end):
+    """
+    Yield (type, height, sequence) of every newline-terminated frame in
+    buffer[:end], reading only the header fields of each line. Types are
+    bytes; fields a frame does not have are 0.
+    """
+    start = 0
+    while start < end:
+        stop = buffer.find(b'\n', start, end)
+        if stop < 0:
+            break
+        type_end = buffer.find(b',', start, stop)
+        if type_end < 0:
+            if stop > start:
+                yield bytes(buffer[start:stop]), 0, 0
+            start = stop + 1
+            continue
+        height_end = buffer.find(b',', type_end + 1, stop)
+        sequence_end = buffer.find(b',', height_end + 1, stop) if height_end >= 0 else -1
+        try:
+            height = int(buffer[type_end + 1:height_end]) if height_end >= 0 else 0
+            sequence = int(buffer[height_end + 1:sequence_end]) if sequence_end >= 0 else 0
+        except ValueError:
+            height = sequence = 0  # UPDATE_CLIENT carries a chain ID here
+        yield bytes(buffer[start:type_end]), height, sequence
+        start = stop + 1
+
+def send_messages(ip, port, messages):
+    """Send a batch of messages over a single connection."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.connect((ip, port))
+        s.sendall(('\n'.join(messages) + '\n').encode())
+
+class MessageStream:
+    """
+    Long-lived connection for sending batches of messages to one peer.
+
+    Connects on first use and reconnects once if the peer has dropped the
+    connection. Batches may be given as several buffers, which are written
+    with a single sendmsg() call instead of being joined first.
+    """
+
+    def __init__(self, ip, port, timeout=10):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.lock = threading.Lock()
+
+    def send(self, messages):
+        self.send_buffers([('\n'.join(messages) + '\n').encode()])
+
+    def send_buffers(self, buffers):
+        with self.lock:
+            try:
+                self.send_all(buffers)
+            except OSError:
+                # The peer may have restarted since the last batch; retry once on a fresh connection
+                self.close()
+                self.send_all(buffers)
+
+    def send_all(self, buffers):
+        if self.sock is None:
+            self.sock = socket.create_connection((self.ip, self.port), timeout=self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        views = [memoryview(buffer) for buffer in buffers]
+        while views:
+            sent = self.sock.sendmsg(views)
+            while views and sent >= len(views[0]):
+                sent -= len(views[0])
+                views.pop(0)
+            if views and sent:
+                views[0] = views[0][sent:]
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+
+def query_messages(ip, port, messages, timeout=10):
+    """Send a request and read back the newline-separated response."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect((ip, port))
+        s.sendall(('\n'.join(messages) + '\n').encode())
+        s.shutdown(socket.SHUT_WR)
+        return recv_messages(s)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+import base64
+import contextlib
+import threading
+from array import array
+
+class Ledger:
+    """
+    Thread-safe account balances.
+
+    Accounts are spread over `num_shards` dictionaries, each guarded by its own
+    lock, so updates to different accounts rarely contend. Operations touching
+    two accounts take both shard locks in index order to avoid deadlocks.
+    """
+
+    def __init__(self, balances=None, num_shards=64):
+        self.num_shards = num_shards
+        self.shards = [{} for _ in range(num_shards)]
+        self.locks = [threading.Lock() for _ in range(num_shards)]
+        for account, amount in (balances or {}).items():
+            self.shards[self.shard_index(account)][account] = amount
+
+    def shard_index(self, account):
+        return hash(account) % self.num_shards
+
+    def balance(self, account):
+        i = self.shard_index(account)
+        with self.locks[i]:
+            return self.shards[i].get(account, 0)
+
+    def credit(self, account, amount):
+        i = self.shard_index(account)
+        with self.locks[i]:
+            balance = self.shards[i].get(account, 0) + amount
+            self.shards[i][account] = balance
+            return balance
+
+    def debit(self, account, amount, allow_overdraft=False):
+        """Atomically check and debit an account. Returns False if the balance is insufficient."""
+        i = self.shard_index(account)
+        with self.locks[i]:
+            balance = self.shards[i].get(account, 0)
+            if balance < amount and not allow_overdraft:
+                return False
+            self.shards[i][account] = balance - amount
+            return True
+
+    def transfer(self, sender, receiver, amount, allow_overdraft=False):
+        """Atomically move `amount` between two accounts. Returns False if the sender cannot cover it."""
+        i, j = self.shard_index(sender), self.shard_index(receiver)
+        locks = [self.locks[k] for k in sorted({i, j})]
+        for lock in locks:
+            lock.acquire()
+        try:
+            balance = self.shards[i].get(sender, 0)
+            if balance < amount and not allow_overdraft:
+                return False
+            self.shards[i][sender] = balance - amount
+            self.shards[j][receiver] = self.shards[j].get(receiver, 0) + amount
+            return True
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def snapshot(self):
+        """Consistent copy of all balances, taken with every shard locked."""
+        for lock in self.locks:
+            lock.acquire()
+        try:
+            balances = {}
+            for shard in self.shards:
+                balances.update(shard)
+            return balances
+        finally:
+            for lock in reversed(self.locks):
+                lock.release()
+
+    def total_supply(self):
+        return sum(self.snapshot().values())
+
+    def __repr__(self):
+        return repr(self.snapshot())
+
+class AccountLedger:
+    """
+    Thread-safe balances of `num_accounts` accounts numbered 0 to num_accounts - 1.
+
+    Balances live in one array of signed 64-bit integers indexed by account
+    number, 8 bytes an account instead of a dict entry and a Python int per
+    account, so a zone can hold millions of them. Locks are striped by
+    account number like Ledger's shards, and each stripe keeps a tally of the
+    balances it guards so total supply does not scan the whole array.
+    Unknown accounts raise IndexError.
+    """
+
+    def __init__(self, num_accounts, initial_balance=0, num_shards=64):
+        self.num_accounts = num_accounts
+        self.num_shards = num_shards
+        self.balances = array('q', [initial_balance]) * num_accounts
+        self.locks = [threading.Lock() for _ in range(num_shards)]
+        self.supply = [initial_balance * len(range(i, num_accounts, num_shards)) for i in range(num_shards)]
+
+    @classmethod
+    def decode(cls, data, num_shards=64):
+        # Inverse of encode(): balances as base64 of the raw array
+        balances = array('q')
+        balances.frombytes(base64.b64decode(data))
+        ledger = cls(0, num_shards=num_shards)
+        ledger.num_accounts = len(balances)
+        ledger.balances = balances
+        ledger.supply = [sum(balances[i::num_shards]) for i in range(num_shards)]
+        return ledger
+
+    def encode(self):
+        with self.all_locked():
+            return base64.b64encode(self.balances.tobytes()).decode()
+
+    def check(self, account):
+        if not 0 <= account < self.num_accounts:
+            raise IndexError(f"No account {account}")
+        return account % self.num_shards
+
+    def balance(self, account):
+        self.check(account)
+        return self.balances[account]  # A single read needs no lock
+
+    def credit(self, account, amount):
+        i = self.check(account)
+        with self.locks[i]:
+            self.balances[account] += amount
+            self.supply[i] += amount
+            return self.balances[account]
+
+    def debit(self, account, amount, allow_overdraft=False):
+        """Atomically check and debit an account. Returns False if the balance is insufficient."""
+        i = self.check(account)
+        with self.locks[i]:
+            if self.balances[account] < amount and not allow_overdraft:
+                return False
+            self.balances[account] -= amount
+            self.supply[i] -= amount
+            return True
+
+    def transfer(self, sender, receiver, amount, allow_overdraft=False):
+        """Atomically move `amount` between two accounts. Returns False if the sender cannot cover it."""
+        i, j = self.check(sender), self.check(receiver)
+        locks = [self.locks[k] for k in sorted({i, j})]
+        for lock in locks:
+            lock.acquire()
+        try:
+            if self.balances[sender] < amount and not allow_overdraft:
+                return False
+            self.balances[sender] -= amount
+            self.balances[receiver] += amount
+            self.supply[i] -= amount
+            self.supply[j] += amount
+            return True
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    @contextlib.contextmanager
+    def all_locked(self):
+        for lock in self.locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(self.locks):
+                lock.release()
+
+    def snapshot(self):
+        """Consistent copy of the nonzero balances as a dict. Meant for small ledgers."""
+        with self.all_locked():
+            return {account: balance for account, balance in enumerate(self.balances) if balance}
+
+    def total_supply(self):
+        with self.all_locked():
+            return sum(self.supply)
+
+    def __repr__(self):
+        return f"AccountLedger({self.num_accounts} accounts, supply {self.total_supply()})"
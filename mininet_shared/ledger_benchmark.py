@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+Measure the memory and access cost of zone ledgers with millions of accounts.
+
+For every account count, each ledger kind is built in a fresh process:
+
+  dict   Ledger, the sharded dicts of Python ints the hub uses
+  array  AccountLedger, the array of 64-bit balances zones use with --accounts N
+
+and the process reports the resident memory the accounts added, the time to
+build the ledger and the rate of balance lookups and transfers between
+accounts drawn from --account-distribution (uniform by default).
+
+Usage: python3 ledger_benchmark.py [--accounts 1000000 10000000] [--kinds dict array] [--operations N]
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+
+from ledger import AccountLedger, Ledger
+from run_config import RunConfig
+from workload import AccountSampler
+
+KINDS = ['dict', 'array']
+
+def resident_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def build(kind, accounts, initial_balance):
+    if kind == 'array':
+        return AccountLedger(accounts, initial_balance)
+    ledger = Ledger()
+    for account in range(accounts):
+        ledger.credit(account, initial_balance)
+    return ledger
+
+def run(kind, accounts, operations, config, results):
+    # Runs in its own process, so memory freed by an earlier measurement does not hide this one
+    sampler = AccountSampler(accounts, config.account_distribution, config.account_skew)
+    pairs = [sampler.pair() for _ in range(operations)]
+    amounts = [1 + i % 10 for i in range(operations)]
+
+    before = resident_bytes()
+    start = time.perf_counter()
+    ledger = build(kind, accounts, config.initial_balance)
+    build_seconds = time.perf_counter() - start
+    memory = resident_bytes() - before
+
+    start = time.perf_counter()
+    for sender, _ in pairs:
+        ledger.balance(sender)
+    lookup_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for (sender, receiver), amount in zip(pairs, amounts):
+        ledger.transfer(sender, receiver, amount)
+    transfer_seconds = time.perf_counter() - start
+
+    if ledger.total_supply() != accounts * config.initial_balance:
+        raise RuntimeError(f"{kind} ledger lost tokens")
+    results.put({
+        'kind': kind,
+        'accounts': accounts,
+        'memory_mb': memory / 2 ** 20,
+        'bytes_per_account': memory / accounts,
+        'build_seconds': build_seconds,
+        'lookups_per_second': operations / lookup_seconds,
+        'transfers_per_second': operations / transfer_seconds,
+    })
+
+def measure(kind, accounts, operations, config):
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    process = context.Process(target=run, args=(kind, accounts, operations, config, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure memory and access cost of ledgers with millions of accounts.')
+    parser.add_argument('--accounts', type=int, nargs='+', default=[1000000, 10000000], help='Account counts to measure')
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=KINDS)
+    parser.add_argument('--operations', type=int, default=1000000, help='Lookups and transfers timed per measurement')
+    parser.add_argument('--output', help='Also write the results to this CSV file')
+    RunConfig.add_arguments(parser)
+    args = parser.parse_args()
+    config = RunConfig.load(args=args)
+
+    columns = ['kind', 'accounts', 'memory_mb', 'bytes_per_account', 'build_seconds', 'lookups_per_second', 'transfers_per_second']
+    skew = f" (skew {config.account_skew})" if config.account_distribution != 'uniform' else ''
+    print(f"Accounts drawn from the {config.account_distribution} distribution{skew}")
+    print(f"{'kind':>6} {'accounts':>10} {'memory MB':>10} {'B/account':>10} {'build s':>8} {'lookups/s':>11} {'transfers/s':>12}")
+    results = []
+    for accounts in args.accounts:
+        for kind in args.kinds:
+            result = measure(kind, accounts, args.operations, config)
+            results.append(result)
+            print(f"{kind:>6} {accounts:>10} {result['memory_mb']:>10.1f} {result['bytes_per_account']:>10.1f} "
+                  f"{result['build_seconds']:>8.2f} {result['lookups_per_second']:>11.0f} {result['transfers_per_second']:>12.0f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(','.join(columns) + '\n')
+            for result in results:
+                f.write(','.join(str(round(result[column], 3)) if isinstance(result[column], float) else str(result[column])
+                                 for column in columns) + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+"""
+Stress test for the ledger and the IBC bookkeeping of the chain nodes.
+
+1. Hammers a single Ledger, and then an array-backed AccountLedger, from
+   many threads with random transfers and paired credit/debit updates on a
+   hot account, then checks that no update was lost and that total supply
+   is unchanged.
+2. Builds an in-process topology (zone nodes and a hub wired together in
+   memory instead of through relayers), fires transfers concurrently at high
+   TPS and checks that, once every packet is acknowledged, the zones hold the
+   same total supply they started with and the hub's net balances sum to zero.
+   The nodes get a temporary shared directory with a zone_configs.json for
+   --zones zones, so their logs and results stay out of the simulation's.
+
+Usage: python3 ledger_stress.py [--threads N] [--transfers N] [--zones N]
+"""
+
+import argparse
+import contextlib
+import io
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from hub_scaling_benchmark import write_zone_configs
+from ledger import AccountLedger, Ledger
+from run_config import RunConfig
+from workload import AccountSampler
+
+def stress_ledger(threads, operations, array_backed=False):
+    if array_backed:
+        accounts, hot = list(range(100)), 100
+        ledger = AccountLedger(101)
+        for account in accounts:
+            ledger.credit(account, 1000)
+    else:
+        accounts, hot = [f'acct{i}' for i in range(100)], 'hot'
+        ledger = Ledger({account: 1000 for account in accounts})
+    initial_supply = ledger.total_supply()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(operations):
+            sender, receiver = rng.sample(accounts, 2)
+            ledger.transfer(sender, receiver, rng.randint(1, 50))
+            # Paired updates on one hot account: lost updates would show up as drift
+            ledger.credit(hot, 1)
+            ledger.debit(hot, 1, allow_overdraft=True)
+
+    start = time.time()
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.time() - start
+
+    balances = ledger.snapshot()
+    total_ops = threads * operations * 3
+    print(f"{type(ledger).__name__}: {total_ops} operations from {threads} threads in {elapsed:.2f}s ({total_ops / elapsed:.0f} ops/s)")
+    ok = True
+    if ledger.total_supply() != initial_supply:
+        print(f"FAIL: total supply changed from {initial_supply} to {ledger.total_supply()}")
+        ok = False
+    if balances.get(hot, 0) != 0:
+        print(f"FAIL: hot account drifted to {balances[hot]} (lost updates)")
+        ok = False
+    negative = [account for account, amount in balances.items() if amount < 0]
+    if negative:
+        print(f"FAIL: negative balances for {negative}")
+        ok = False
+    return ok
+
+def isolate(config, num_zones):
+    # The in-process nodes write results, logs and state like real ones; keep them out of the simulation's directories
+    shared_dir = tempfile.mkdtemp(prefix='ledger_stress_')
+    write_zone_configs(shared_dir, num_zones)
+    config.shared_dir = shared_dir
+    config.zone_config_file = 'zone_configs.json'
+    config.logs_dir = config.state_dir = config.profile_dir = config.trace_dir = ''
+    config.resolve_paths()
+    return shared_dir
+
+def build_topology(num_zones, config):
+    from hub_node import HubNode
+    from zone_node import ZoneNode
+
+    zones = {f'z{i}': ZoneNode(f'z{i}_v1', config) for i in range(1, num_zones + 1)}
+    hub = HubNode('hv1', config)
+
+    # Wire nodes together in memory, standing in for the relayers
+    def zone_sender(zone_id):
+        def send_to_relayer(messages):
+            for message in messages:
+                hub.handle_ibc_message(message)
+        return send_to_relayer
+
+    def forward_to_zone(messages, zone_id):
+        for message in messages:
+            zones[zone_id].handle_ibc_message(message)
+
+    for zone_id, zone in zones.items():
+        zone.send_to_relayer = zone_sender(zone_id)
+    hub.forward_to_zone = forward_to_zone
+    for node in list(zones.values()) + [hub]:
+        node.block_engine.start()
+    return zones, hub
+
+def stress_topology(threads, transfers, num_zones, config):
+    with contextlib.redirect_stdout(io.StringIO()):
+        zones, hub = build_topology(num_zones, config)
+    zone_ids = list(zones)
+    # Native tokens sent out with --denom-tracing 1 stay in the source zone's escrow
+    initial_supply = sum(zone.balance + zone.escrow.total_supply() for zone in zones.values())
+
+    sampler = AccountSampler.from_config(config)  # With --accounts N, transfers move between accounts
+
+    def send(transaction_id):
+        source, destination = random.sample(zone_ids, 2)
+        sender, receiver = sampler.pair() if sampler else ('', '')
+        zones[source].initiate_transfer(destination, random.randint(1, 10), str(transaction_id),
+                                        sender=str(sender), receiver=str(receiver))
+
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(send, range(1, transfers + 1)))
+
+        # Wait for every packet to be acknowledged (or refunded)
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            pending = sum(len(zone.packet_commitments) for zone in zones.values()) + len(hub.packet_commitments)
+            mempools = sum(node.block_engine.mempool_depth() for node in list(zones.values()) + [hub])
+            if pending == 0 and mempools == 0:
+                break
+            time.sleep(0.1)
+    elapsed = time.time() - start
+
+    final_supply = sum(zone.balance + zone.escrow.total_supply() for zone in zones.values())
+    hub_net = hub.balances.total_supply()
+    print(f"Topology: {transfers} transfers across {num_zones} zones from {threads} threads in {elapsed:.2f}s ({transfers / elapsed:.0f} TPS)")
+    ok = True
+    if pending or mempools:
+        print(f"FAIL: {pending} packets still pending and {mempools} transactions in mempools")
+        ok = False
+    if final_supply != initial_supply:
+        print(f"FAIL: zone supply changed from {initial_supply} to {final_supply}")
+        ok = False
+    if hub_net != 0:
+        print(f"FAIL: hub net balances sum to {hub_net}, expected 0")
+        ok = False
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description='Stress test ledger state and supply conservation.')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--operations', type=int, default=20000, help='Ledger operations per thread')
+    parser.add_argument('--transfers', type=int, default=5000)
+    parser.add_argument('--zones', type=int, default=4)
+    parser.add_argument('--block-interval', type=float, default=0.0,
+                        help='Block interval for the in-process nodes (0 commits inline and concurrently)')
+    RunConfig.add_arguments(parser)
+    args = parser.parse_args()
+
+    config = RunConfig.load(args=args)
+    shared_dir = isolate(config, args.zones)
+    if args.mempool_size is None:
+        config.mempool_size = max(config.mempool_size, args.transfers * 4)
+
+    ok = stress_ledger(args.threads, args.operations)
+    ok = stress_ledger(args.threads, args.operations, array_backed=True) and ok
+    ok = stress_topology(args.threads, args.transfers, args.zones, config) and ok
+    print("PASS" if ok else f"FAIL (node logs in {shared_dir})")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
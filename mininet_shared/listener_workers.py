@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from commitment import walk_proof
+from ibc_packet import decode_message, message_type
+
+def reuseport_listener(port):
+    # Every process binding the port with SO_REUSEPORT gets its own accept queue; the kernel spreads connections
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    s.bind(('', port))
+    s.listen()
+    return s
+
+class ListenerWorkers:
+    """
+    A node's IBC listener spread over worker processes (--node-workers N).
+
+    Each of the `count` workers binds the IBC port with SO_REUSEPORT, so the
+    kernel spreads incoming relayer connections across them. Everything about
+    a message that needs no node state runs there, on as many cores: reading
+    and framing, logging, decoding and validating it into a block
+    transaction and, with --commitment-proofs, walking its proof up to the
+    root it leads to. The transactions of every read are passed on as one
+    pipe message, pickled as constructor arguments, together with the
+    message counts and bytes for the node's metrics.
+
+    The node process stays the single writer. Unpickling the transactions,
+    submitting them to the mempool under the block engine's lock, checking
+    header signatures and comparing walked proofs against the roots it
+    trusts, and applying blocks to the ledger and IBC state still run there,
+    one at a time.
+
+    Workers are forked when the node starts, before its other threads. Nodes
+    are killed rather than shut down, so each worker exits on its own once
+    its parent is gone.
+    """
+
+    def __init__(self, count, port, passthrough=False, pool_size=8, walk_proofs=False, log=print):
+        self.count = count
+        self.port = port
+        self.passthrough = passthrough
+        self.walk_proofs = walk_proofs
+        self.pool_size = pool_size
+        self.log = log
+        self.processes = []
+
+    @classmethod
+    def from_config(cls, config, log=print):
+        # Worker processes are opt-in; returns None for a single-process node
+        if config.node_workers <= 1:
+            return None
+        return cls(config.node_workers, config.ibc_port, passthrough=config.relayer_passthrough,
+                   pool_size=config.listener_workers, walk_proofs=config.commitment_proofs, log=log)
+
+    def start(self, handle_batch):
+        """
+        Fork the workers. `handle_batch(txs, counts, size)` is called in this
+        process for every read: the decoded transactions, the number of
+        messages per message type and their size in bytes.
+        """
+        context = multiprocessing.get_context('fork')
+        for index in range(self.count):
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=self.serve, args=(index, sender), daemon=True)
+            process.start()
+            sender.close()
+            self.processes.append(process)
+            threading.Thread(target=self.receive, args=(index, receiver, handle_batch), daemon=True).start()
+        self.log(f"Started {self.count} listener workers on port {self.port} (SO_REUSEPORT)")
+
+    def receive(self, index, pipe, handle_batch):
+        while True:
+            try:
+                txs, counts, size = pipe.recv()
+            except (EOFError, OSError):
+                self.log(f"Listener worker {index} exited")
+                return
+            handle_batch(txs, counts, size)
+
+    def serve(self, index, pipe):
+        # Runs in the worker process
+        threading.Thread(target=self.exit_with_parent, args=(os.getppid(),), daemon=True).start()
+        pipe_lock = threading.Lock()
+        pool = ThreadPoolExecutor(max_workers=self.pool_size)
+        with reuseport_listener(self.port) as s:
+            while True:
+                conn, addr = s.accept()
+                if self.passthrough:
+                    # Pass-through relayers keep their connection open, so it gets a reader of its own
+                    threading.Thread(target=self.read_connection, args=(conn, addr, pipe, pipe_lock), daemon=True).start()
+                else:
+                    pool.submit(self.read_connection, conn, addr, pipe, pipe_lock)
+
+    def exit_with_parent(self, parent_pid):
+        while os.getppid() == parent_pid:
+            time.sleep(1)
+        os._exit(0)
+
+    def decode(self, message):
+        # Runs in the worker process; returns None for a message that is logged and dropped
+        try:
+            tx = decode_message(message)
+        except ValueError as e:
+            self.log(str(e))
+            return None
+        if self.walk_proofs and tx[0] in ('recv', 'ack') and tx[1].proof:
+            walk_proof(tx[1])
+        return tx
+
+    def read_connection(self, conn, addr, pipe, pipe_lock):
+        # Complete lines are passed on after every read, so long-lived connections are not held back
+        pending = b''
+        try:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                pending += data
+                end = pending.rfind(b'\n')
+                if end < 0:
+                    continue
+                lines, pending = pending[:end], pending[end + 1:]
+                txs = []
+                counts = {}
+                for message in lines.decode().split('\n'):
+                    if message.strip():
+                        self.log(f"Received IBC message: {message} from {addr}")
+                        msg_type = message_type(message)
+                        counts[msg_type] = counts.get(msg_type, 0) + 1
+                        tx = self.decode(message)
+                        if tx is not None:
+                            txs.append(tx)
+                with pipe_lock:
+                    pipe.send((txs, counts, end + 1))
+        except Exception as e:
+            self.log(f"Error handling connection from {addr}: {e}")
+        finally:
+            conn.close()
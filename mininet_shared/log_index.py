@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+
+"""
+Index the transfer logs of one or more runs and query them by transaction or time.
+
+Every *_transfer_log.txt written by log() in the node scripts is memory-mapped
+and indexed by a worker process of its own:
+
+  lines   byte offset of every line
+  times   line timestamps in time order, with the lines they belong to
+  tx      64-bit hashes of the transaction ids a line mentions, sorted, with their lines
+  errors  timestamps and lines of errors, drops and failed transfers, in time order
+
+Line starts and timestamps are found with numpy over the mapped bytes, and
+transaction ids and errors with precompiled byte patterns run over the whole
+file, so Python code only runs per match, not per line. The arrays are saved as .npy files in
+a log_index/ directory next to the logs and memory-mapped again to answer a
+query, which then costs a binary search per log file. Logs are append-only:
+a log that grew since it was indexed only has its new lines parsed, and one
+that shrank is indexed again.
+
+Usage: python3 log_index.py RUNS... [--tx ID] [--errors] [--since T] [--until T] [--node NAME] [--workers N]
+
+RUNS are logs directories or directories of runs. Without --tx or --errors
+the logs are indexed and summarized; with only --since/--until every line in
+that window is shown. Times are 'YYYY-MM-DD HH:MM:SS', as in the logs.
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from compare_runs import find_runs
+
+LOG_SUFFIX = '_transfer_log.txt'
+INDEX_DIR = 'log_index'
+INDEX_VERSION = 1
+ARRAYS = ['lines', 'times', 'time_lines', 'tx_hashes', 'tx_lines', 'error_times', 'error_lines']
+CHUNK_BYTES = 64 << 20  # Bytes scanned for line starts at a time
+CHUNK_LINES = 1 << 16   # Lines whose timestamps are read at a time, about 11 MB of temporaries
+
+# Lines start with '[YYYY-MM-DD HH:MM:SS] '
+TIMESTAMP_LENGTH = 19
+
+# Transaction ids, one pattern per way the nodes log them. Packets and acknowledgements are
+# logged in their wire format, where the id is the 10th or 6th field. Every pattern starts
+# with a literal, which the regex engine skips ahead to instead of trying each position.
+TX_PATTERNS = [re.compile(pattern) for pattern in [
+    rb'\(transaction ([^)\s]+)\)',
+    rb'Initiating transfer ([^\s,]+)',
+    rb'Processed transfer ([^\s,]+)',
+    rb'Forwarded transfer ([^\s,]+)',
+    rb'dropping transfer ([^\s,]+)',
+    rb'\] Transfer ([^\s,]+) ',
+    rb'RECV_PACKET,(?:[^,\n]*,){8}([^,\n]+)',
+    rb'ACK_PACKET,(?:[^,\n]*,){4}([^,|;\n]+)',
+    rb'TIMEOUT_PACKET,(?:[^,\n]*,){4}([^,|;\n]+)',
+    rb'command: transfer \S+ \S+ (\S+)',
+]]
+
+# Errors, drops and failed transfers
+ERROR_PATTERNS = [re.compile(pattern) for pattern in [
+    rb'Error', rb'error', rb'failed', rb'Invalid', rb'Unknown', rb'Insufficient', rb'full', rb'timed out',
+    rb'cannot', rb'dropping',
+]]
+
+def tx_hash(transaction_id):
+    # Stable across processes, unlike hash(); collisions are filtered out when the lines are read
+    if isinstance(transaction_id, str):
+        transaction_id = transaction_id.encode()
+    return int.from_bytes(hashlib.blake2b(transaction_id, digest_size=8).digest(), 'little')
+
+def parse_time(text):
+    # Seconds since the epoch of a log timestamp, read as UTC like the indexed ones
+    return int(np.datetime64(text, 's').astype(np.int64))
+
+def node_name(log_file):
+    return os.path.basename(log_file)[:-len(LOG_SUFFIX)]
+
+def index_prefix(log_file):
+    return os.path.join(os.path.dirname(log_file), INDEX_DIR, node_name(log_file))
+
+def line_starts(data, start, end):
+    """Offsets of the lines that begin in data[start:end], which ends on a line boundary."""
+    starts = [np.array([start], dtype=np.int64)] if start < end else []
+    for chunk in range(start, end, CHUNK_BYTES):
+        window = data[chunk:min(chunk + CHUNK_BYTES, end)]
+        starts.append(np.flatnonzero(window == ord('\n')).astype(np.int64) + chunk + 1)
+    starts = np.concatenate(starts) if starts else np.empty(0, dtype=np.int64)
+    return starts[starts < end]
+
+def line_times(data, starts, previous=0):
+    """
+    Timestamp of every line. Lines without one (a message spanning lines) take
+    the time of the line before; `previous` is the time before the first.
+    """
+    times = np.empty(len(starts), dtype=np.int64)
+    for chunk in range(0, len(starts), CHUNK_LINES):
+        times[chunk:chunk + CHUNK_LINES] = chunk_times(data, starts[chunk:chunk + CHUNK_LINES], previous)
+        previous = times[min(chunk + CHUNK_LINES, len(starts)) - 1]
+    return times
+
+def chunk_times(data, starts, previous):
+    # line_times() of a chunk of lines, which gathers TIMESTAMP_LENGTH + 2 bytes of each
+    positions = np.minimum(starts[:, None] + np.arange(TIMESTAMP_LENGTH + 2), len(data) - 1)
+    heads = data[positions]
+    valid = (heads[:, 0] == ord('[')) & (heads[:, TIMESTAMP_LENGTH + 1] == ord(']'))
+    stamps = np.ascontiguousarray(heads[valid, 1:TIMESTAMP_LENGTH + 1]).view(f'S{TIMESTAMP_LENGTH}').ravel()
+    times = np.full(len(starts), previous, dtype=np.int64)
+    try:
+        times[valid] = stamps.astype('datetime64[s]').astype(np.int64)
+    except ValueError:
+        # A malformed timestamp somewhere; parse them one at a time and skip the bad ones
+        for i, stamp in zip(np.flatnonzero(valid), stamps):
+            try:
+                times[i] = parse_time(stamp.decode())
+            except ValueError:
+                valid[i] = False
+    # Carry the last valid time forward over lines without one
+    last = np.maximum.accumulate(np.where(valid, np.arange(len(starts)), -1))
+    return np.where(last >= 0, times[np.maximum(last, 0)], previous)
+
+def match_lines(patterns, data, start, end, starts, first_line):
+    """Line numbers and matches of every match of `patterns` in data[start:end]."""
+    matches = [match for pattern in patterns for match in pattern.finditer(data, start, end)]
+    positions = np.fromiter((match.start() for match in matches), dtype=np.int64, count=len(matches))
+    return np.searchsorted(starts, positions, side='right') - 1 + first_line, matches
+
+def parse(log_file, start, first_line, previous_time):
+    """Index the lines of `log_file` from byte `start`; returns the new arrays and the indexed size."""
+    with open(log_file, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= start:
+            return None, start
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            end = mapped.rfind(b'\n', start) + 1  # A partial last line is left for the next update
+            if end <= start:
+                return None, start
+            data = np.frombuffer(mapped, dtype=np.uint8)
+            try:
+                starts = line_starts(data, start, end)
+                times = line_times(data, starts, previous_time)
+
+                tx_lines, matches = match_lines(TX_PATTERNS, mapped, start, end, starts, first_line)
+                tx_hashes = np.fromiter((tx_hash(match.group(1)) for match in matches),
+                                        dtype=np.uint64, count=len(matches))
+                error_lines, _ = match_lines(ERROR_PATTERNS, mapped, start, end, starts, first_line)
+                error_lines = np.unique(error_lines)
+            finally:
+                del data  # The map cannot close while numpy holds a view of it
+    return {'lines': starts, 'times': times, 'tx_hashes': tx_hashes, 'tx_lines': tx_lines,
+            'error_lines': error_lines}, end
+
+def load_index(log_file, mmap_mode='r'):
+    """The saved index arrays and metadata of `log_file`, or (None, None) if it has none."""
+    prefix = index_prefix(log_file)
+    try:
+        with open(f'{prefix}.json', 'r') as f:
+            meta = json.load(f)
+        if meta.get('version') != INDEX_VERSION:
+            return None, None
+        return {name: np.load(f'{prefix}.{name}.npy', mmap_mode=mmap_mode) for name in ARRAYS}, meta
+    except (OSError, ValueError):
+        return None, None
+
+def save_index(log_file, arrays, meta):
+    prefix = index_prefix(log_file)
+    os.makedirs(os.path.dirname(prefix), exist_ok=True)
+    if os.path.exists(f'{prefix}.json'):
+        os.remove(f'{prefix}.json')
+    for name in ARRAYS:
+        np.save(f'{prefix}.{name}.npy', arrays[name])
+    # The metadata is written last, so an interrupted update is redone rather than trusted
+    with open(f'{prefix}.json', 'w') as f:
+        json.dump(meta, f)
+
+def index_file(log_file, rebuild=False):
+    """Bring the index of one log up to date. Runs in a worker process; returns its metadata."""
+    start_time = time.perf_counter()
+    old, meta = (None, None) if rebuild else load_index(log_file, mmap_mode=None)
+    size = os.path.getsize(log_file)
+    if old is not None and meta['size'] > size:
+        old = None  # The log was truncated or replaced
+    if old is not None and meta['size'] == size:
+        return dict(meta, seconds=0.0, parsed=0)
+
+    start = meta['size'] if old is not None else 0
+    first_line = len(old['lines']) if old is not None else 0
+    previous_time = int(old['times'][-1]) if old is not None and len(old['times']) else 0
+    new, end = parse(log_file, start, first_line, previous_time)
+    if new is None:
+        # Nothing but a partial line to add
+        if old is None:
+            meta = save_empty(log_file)
+        return dict(meta, seconds=0.0, parsed=0)
+
+    # Time order of the lines and errors; logs are written in time order, so this sort is cheap
+    if old is not None:
+        # Times of the old lines in line order, so they can be merged with the new ones
+        old_times = np.empty(len(old['lines']), dtype=np.int64)
+        old_times[old['time_lines']] = old['times']
+        times = np.concatenate([old_times, new['times']])
+        lines = np.concatenate([old['lines'], new['lines']])
+        error_lines = np.concatenate([old['error_lines'], new['error_lines']])
+        tx_hashes = np.concatenate([old['tx_hashes'], new['tx_hashes']])
+        tx_lines = np.concatenate([old['tx_lines'], new['tx_lines']])
+    else:
+        times, lines, error_lines = new['times'], new['lines'], new['error_lines']
+        tx_hashes, tx_lines = new['tx_hashes'], new['tx_lines']
+
+    time_lines = np.argsort(times, kind='stable')
+    error_lines = error_lines[np.argsort(times[error_lines], kind='stable')]
+    tx_order = np.argsort(tx_hashes, kind='stable')
+    arrays = {
+        'lines': lines,
+        'times': times[time_lines],
+        'time_lines': time_lines,
+        'tx_hashes': tx_hashes[tx_order],
+        'tx_lines': tx_lines[tx_order],
+        'error_times': times[error_lines],
+        'error_lines': error_lines,
+    }
+    meta = {'version': INDEX_VERSION, 'log': os.path.basename(log_file), 'size': end, 'lines': len(lines),
+            'tx_entries': len(tx_hashes), 'errors': len(error_lines)}
+    save_index(log_file, arrays, meta)
+    return dict(meta, seconds=time.perf_counter() - start_time, parsed=end - start)
+
+def save_empty(log_file):
+    empty = {name: np.empty(0, dtype=np.uint64 if name == 'tx_hashes' else np.int64) for name in ARRAYS}
+    meta = {'version': INDEX_VERSION, 'log': os.path.basename(log_file), 'size': 0, 'lines': 0, 'tx_entries': 0, 'errors': 0}
+    save_index(log_file, empty, meta)
+    return meta
+
+def has_logs(directory):
+    return any(name.endswith(LOG_SUFFIX) for name in os.listdir(directory))
+
+def log_files(runs, node=None):
+    return [os.path.join(run, name) for run in runs for name in sorted(os.listdir(run))
+            if name.endswith(LOG_SUFFIX) and (node is None or name == f'{node}{LOG_SUFFIX}')]
+
+def build(files, workers, rebuild=False):
+    """Index `files` in parallel, one file per worker process. Returns their metadata in order."""
+    if workers <= 1 or len(files) <= 1:
+        return [index_file(log_file, rebuild) for log_file in files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(index_file, files, [rebuild] * len(files)))
+
+class LogReader:
+    """Reads indexed lines of one log through a memory map."""
+
+    def __init__(self, log_file):
+        self.log_file = log_file
+        self.arrays, self.meta = load_index(log_file)
+        self.file = open(log_file, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.meta['size'] else None
+
+    def line(self, number):
+        start = int(self.arrays['lines'][number])
+        end = self.map.find(b'\n', start, self.meta['size'])
+        return self.map[start:end if end >= 0 else self.meta['size']].decode(errors='replace')
+
+    def tx_lines(self, transaction_id):
+        hashes = self.arrays['tx_hashes']
+        key = np.uint64(tx_hash(transaction_id))
+        low, high = np.searchsorted(hashes, key, 'left'), np.searchsorted(hashes, key, 'right')
+        return np.unique(self.arrays['tx_lines'][low:high])
+
+    def time_range(self, times, lines, since, until):
+        low = np.searchsorted(times, since, 'left') if since is not None else 0
+        high = np.searchsorted(times, until, 'right') if until is not None else len(times)
+        return lines[low:high]
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+def query(files, args):
+    """Matching (time, run, node, line) rows across `files`, in time order."""
+    since = parse_time(args.since) if args.since else None
+    until = parse_time(args.until) if args.until else None
+    rows = []
+    for log_file in files:
+        reader = LogReader(log_file)
+        try:
+            arrays = reader.arrays
+            if args.tx:
+                numbers = reader.tx_lines(args.tx)
+            elif args.errors:
+                numbers = reader.time_range(arrays['error_times'], arrays['error_lines'], since, until)
+            else:
+                numbers = reader.time_range(arrays['times'], arrays['time_lines'], since, until)
+            for number in sorted(int(number) for number in numbers):
+                text = reader.line(number)
+                if args.tx and not re.search(rf'(?<![\w-]){re.escape(args.tx)}(?![\w-])', text):
+                    continue  # Another transaction with the same hash
+                rows.append((text[1:1 + TIMESTAMP_LENGTH], os.path.dirname(log_file), node_name(log_file), number, text))
+        finally:
+            reader.close()
+    rows.sort(key=lambda row: (row[0], row[1], row[2], row[3]))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Index node transfer logs and query them by transaction or time.')
+    parser.add_argument('runs', nargs='+', help='Logs directories, or directories of runs')
+    parser.add_argument('--tx', help='Show every line mentioning this transaction id')
+    parser.add_argument('--errors', action='store_true', help='Show errors, drops and failed transfers')
+    parser.add_argument('--since', help="Only lines at or after this time, 'YYYY-MM-DD HH:MM:SS'")
+    parser.add_argument('--until', help='Only lines at or before this time')
+    parser.add_argument('--node', help="Only this node's log, e.g. 'hv1' or 'z1_v1'")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes indexing logs')
+    parser.add_argument('--rebuild', action='store_true', help='Index every log from scratch')
+    args = parser.parse_args()
+
+    runs = find_runs(args.runs, is_run=has_logs)
+    files = log_files(runs, args.node)
+    if not files:
+        print('No transfer logs found.')
+        sys.exit(1)
+
+    start = time.perf_counter()
+    metas = build(files, args.workers, args.rebuild)
+    build_seconds = time.perf_counter() - start
+    parsed = sum(meta['parsed'] for meta in metas)
+
+    if not (args.tx or args.errors or args.since or args.until):
+        print(f"{'log':>40} {'lines':>10} {'tx entries':>11} {'errors':>8} {'MB':>8}")
+        for log_file, meta in zip(files, metas):
+            print(f"{os.path.relpath(log_file):>40} {meta['lines']:>10} {meta['tx_entries']:>11} {meta['errors']:>8} "
+                  f"{meta['size'] / 2 ** 20:>8.1f}")
+        print(f"Indexed {parsed / 2 ** 20:.1f} MB of new log lines in {build_seconds:.2f}s with {args.workers} workers")
+        return
+
+    start = time.perf_counter()
+    rows = query(files, args)
+    query_seconds = time.perf_counter() - start
+    many_runs = len(runs) > 1
+    for _, run, node, _, text in rows:
+        print(f"{os.path.relpath(run) + ' ' if many_runs else ''}{node:>8} {text}")
+    print(f"{len(rows)} lines from {len(files)} logs in {query_seconds * 1000:.1f} ms"
+          f"{f' (indexed {parsed / 2 ** 20:.1f} MB in {build_seconds:.2f}s)' if parsed else ''}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
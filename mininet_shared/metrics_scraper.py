@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+"""
+Periodically scrape the metrics endpoint of every node and store the samples
+as a time series next to the run results.
+
+Usage: python3 metrics_scraper.py [--interval SECONDS] [--duration SECONDS] [--output FILE]
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import signal
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from relayer_set import relayer_addresses, relayer_name
+from run_config import RunConfig
+
+# 'name{labels} value' or 'name value'
+SAMPLE_PATTERN = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)$')
+
+def load_targets(shared_dir, config_file, relayers=1):
+    """Return (node name, IP) pairs for the controller, the hub and every zone validator and relayer."""
+    with open(os.path.join(shared_dir, config_file), 'r') as f:
+        zone_configs = json.load(f)
+
+    # The scraper runs on the controller host, which reaches the hub over its hub network interface
+    targets = [('controller', '127.0.0.1'), ('hv1', '10.0.0.1')]
+    for zone_config in zone_configs:
+        zone_id = zone_config['id']
+        targets.append((f'{zone_id}_v1', zone_config['validator_ip']))
+        for index in range(max(1, relayers)):
+            _, zone_ip = relayer_addresses(zone_config['index'] + 1, index)  # Relayer's zone-side IP
+            targets.append((relayer_name(zone_id, index), zone_ip))
+    return targets
+
+def parse_metrics(text):
+    samples = []
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        match = SAMPLE_PATTERN.match(line)
+        if match:
+            name, labels, value = match.groups()
+            samples.append((name, labels[1:-1] if labels else '', value))
+    return samples
+
+def scrape(ip, port, timeout):
+    with urllib.request.urlopen(f'http://{ip}:{port}/metrics', timeout=timeout) as response:
+        return parse_metrics(response.read().decode())
+
+def stop(signum, frame):
+    raise KeyboardInterrupt
+
+def main():
+    parser = argparse.ArgumentParser(description='Scrape node metrics into a time series CSV.')
+    parser.add_argument('--interval', type=float, default=1.0, help='Seconds between scrapes')
+    parser.add_argument('--duration', type=float, default=0, help='Stop after this many seconds (0 runs until killed)')
+    parser.add_argument('--output', help='Time series CSV (default: metrics_timeseries.csv in the logs directory)')
+    RunConfig.add_arguments(parser)
+    args = parser.parse_args()
+    config = RunConfig.load(args=args)
+    args.output = args.output or os.path.join(config.logs_dir, 'metrics_timeseries.csv')
+
+    # Stop cleanly when the topology script kills the scraper at the end of the run
+    signal.signal(signal.SIGTERM, stop)
+
+    port = config.metrics_port
+    targets = load_targets(config.shared_dir, config.zone_config_file, config.relayers_per_zone)
+    print(f"Scraping {len(targets)} targets every {args.interval}s into {args.output}")
+
+    file_is_empty = not os.path.exists(args.output) or os.path.getsize(args.output) == 0
+    end_time = time.time() + args.duration if args.duration else None
+    errors = {}
+
+    with open(args.output, 'a', newline='') as f, ThreadPoolExecutor(max_workers=16) as pool:
+        writer = csv.writer(f)
+        if file_is_empty:
+            writer.writerow(['timestamp', 'node', 'metric', 'labels', 'value'])
+        try:
+            next_scrape = time.time()
+            while end_time is None or time.time() < end_time:
+                timestamp = time.time()
+                futures = [(name, pool.submit(scrape, ip, port, args.interval)) for name, ip in targets]
+                for name, future in futures:
+                    try:
+                        for metric, labels, value in future.result():
+                            writer.writerow([f'{timestamp:.3f}', name, metric, labels, value])
+                    except Exception as e:
+                        # Nodes may not be up yet or may have crashed; report each target once
+                        if name not in errors:
+                            print(f"Error scraping {name}: {e}", file=sys.stderr)
+                        errors[name] = errors.get(name, 0) + 1
+                f.flush()
+
+                next_scrape += args.interval
+                time.sleep(max(0.0, next_scrape - time.time()))
+        except KeyboardInterrupt:
+            pass
+
+    if errors:
+        print(f"Failed scrapes per node: {errors}")
+
+if __name__ == '__main__':
+    main()
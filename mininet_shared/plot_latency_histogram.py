@@ -3,10 +3,13 @@
 import matplotlib
 matplotlib.use('Agg')  # Use the Agg backend for non-GUI environments
 import csv
+import os
 import matplotlib.pyplot as plt
+from run_config import RunConfig
 
 def main():
-    latency_csv_file = '/home/ubuntu/mn_blockchain/cosmos_complex/mininet_shared/logs/latency_results.csv'
+    config = RunConfig.from_args('Plot transfer latencies of the last run.')
+    latency_csv_file = os.path.join(config.logs_dir, 'latency_results.csv')
 
     latencies = []
 
@@ -29,7 +32,7 @@ def main():
         plt.title('Transaction Latency Distribution')
         plt.grid(True)
         plt.tight_layout()
-        plt.savefig('/home/ubuntu/mn_blockchain/cosmos_complex/mininet_shared/logs/latency_distribution_histogram.png')
+        plt.savefig(os.path.join(config.logs_dir, 'latency_distribution_histogram.png'))
         print("Plot saved as 'latency_distribution.png' in the logs directory.")
     except FileNotFoundError:
         print(f"File '{latency_csv_file}' not found. Please ensure the file exists and contains data.")
@@ -3,12 +3,15 @@
 import matplotlib
 matplotlib.use('Agg')  # Use Agg backend for non-GUI environments
 import csv
+import os
 import matplotlib.pyplot as plt
 import numpy as np
 from scipy.interpolate import make_interp_spline, BSpline
+from run_config import RunConfig
 
 def main():
-    latency_csv_file = '/home/ubuntu/mn_blockchain/cosmos_complex/mininet_shared/logs/latency_results.csv'
+    config = RunConfig.from_args('Plot transfer latencies of the last run.')
+    latency_csv_file = os.path.join(config.logs_dir, 'latency_results.csv')
 
     try:
         transaction_ids = []
@@ -52,7 +55,7 @@ def main():
         plt.legend()
         plt.grid(True)
         plt.tight_layout()
-        plt.savefig('/home/ubuntu/mn_blockchain/cosmos_complex/mininet_shared/logs/latency_line_plot.png')
+        plt.savefig(os.path.join(config.logs_dir, 'latency_line_plot.png'))
         print("Plot saved as 'latency_line_plot.png' in the logs directory.")
 
     except FileNotFoundError:
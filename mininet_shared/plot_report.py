@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+"""
+Render a multi-panel latency report for one run, or compare several runs.
+
+Runs are read column by column into numpy arrays and cached as
+latency_results.npz next to the CSV, so replotting a run with millions of
+transfers does not parse the CSV again. Every panel is reduced before it is
+drawn: latency over time is a 2D histogram with per-bucket percentiles, the
+CDF is sampled at fixed quantiles, the heatmap shows the median latency per
+zone pair and rates are counted per second. Rendering time therefore depends
+on the number of buckets, not on the number of transfers.
+
+Usage: python3 plot_report.py [logs_dir ...] [--labels NAME ...] [--output FILE] [--buckets N]
+"""
+
+import argparse
+import os
+import warnings
+
+import matplotlib
+matplotlib.use('Agg')  # Headless: render straight to file
+import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
+import numpy as np
+
+from run_config import RunConfig
+
+PERCENTILES = (0.5, 0.9, 0.99)
+CDF_POINTS = 2000     # Quantiles drawn per CDF
+LATENCY_BINS = 200    # Latency axis of the 2D histogram
+MAX_ZONE_TICKS = 40   # Label heatmap axes only when they stay readable
+ZONE_DTYPE = 'S32'    # Zone ids are read as bytes, 32 per cell rather than 128 as unicode
+TIME_DTYPE = 'datetime64[us]'
+
+def parse_times(values):
+    # Log timestamps as read by read_columns(), in seconds since the epoch
+    return np.asarray(values, dtype=TIME_DTYPE).astype(np.int64) / 1e6
+
+def read_columns(path, columns):
+    """
+    Read the named columns of a CSV file into numpy arrays; `columns` maps
+    each name to its dtype. Only those columns are parsed, by numpy's C
+    reader, so no Python object is made per cell. Missing columns are empty.
+    """
+    with open(path, 'r') as f:
+        header = f.readline().rstrip('\r\n').split(',')
+    names = [name for name in columns if name in header]
+    arrays = {name: np.empty(0, dtype=dtype) for name, dtype in columns.items()}
+    if names:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)  # A file with only a header has no rows
+            table = np.loadtxt(path, delimiter=',', skiprows=1, usecols=[header.index(name) for name in names],
+                               dtype=[(name, columns[name]) for name in names], ndmin=1, encoding='utf-8')
+        arrays.update((name, table[name]) for name in names)
+    return arrays
+
+def zone_key(zone_id):
+    # z2 before z10
+    return len(zone_id), zone_id
+
+def load_run(logs_dir):
+    """Return a run's transfers as numpy arrays, cached in latency_results.npz."""
+    csv_file = os.path.join(logs_dir, 'latency_results.csv')
+    cache_file = os.path.join(logs_dir, 'latency_results.npz')
+    if os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(csv_file):
+        with np.load(cache_file) as cached:
+            return dict(cached)
+
+    columns = read_columns(csv_file, {'latency': np.float64, 'source_zone': ZONE_DTYPE, 'destination_zone': ZONE_DTYPE,
+                                      'init_time': TIME_DTYPE, 'completion_time': TIME_DTYPE})
+    count = len(columns['latency'])
+
+    # Zones become small integer codes so zone pairs can be grouped with bincount
+    zones, codes = np.unique(np.concatenate([columns['source_zone'], columns['destination_zone']]), return_inverse=True)
+    zones = np.char.decode(zones)
+    order = sorted(range(len(zones)), key=lambda i: zone_key(zones[i]))
+    remap = np.empty(len(zones), dtype=np.int64)
+    remap[order] = np.arange(len(zones))
+    codes = remap[codes]
+
+    run = {
+        'latency': np.ascontiguousarray(columns['latency']),
+        'init_time': parse_times(columns['init_time']),
+        'completion_time': parse_times(columns['completion_time']),
+        'source': codes[:count],
+        'destination': codes[count:],
+        'zones': zones[order],
+    }
+
+    # Send rate counts every transfer, including those that never completed
+    sim_log_file = os.path.join(logs_dir, 'simulation_transactions.csv')
+    if os.path.exists(sim_log_file):
+        run['send_time'] = parse_times(read_columns(sim_log_file, {'timestamp': TIME_DTYPE})['timestamp'])
+    else:
+        run['send_time'] = run['init_time']
+
+    np.savez(cache_file, **run)
+    return run
+
+def group_percentiles(groups, values, num_groups):
+    """Percentiles of `values` per group (NaN for empty groups), using a single sort for all groups."""
+    counts = np.bincount(groups, minlength=num_groups)
+    if not len(values):
+        return {q: np.full(num_groups, np.nan) for q in PERCENTILES}
+    sorted_values = values[np.lexsort((values, groups))]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    result = {}
+    for q in PERCENTILES:
+        index = np.minimum(starts + np.floor(q * np.maximum(counts - 1, 0)).astype(np.int64), len(values) - 1)
+        result[q] = np.where(counts > 0, sorted_values[index], np.nan)
+    return result
+
+def time_buckets(run, buckets):
+    """Bucket edges in seconds since the run started and each transfer's bucket."""
+    start = run['send_time'].min()
+    times = run['init_time'] - start
+    edges = np.linspace(0.0, max(times.max(), 1e-3) * (1 + 1e-9), buckets + 1)
+    return edges, np.clip(np.searchsorted(edges, times, side='right') - 1, 0, buckets - 1)
+
+def pair_medians(run):
+    """Median latency per (source, destination) zone pair as a matrix."""
+    num_zones = len(run['zones'])
+    pairs = run['source'] * num_zones + run['destination']
+    medians = group_percentiles(pairs, run['latency'], num_zones * num_zones)[0.5]
+    return medians.reshape(num_zones, num_zones)
+
+def rates_per_second(run):
+    """Transfers sent and completed in each second since the run started."""
+    start = run['send_time'].min()
+    end = max(run['send_time'].max(), run['completion_time'].max() if len(run['completion_time']) else start)
+    seconds = int(end - start) + 1
+    sent = np.bincount((run['send_time'] - start).astype(np.int64), minlength=seconds)
+    completed = np.bincount((run['completion_time'] - start).astype(np.int64), minlength=seconds)
+    return sent, completed
+
+def cdf(latencies):
+    quantiles = np.linspace(0.0, 1.0, CDF_POINTS)
+    return np.quantile(latencies, quantiles), quantiles
+
+def plot_latency_over_time(ax, run, buckets, label=None, color=None):
+    edges, bucket = time_buckets(run, buckets)
+    percentiles = group_percentiles(bucket, run['latency'], buckets)
+    centers = (edges[:-1] + edges[1:]) / 2
+    if label is None:
+        # Single run: density of every transfer underneath the percentile lines. The latency axis stops
+        # past p99.9 so a handful of stragglers does not squash the bulk of the distribution
+        latency_edges = np.linspace(0.0, np.quantile(run['latency'], 0.999) * 1.5, LATENCY_BINS + 1)
+        density, _, _ = np.histogram2d(centers[bucket], run['latency'], bins=[edges, latency_edges])
+        mesh = ax.pcolormesh(edges, latency_edges, density.T, cmap='Greys', norm=LogNorm(vmin=1), shading='flat')
+        ax.figure.colorbar(mesh, ax=ax, label='Transfers')
+        for q, style in zip(PERCENTILES, ('-', '--', ':')):
+            ax.plot(centers, percentiles[q], style, color='tab:red', label=f'p{q * 100:g}')
+    else:
+        ax.plot(centers, percentiles[0.5], '-', color=color, label=f'{label} p50')
+        ax.plot(centers, percentiles[0.99], '--', color=color, label=f'{label} p99')
+    ax.set_xlabel('Time since first send (seconds)')
+    ax.set_ylabel('Latency (seconds)')
+    ax.set_title('Latency over time')
+    ax.legend(fontsize='small')
+
+def plot_cdf(ax, run, label=None, color=None):
+    x, y = cdf(run['latency'])
+    ax.plot(x, y, color=color, label=label)
+    if x[0] > 0:
+        ax.set_xscale('log')
+    ax.set_xlabel('Latency (seconds)')
+    ax.set_ylabel('Fraction of transfers')
+    ax.set_title('Latency CDF')
+    ax.grid(True, which='both', alpha=0.3)
+    if label:
+        ax.legend(fontsize='small')
+
+def plot_heatmap(ax, matrix, zones, title, cmap='viridis', symmetric=False):
+    masked = np.ma.masked_invalid(matrix)
+    if symmetric:
+        limit = np.nanmax(np.abs(matrix)) if np.isfinite(matrix).any() else 1.0
+        image = ax.imshow(masked, cmap=cmap, vmin=-limit, vmax=limit)
+    else:
+        image = ax.imshow(masked, cmap=cmap)
+    ax.figure.colorbar(image, ax=ax, label='Seconds')
+    if len(zones) <= MAX_ZONE_TICKS:
+        ax.set_xticks(range(len(zones)))
+        ax.set_xticklabels(zones, rotation=90, fontsize='x-small')
+        ax.set_yticks(range(len(zones)))
+        ax.set_yticklabels(zones, fontsize='x-small')
+    ax.set_xlabel('Destination zone')
+    ax.set_ylabel('Source zone')
+    ax.set_title(title)
+
+def plot_rates(ax, run, label=None, color=None):
+    sent, completed = rates_per_second(run)
+    seconds = np.arange(len(sent))
+    prefix = f'{label} ' if label else ''
+    ax.plot(seconds, sent, '--', color=color or 'tab:blue', label=f'{prefix}send rate')
+    ax.plot(seconds, completed, '-', color=color or 'tab:green', label=f'{prefix}throughput')
+    ax.set_xlabel('Time since first send (seconds)')
+    ax.set_ylabel('Transfers per second')
+    ax.set_title('Send rate vs. throughput')
+    ax.legend(fontsize='small')
+
+def difference_matrix(first, last):
+    """Median latency per zone pair of `last` minus `first`, over the zones both runs have."""
+    zones = sorted(set(first['zones']) & set(last['zones']), key=zone_key)
+    first_index = [list(first['zones']).index(zone) for zone in zones]
+    last_index = [list(last['zones']).index(zone) for zone in zones]
+    first_medians = pair_medians(first)[np.ix_(first_index, first_index)]
+    last_medians = pair_medians(last)[np.ix_(last_index, last_index)]
+    return last_medians - first_medians, zones
+
+def run_label(logs_dir):
+    # Runs are usually '<name>/logs'; label them by <name>
+    path = os.path.normpath(logs_dir)
+    if os.path.basename(path) == 'logs':
+        path = os.path.dirname(path)
+    return os.path.basename(path)
+
+def summarise(label, run):
+    latencies = run['latency']
+    if not len(latencies):
+        return f"{label}: no completed transfers"
+    p50, p90, p99 = np.quantile(latencies, PERCENTILES)
+    return (f"{label}: {len(run['send_time'])} sent, {len(latencies)} completed, "
+            f"p50 {p50:.3f}s, p90 {p90:.3f}s, p99 {p99:.3f}s, max {latencies.max():.3f}s")
+
+def render(runs, labels, output, buckets):
+    fig, axes = plt.subplots(2, 2, figsize=(16, 11))
+    if len(runs) == 1:
+        run = runs[0]
+        plot_latency_over_time(axes[0, 0], run, buckets)
+        plot_cdf(axes[0, 1], run)
+        plot_heatmap(axes[1, 0], pair_medians(run), list(run['zones']), 'Median latency per zone pair')
+        plot_rates(axes[1, 1], run)
+        fig.suptitle(labels[0])
+    else:
+        colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+        for i, (run, label) in enumerate(zip(runs, labels)):
+            color = colors[i % len(colors)]
+            plot_latency_over_time(axes[0, 0], run, buckets, label, color)
+            plot_cdf(axes[0, 1], run, label, color)
+            plot_rates(axes[1, 1], run, label, color)
+        matrix, zones = difference_matrix(runs[0], runs[-1])
+        plot_heatmap(axes[1, 0], matrix, zones, f'Median latency change, {labels[-1]} vs. {labels[0]}',
+                     cmap='RdBu_r', symmetric=True)
+        fig.suptitle(' vs. '.join(labels))
+    fig.tight_layout()
+    fig.savefig(output, dpi=120)
+    plt.close(fig)
+
+def main():
+    parser = argparse.ArgumentParser(description='Plot a latency report for one run or a comparison of runs.')
+    parser.add_argument('runs', nargs='*', help='Logs directories of the runs (default: the configured logs directory)')
+    parser.add_argument('--labels', nargs='+', help='Name of each run in the legend')
+    parser.add_argument('--output', help='Image to write (default: latency_report.png in the logs directory, '
+                                         'comparison_report.png in the shared directory when comparing)')
+    parser.add_argument('--buckets', type=int, default=300, help='Time buckets for the latency-over-time panel')
+    RunConfig.add_arguments(parser)
+    args = parser.parse_args()
+    config = RunConfig.load(args=args)
+
+    logs_dirs = args.runs or [config.logs_dir]
+    labels = args.labels or [run_label(logs_dir) for logs_dir in logs_dirs]
+    if len(labels) != len(logs_dirs):
+        parser.error('--labels needs one name per run')
+    if args.output:
+        output = args.output
+    elif len(logs_dirs) == 1:
+        output = os.path.join(logs_dirs[0], 'latency_report.png')
+    else:
+        output = config.shared_path('comparison_report.png')
+
+    runs, plotted_labels = [], []
+    for logs_dir, label in zip(logs_dirs, labels):
+        if not os.path.exists(os.path.join(logs_dir, 'latency_results.csv')):
+            print(f"Skipping {label}: no latency_results.csv in {logs_dir} (run calculate_latency.py first)")
+            continue
+        run = load_run(logs_dir)
+        print(summarise(label, run))
+        if not len(run['latency']):
+            continue
+        runs.append(run)
+        plotted_labels.append(label)
+    if not runs:
+        return
+
+    render(runs, plotted_labels, output, args.buckets)
+    print(f"Report written to {output}")
+
+if __name__ == '__main__':
+    main()
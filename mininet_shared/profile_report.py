@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+"""
+Merge the per-node profiles written with --profile 1 (or IBC_SIM_PROFILE=1) into one hot-spot report.
+
+Functions are ranked by CPU samples where they were the innermost frame (self)
+and by samples where they were anywhere on the stack (total). Nodes are grouped
+by role (hub, zone, relayer) so hot spots shared by all zones add up. The
+report is printed and written to profile_report.txt in the profile directory,
+and the merged stacks are written in collapsed format for flame graph tools.
+
+Usage: python3 profile_report.py [profile_dir] [--top N]
+"""
+
+import argparse
+import glob
+import json
+import os
+
+from run_config import RunConfig
+
+def node_role(node_name):
+    if node_name.startswith('hv'):
+        return 'hub'
+    if node_name.startswith('r'):
+        return 'relayer'
+    return 'zone'
+
+def merge_counts(target, counts):
+    for key, value in counts.items():
+        target[key] = target.get(key, 0) + value
+
+def load_profiles(profile_dir):
+    roles = {}
+    for profile_file in sorted(glob.glob(os.path.join(profile_dir, '*.profile.json'))):
+        with open(profile_file, 'r') as f:
+            profile = json.load(f)
+        role = roles.setdefault(node_role(profile['node']), {
+            'nodes': [], 'samples': 0, 'self_samples': {}, 'total_samples': {}, 'stacks': {}, 'timers': {},
+        })
+        role['nodes'].append(profile['node'])
+        role['samples'] += profile['samples']
+        merge_counts(role['self_samples'], profile['self_samples'])
+        merge_counts(role['total_samples'], profile['total_samples'])
+        merge_counts(role['stacks'], profile['stacks'])
+        for name, timer in profile['timers'].items():
+            merged = role['timers'].setdefault(name, {'calls': 0, 'total': 0.0, 'max': 0.0})
+            merged['calls'] += timer['calls']
+            merged['total'] += timer['total']
+            merged['max'] = max(merged['max'], timer['max'])
+    return roles
+
+def format_role(role_name, role, top):
+    samples = role['samples'] or 1
+    lines = [f"=== {role_name}: {len(role['nodes'])} nodes, {role['samples']} CPU samples ===", '',
+             f"Top {top} functions by self time:"]
+    for function, count in sorted(role['self_samples'].items(), key=lambda item: -item[1])[:top]:
+        lines.append(f"  {count / samples * 100:6.2f}%  {count:8d}  {function}")
+
+    lines += ['', f"Top {top} functions by total time:"]
+    for function, count in sorted(role['total_samples'].items(), key=lambda item: -item[1])[:top]:
+        lines.append(f"  {count / samples * 100:6.2f}%  {count:8d}  {function}")
+
+    if role['timers']:
+        lines += ['', "Timed hot paths (wall clock):",
+                  f"  {'function':<40} {'calls':>10} {'total (s)':>12} {'avg (ms)':>10} {'max (ms)':>10}"]
+        for name, timer in sorted(role['timers'].items(), key=lambda item: -item[1]['total']):
+            avg = timer['total'] / timer['calls'] * 1000 if timer['calls'] else 0.0
+            lines.append(f"  {name:<40} {timer['calls']:>10} {timer['total']:>12.3f} {avg:>10.3f} {timer['max'] * 1000:>10.3f}")
+    lines.append('')
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge node profiles into a hot-spot report.')
+    # Not dest='profile_dir': an absent positional would overwrite --profile-dir with None
+    parser.add_argument('directory', nargs='?', metavar='profile_dir',
+                        help='Directory to read (default: profiles in the logs directory)')
+    parser.add_argument('--top', type=int, default=20, help='Number of functions to list per ranking')
+    RunConfig.add_arguments(parser)
+    args = parser.parse_args()
+    args.profile_dir = args.directory or RunConfig.load(args=args).profile_dir
+
+    roles = load_profiles(args.profile_dir)
+    if not roles:
+        print(f"No profiles found in {args.profile_dir}")
+        return
+
+    lines = []
+    for role_name in ('hub', 'relayer', 'zone'):
+        if role_name in roles:
+            lines.extend(format_role(role_name, roles[role_name], args.top))
+            with open(os.path.join(args.profile_dir, f'{role_name}.folded'), 'w') as f:
+                for stack, count in sorted(roles[role_name]['stacks'].items()):
+                    f.write(f"{stack} {count}\n")
+
+    report = '\n'.join(lines)
+    print(report)
+    with open(os.path.join(args.profile_dir, 'profile_report.txt'), 'w') as f:
+        f.write(report + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+class Profiler:
+    """
+    Opt-in profiler for a node process.
+
+    A background thread samples the Python stack of every thread every
+    `interval` seconds. Only threads that used CPU since the previous sample are
+    counted, so threads blocked in accept(), recv() or sleep() do not drown out
+    the real hot spots. Methods passed to `instrument` are additionally wrapped
+    with timers that record call counts and wall-clock time per call.
+
+    The profile is rewritten to '<profile_dir>/<node>.profile.json' every
+    `flush_interval` seconds, since nodes are killed rather than shut down.
+    """
+
+    def __init__(self, node_name, profile_dir, interval=0.005, flush_interval=10.0, log=print):
+        self.node_name = node_name
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.log = log
+        os.makedirs(profile_dir, exist_ok=True)
+        self.profile_file = os.path.join(profile_dir, f'{node_name}.profile.json')
+        self.lock = threading.Lock()
+        self.started = None
+
+        self.samples = 0
+        self.self_samples = {}   # Function -> samples where it was the innermost frame
+        self.total_samples = {}  # Function -> samples where it was anywhere on the stack
+        self.stacks = {}         # Collapsed stack ('outer;...;inner') -> samples
+        self.timers = {}         # Timer name -> [calls, total seconds, max seconds]
+
+    @classmethod
+    def from_config(cls, config, node_name, log=print):
+        # Profiling is opt-in; returns None when disabled
+        if not config.profile:
+            return None
+        return cls(node_name, config.profile_dir, interval=config.profile_interval, log=log)
+
+    def start(self):
+        self.started = time.time()
+        threading.Thread(target=self.sample_loop, daemon=True).start()
+        threading.Thread(target=self.flush_loop, daemon=True).start()
+        self.log(f"Profiling enabled: sampling every {self.interval * 1000:.1f} ms into {self.profile_file}")
+
+    def instrument(self, obj, method_names):
+        """Replace the named methods of `obj` with timed wrappers."""
+        for name in method_names:
+            setattr(obj, name, self.timed(f'{type(obj).__name__}.{name}', getattr(obj, name)))
+
+    def timed(self, name, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return wrapper
+
+    def record(self, name, elapsed):
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = [0, 0.0, 0.0]
+            timer[0] += 1
+            timer[1] += elapsed
+            if elapsed > timer[2]:
+                timer[2] = elapsed
+
+    def thread_cpu_time(self, thread_id):
+        try:
+            return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+        except (AttributeError, OSError):
+            return None  # Not supported here: count every sample (wall-clock profile)
+
+    def sample_loop(self):
+        own_id = threading.get_ident()
+        last_cpu = {}
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id:
+                        continue
+                    cpu = self.thread_cpu_time(thread_id)
+                    if cpu is not None:
+                        previous = last_cpu.get(thread_id)
+                        last_cpu[thread_id] = cpu
+                        if previous is None or cpu <= previous:
+                            continue  # Idle since the last sample
+                    self.add_sample(frame)
+
+    def add_sample(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        stack.reverse()
+
+        self.samples += 1
+        self.self_samples[stack[-1]] = self.self_samples.get(stack[-1], 0) + 1
+        for function in set(stack):
+            self.total_samples[function] = self.total_samples.get(function, 0) + 1
+        collapsed = ';'.join(stack)
+        self.stacks[collapsed] = self.stacks.get(collapsed, 0) + 1
+
+    def flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            profile = {
+                'node': self.node_name,
+                'interval': self.interval,
+                'duration': time.time() - self.started,
+                'samples': self.samples,
+                'self_samples': dict(self.self_samples),
+                'total_samples': dict(self.total_samples),
+                'stacks': dict(self.stacks),
+                'timers': {name: {'calls': calls, 'total': total, 'max': longest}
+                           for name, (calls, total, longest) in self.timers.items()},
+            }
+        tmp_file = self.profile_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(profile, f)
+        os.replace(tmp_file, self.profile_file)
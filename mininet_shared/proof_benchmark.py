@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+"""
+Measure the cost of each part of commitment proofs on one core.
+
+For every block size, a block of RECV_PACKET messages is committed the way a
+node does with --commitment-proofs 1 and received the way its counterparty
+does, timing each part on its own:
+
+  tree     building the commitment tree of the block
+  prove    generating the proofs of its messages
+  header   verifying the block header
+  single   verifying each proof in a batch of its own
+  batch    verifying all proofs of the block in one batch
+  cached   verifying them again, answered by the verification cache
+
+Times are microseconds per message (per block for the header), the best of
+--repeat runs.
+
+Usage: python3 proof_benchmark.py [--blocks 10 100 1000 5000] [--repeat 5]
+"""
+
+import argparse
+import gc
+import time
+
+from commitment import CommitmentProver, CommitmentTree, ProofVerifier
+from ibc_packet import Packet, decode_header
+
+PARTS = ['tree', 'prove', 'header', 'single', 'batch', 'cached']
+
+def block_messages(size):
+    return [Packet(sequence, 'channel-0', 'channel-0', 1, 'z1', 'z1_v1', 'z2', str(sequence),
+                   time.time() + 600, 1).encode() for sequence in range(1, size + 1)]
+
+def timed(fn):
+    gc.collect()  # So a collection of the previous part's garbage is not timed
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+def measure_once(messages):
+    size = len(messages)
+    prover = CommitmentProver('z1')
+    seconds = {}
+    seconds['tree'], tree = timed(lambda: CommitmentTree(messages))
+    proofs = [tree.proof(i) for i in range(size)]
+    seconds['prove'], (header, proved) = timed(lambda: prover.prove_block(1, messages))
+    seconds['prove'] = max(0.0, seconds['prove'] - seconds['tree'])  # prove_block builds the tree too
+
+    items = [('z1', 1, message, proof) for message, proof in zip(messages, proofs)]
+    verifier = ProofVerifier(cache_size=size)
+    seconds['header'], _ = timed(lambda: verifier.verify_header(*decode_header(header)))
+    single = ProofVerifier(cache_size=0)
+    single.roots = verifier.roots
+    seconds['single'], single_results = timed(lambda: [single.verify_batch([item]) for item in items])
+    seconds['batch'], results = timed(lambda: verifier.verify_batch(items))
+    seconds['cached'], _ = timed(lambda: verifier.verify_batch(items))
+    if not all(results) or not all(result == [True] for result in single_results):
+        raise RuntimeError('Proof verification failed')
+    return seconds
+
+def measure(size, repeat):
+    messages = block_messages(size)
+    best = {}
+    for _ in range(repeat):
+        for part, seconds in measure_once(messages).items():
+            best[part] = min(best.get(part, seconds), seconds)
+    return {part: best[part] * 1e6 / (1 if part == 'header' else size) for part in PARTS}
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the cost of each part of commitment proofs.')
+    parser.add_argument('--blocks', type=int, nargs='+', default=[10, 100, 1000, 5000],
+                        help='Messages per block to measure')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Also write the results to this CSV file')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'messages':>8} " + ' '.join(f"{part + ' us':>10}" for part in PARTS) + f" {'batch gain':>10}")
+    for size in args.blocks:
+        result = measure(size, args.repeat)
+        result['messages'] = size
+        results.append(result)
+        gain = result['single'] / result['batch'] if result['batch'] else 0.0
+        print(f"{size:>8} " + ' '.join(f"{result[part]:>10.2f}" for part in PARTS) + f" {gain:>9.2f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write('messages,' + ','.join(f'{part}_us' for part in PARTS) + '\n')
+            for result in results:
+                f.write(f"{result['messages']}," + ','.join(f"{result[part]:.3f}" for part in PARTS) + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import sys
+
+from ibc_packet import ACK_ERROR, ACK_SUCCESS
+
+EXPIRED = 'expired'  # Receipt of a sequence below the window: it cannot be told whether it was received
+
+class SequenceWindow:
+    """
+    Receipts of the latest `size` sequences of one channel, as two bitmaps.
+
+    Bit j of `received` is set once sequence base + j has been received, and
+    the same bit of `failed` if its acknowledgement was an error. The window
+    ends at the highest sequence received; a higher one slides it forward,
+    and sequences that fall out of it without being received are counted in
+    `skipped`. Anything below the window is EXPIRED, received or not, so the
+    window must be larger than the reordering relayers and packet clearing
+    cause, or late packets are dropped as if they were duplicates.
+    """
+
+    def __init__(self, size, base=1, received=0, failed=0, skipped=0):
+        self.size = size
+        self.base = base          # Sequence of bit 0
+        self.received = received
+        self.failed = failed
+        self.skipped = skipped
+
+    def get(self, sequence):
+        offset = sequence - self.base
+        if offset < 0:
+            return EXPIRED
+        if offset >= self.size or not self.received >> offset & 1:
+            return None
+        return ACK_ERROR if self.failed >> offset & 1 else ACK_SUCCESS
+
+    def set(self, sequence, result):
+        # Returns False if the sequence has already left the window
+        offset = sequence - self.base
+        if offset < 0:
+            return False
+        if offset >= self.size:
+            shift = offset - self.size + 1
+            leaving = self.received & ((1 << min(shift, self.size)) - 1)
+            self.skipped += shift - leaving.bit_count()
+            self.received >>= shift
+            self.failed >>= shift
+            self.base += shift
+            offset -= shift
+        bit = 1 << offset
+        self.received |= bit
+        if result == ACK_ERROR:
+            self.failed |= bit
+        else:
+            self.failed &= ~bit
+        return True
+
+class ReceiptWindows:
+    """
+    Packet receipts kept in one SequenceWindow per channel (--receipt-window N)
+    instead of a dict entry for every packet ever received.
+
+    Supports the get() and item assignment the nodes use on the receipts
+    dict, keyed by (channel, sequence). Only ACK_SUCCESS and ACK_ERROR fit in
+    the bitmaps; any other result, such as the hub's 'pending' while a packet
+    is being forwarded, is held in a dict until the final result replaces it.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.windows = {}  # Channel -> SequenceWindow
+        self.pending = {}  # (channel, sequence) -> result that is not final yet
+
+    @classmethod
+    def from_config(cls, config):
+        # Windows are opt-in; returns None when every receipt is kept
+        if not config.receipt_window:
+            return None
+        return cls(config.receipt_window)
+
+    def window(self, channel_id):
+        window = self.windows.get(channel_id)
+        if window is None:
+            window = self.windows[channel_id] = SequenceWindow(self.size)
+        return window
+
+    def get(self, key):
+        result = self.pending.get(key)
+        if result is not None:
+            return result
+        channel_id, sequence = key
+        window = self.windows.get(channel_id)
+        return window.get(sequence) if window else None
+
+    def __setitem__(self, key, result):
+        channel_id, sequence = key
+        if result in (ACK_SUCCESS, ACK_ERROR):
+            self.pending.pop(key, None)
+        else:
+            self.pending[key] = result
+        # A pending receipt slides the window like any other, so packets behind it are not mistaken for gaps
+        self.window(channel_id).set(sequence, result)
+
+    def memory_bytes(self):
+        return sum(sys.getsizeof(window.received) + sys.getsizeof(window.failed) for window in self.windows.values())
+
+    def skipped(self):
+        return sum(window.skipped for window in self.windows.values())
+
+    def export(self):
+        return {
+            'window': self.size,
+            'channels': {channel_id: [window.base, format(window.received, 'x'), format(window.failed, 'x'), window.skipped]
+                         for channel_id, window in self.windows.items()},
+            'pending': [[channel_id, sequence, result] for (channel_id, sequence), result in self.pending.items()],
+        }
+
+def register_receipt_metrics(registry, receipts):
+    # `receipts` returns the node's current ReceiptWindows, which restoring state replaces
+    registry.gauge('receipt_window_bytes', 'Memory held by the receipt bitmaps', fn=lambda: receipts().memory_bytes())
+    registry.gauge('receipts_skipped_total', 'Sequences that left the receipt window without being received',
+                   fn=lambda: receipts().skipped())
+    registry.gauge('receipts_pending', 'Receipts waiting for a final result', fn=lambda: len(receipts().pending))
+
+def export_receipts(receipts):
+    # A dict of receipts is saved as [channel, sequence, result] entries
+    if isinstance(receipts, ReceiptWindows):
+        return receipts.export()
+    return [[channel_id, sequence, result] for (channel_id, sequence), result in receipts.items()]
+
+def import_receipts(state, window=0):
+    """
+    Receipts saved by export_receipts. Saved windows keep their size; saved
+    dict entries are loaded into windows of `window` sequences, or a dict if 0.
+    """
+    if isinstance(state, dict):
+        receipts = ReceiptWindows(state['window'])
+        for channel_id, (base, received, failed, skipped) in state['channels'].items():
+            receipts.windows[channel_id] = SequenceWindow(state['window'], base, int(received, 16), int(failed, 16), skipped)
+        receipts.pending = {(channel_id, sequence): result for channel_id, sequence, result in state['pending']}
+        return receipts
+    if not window:
+        return {(channel_id, sequence): result for channel_id, sequence, result in state}
+    receipts = ReceiptWindows(window)
+    for channel_id, sequence, result in sorted(state, key=lambda entry: entry[1]):
+        receipts[(channel_id, sequence)] = result
+    return receipts
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+Weigh the latency gained by redundant relayers against the relays they waste.
+
+Each run is a logs directory holding run_config.json, latency_results.csv
+and the metrics_timeseries.csv written by metrics_scraper.py. Runs are
+grouped by --relayers-per-zone and --relayer-mode, and for every group the
+report shows:
+
+  latency     mean, p50 and p99 transfer latency, and their reduction
+              against the runs with one relayer per zone
+  relayed     packets and acknowledgements the relayers delivered, per
+              completed transfer
+  duplicates  deliveries the hub and zone validators dropped or answered
+              again as duplicates, per completed transfer
+  wasted      share of all deliveries that were duplicates
+
+Usage: python3 redundancy_report.py RUNS... [--output FILE]
+"""
+
+import argparse
+import csv
+import json
+import os
+
+from compare_runs import find_runs, logs_run, mean
+
+RELAYED_TYPES = ('RECV_PACKET', 'ACK_PACKET')
+COLUMNS = ['relayers', 'mode', 'runs', 'mean_latency', 'p50_latency', 'p99_latency',
+           'mean_gain', 'p50_gain', 'p99_gain', 'relayed_per_transfer', 'duplicates_per_transfer', 'wasted']
+
+def final_counters(path):
+    """Last sample of every (node, metric, labels) series in a metrics time series."""
+    values = {}
+    with open(path, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            values[(row['node'], row['metric'], row['labels'])] = float(row['value'])
+    return values
+
+def run_costs(logs_dir):
+    """(relayers, mode) and the latency and relay counts of one run."""
+    with open(os.path.join(logs_dir, 'run_config.json'), 'r') as f:
+        config = json.load(f)
+    metrics = logs_run(logs_dir)
+    with open(os.path.join(logs_dir, 'latency_results.csv'), 'r') as f:
+        metrics['transfers'] = max(0, sum(1 for _ in f) - 1)
+
+    relayed = duplicates = 0.0
+    series = os.path.join(logs_dir, 'metrics_timeseries.csv')
+    if os.path.exists(series):
+        for (node, metric, labels), value in final_counters(series).items():
+            if metric == 'relayer_messages_relayed_total' and any(f'type="{t}"' in labels for t in RELAYED_TYPES):
+                relayed += value
+            elif metric == 'duplicate_messages_total':
+                duplicates += value
+    metrics['relayed'] = relayed
+    metrics['duplicates'] = duplicates
+    relayers = max(1, config.get('relayers_per_zone', 1))
+    return (relayers, config.get('relayer_mode', 'race') if relayers > 1 else '-'), metrics
+
+def summarize(groups):
+    rows = []
+    for (relayers, mode), runs in sorted(groups.items()):
+        transfers = sum(run['transfers'] for run in runs)
+        relayed = sum(run['relayed'] for run in runs)
+        duplicates = sum(run['duplicates'] for run in runs)
+        row = {'relayers': relayers, 'mode': mode, 'runs': len(runs)}
+        for metric in ('mean_latency', 'p50_latency', 'p99_latency'):
+            values = [run[metric] for run in runs if metric in run]
+            row[metric] = mean(values) if values else None
+        row['relayed_per_transfer'] = relayed / transfers if transfers else None
+        row['duplicates_per_transfer'] = duplicates / transfers if transfers else None
+        row['wasted'] = duplicates / relayed if relayed else None
+        rows.append(row)
+
+    baseline = next((row for row in rows if row['relayers'] == 1), None)
+    for row in rows:
+        for metric, gain in (('mean_latency', 'mean_gain'), ('p50_latency', 'p50_gain'), ('p99_latency', 'p99_gain')):
+            base = baseline[metric] if baseline else None
+            row[gain] = 1 - row[metric] / base if base and row[metric] is not None else None
+    return rows
+
+def cell(value, fmt):
+    return format(value, fmt) if value is not None else '-'
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare latency gains and wasted relays of redundant relayers.')
+    parser.add_argument('runs', nargs='+', help='Logs directories, or directories of runs')
+    parser.add_argument('--output', help='Also write the table to this CSV file')
+    args = parser.parse_args()
+
+    groups = {}
+    for logs_dir in find_runs(args.runs):
+        key, metrics = run_costs(logs_dir)
+        groups.setdefault(key, []).append(metrics)
+    rows = summarize(groups)
+
+    print(f"{'relayers':>8} {'mode':>5} {'runs':>4} {'mean s':>8} {'p50 s':>8} {'p99 s':>8} {'mean gain':>9} "
+          f"{'p50 gain':>9} {'p99 gain':>9} {'relayed/tx':>10} {'dups/tx':>8} {'wasted':>7}")
+    for row in rows:
+        print(f"{row['relayers']:>8} {row['mode']:>5} {row['runs']:>4} {cell(row['mean_latency'], '8.4f')} "
+              f"{cell(row['p50_latency'], '8.4f')} {cell(row['p99_latency'], '8.4f')} {cell(row['mean_gain'], '9.1%')} "
+              f"{cell(row['p50_gain'], '9.1%')} {cell(row['p99_gain'], '9.1%')} {cell(row['relayed_per_transfer'], '10.2f')} "
+              f"{cell(row['duplicates_per_transfer'], '8.2f')} {cell(row['wasted'], '7.1%')}")
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+if __name__ == '__main__':
+    main()
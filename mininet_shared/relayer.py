@@ -1,45 +1,169 @@
 #!/usr/bin/env python3
 
-import sys
+import argparse
 import threading
 import socket
 import time
 import os
 
+from datetime import datetime
+
+from flow_control import PeerQueue, register_queue_metrics
+from metrics import MetricsRegistry, start_metrics_server
+from profiler import Profiler
+from relayer_set import relayer_addresses
+from tracing import Tracer
+from run_config import RunConfig
+
+from ibc_packet import (RECV_PACKET, UPDATE_CLIENT, BLOCK_HEADER, QUERY_COMMITMENTS, TRACE_SEPARATOR, MessageStream,
+                        encode_client_update, frame_headers, message_height, message_sequence, message_type,
+                        query_messages, recv_messages, send_messages)
+
+class SequenceTracker:
+    """
+    Tracks which packet sequences of one channel have been relayed and which were skipped.
+
+    Relayers sharing a stream (--relayer-mode share) each get the sequences
+    with sequence % stride == offset and only track those; the others'
+    packets are relayed by clearing only once they are stuck.
+    """
+
+    def __init__(self, stride=1, offset=0):
+        self.stride = stride
+        self.offset = offset
+        self.highest = offset - stride if offset else 0  # Highest sequence relayed so far
+        self.missing = set() # Sequences below `highest` that were never seen
+        self.lock = threading.Lock()
+
+    def owns(self, sequence):
+        return sequence % self.stride == self.offset
+
+    def observe(self, sequence):
+        # Record a relayed sequence and return the number of new gaps it reveals
+        if not self.owns(sequence):
+            return 0
+        with self.lock:
+            gaps = 0
+            expected = self.highest + self.stride
+            if sequence > expected:
+                gaps = (sequence - expected) // self.stride
+                self.missing.update(range(expected, sequence, self.stride))
+            self.missing.discard(sequence)
+            self.highest = max(self.highest, sequence)
+            return gaps
+
+    def is_unrelayed(self, sequence):
+        if not self.owns(sequence):
+            return False
+        with self.lock:
+            return sequence > self.highest or sequence in self.missing
+
 class Relayer:
-    def __init__(self, node_name, zone_id):
+    def __init__(self, node_name, zone_id, config=None, index=0):
         self.node_name = node_name
+        self.config = config or RunConfig.load()
         self.zone_id = zone_id
         self.zone_index = int(zone_id[1:])  # Extract index from 'z1', 'z2', etc.
         i = self.zone_index - 1  # Zero-based index to match the indexing in cosmos_topology.py
 
-        # IP addresses for this relayer node
-        self.hub_ip = f'10.0.0.{10 + i}'          # E.g., '10.0.0.10', '10.0.0.11'
-        self.zone_ip = f'10.0.{self.zone_index}.10'  # E.g., '10.0.1.10', '10.0.2.10'
-        self.listen_port = 8000  # Port to listen for IBC packets
+        # IP addresses for this relayer node; with --relayers-per-zone N, `index` is this relayer's place among the zone's
+        self.index = index
+        self.hub_ip, self.zone_ip = relayer_addresses(self.zone_index, index)  # E.g., '10.0.0.10' and '10.0.1.10'
+        self.listen_port = self.config.ibc_port  # Port to listen for IBC packets
 
         # IP addresses to forward messages to
         self.hub_dest_ip = '10.0.0.1'  # Assuming the hub node IP is '10.0.0.1'
         self.zone_dest_ip = f'10.0.{self.zone_index}.1'  # Assuming the zone validator IP is '10.0.{zone_index}.1'
 
+        # Latest heights submitted to the light clients, by destination: the hub's client
+        # of this zone and the zone's client of the hub
+        self.client_heights = {'hub': 0, 'zone': 0}
+        self.forward_locks = {'hub': threading.Lock(), 'zone': threading.Lock()}
+
+        # Pass-through mode (--relayer-passthrough 1): frames are relayed as raw bytes over
+        # long-lived connections and only their headers are read, never decoded as a whole
+        self.passthrough = self.config.relayer_passthrough
+        self.passthrough_buffer_size = 1 << 20
+        self.streams = {}
+
+        # Backpressure (--backpressure 1): listeners hand batches to a bounded queue per destination
+        # and stop reading while it is full. Pass-through mode relies on TCP flow control instead.
+        self.queues = {'hub': None, 'zone': None}
+
+        # Packet clearing: pending commitments are queried periodically and relayed again
+        # if they were never seen (gaps, relayer restarts) or have been stuck for a full interval
+        self.query_port = self.config.query_port
+        self.zone_channel = 'channel-0'  # Zone's channel towards the hub
+        self.hub_channel = f'channel-{i}'  # Hub's channel towards this zone
+        # Packets sent by the zone and by the hub to the zone; sharing relayers each track their own share
+        stride = max(1, self.config.relayers_per_zone) if self.config.relayer_mode == 'share' else 1
+        self.zone_sequences = SequenceTracker(stride, index % stride)
+        self.hub_sequences = SequenceTracker(stride, index % stride)
+        self.pending_since = {}  # (chain, sequence) -> time the commitment was first seen pending
+        self.clear_interval = self.config.relayer_clear_interval
+        self.clear_batch_size = self.config.relayer_clear_batch
+
         # Set up logging
-        self.logs_dir = '/home/ubuntu/IBC_Simulation/mininet_shared/logs'
+        self.logs_dir = self.config.logs_dir
         if not os.path.exists(self.logs_dir):
             os.makedirs(self.logs_dir)
         self.log_file = os.path.join(self.logs_dir, f'{self.node_name}_transfer_log.txt')
+        self.clearing_metrics_file = os.path.join(self.logs_dir, f'{self.node_name}_clearing_metrics.csv')
+        if not os.path.exists(self.clearing_metrics_file):
+            with open(self.clearing_metrics_file, 'w') as f:
+                f.write('timestamp,chain,channel,backlog,gaps,cleared,duration,clearing_rate\n')
+        self.init_metrics()
+        self.tracer = Tracer.from_config(self.config, self.node_name)
         self.log('Relayer initialized.')
 
+        # Optional profiling (--profile 1)
+        self.profiler = Profiler.from_config(self.config, self.node_name, log=self.log)
+        if self.profiler:
+            self.profiler.instrument(self, ['log', 'observe_sequences', 'with_client_update', 'forward_to_hub',
+                                            'forward_to_zone', 'send', 'clear_packets', 'relay_frames'])
+
     def log(self, message):
         timestamp = time.strftime("[%Y-%m-%d %H:%M:%S]")
         with open(self.log_file, 'a') as f:
             f.write(f"{timestamp} {message}\n")
         print(f"{timestamp} {message}")
 
+    def init_metrics(self):
+        self.metrics = MetricsRegistry(self.node_name)
+        self.packets_relayed = self.metrics.counter('relayer_messages_relayed_total', 'Messages relayed, by destination and type')
+        self.bytes_relayed = self.metrics.counter('relayer_bytes_relayed_total', 'Bytes relayed, by destination')
+        self.client_updates = self.metrics.counter('relayer_client_updates_total', 'MsgUpdateClient messages submitted, by destination')
+        self.forward_errors = self.metrics.counter('relayer_forward_errors_total', 'Messages that could not be relayed, by destination')
+        self.relay_time = self.metrics.histogram('relayer_forward_seconds', 'Time to forward one batch, by destination')
+        self.backlog = self.metrics.gauge('relayer_backlog_packets', 'Pending packet commitments at the last clearing pass, by chain')
+        self.gaps = self.metrics.gauge('relayer_sequence_gaps', 'Sequences never seen by this relayer, by chain')
+        self.cleared = self.metrics.counter('relayer_packets_cleared_total', 'Packets relayed by clearing passes, by chain')
+        self.clearing_rate = self.metrics.gauge('relayer_clearing_rate', 'Packets per second cleared in the last clearing pass, by chain')
+        self.queue_delay = register_queue_metrics(self.metrics, self.queues)
+
     def start(self):
-        threading.Thread(target=self.listen_zone, daemon=True).start()
-        threading.Thread(target=self.listen_hub, daemon=True).start()
+        if self.profiler:
+            self.profiler.start()
+        start_metrics_server(self.metrics, self.config.metrics_port, self.log)
+        if self.passthrough:
+            port = self.config.ibc_port
+            self.streams = {'hub': MessageStream(self.hub_dest_ip, port), 'zone': MessageStream(self.zone_dest_ip, port)}
+            threading.Thread(target=self.passthrough_listener, args=(self.zone_ip, 'hub'), daemon=True).start()
+            threading.Thread(target=self.passthrough_listener, args=(self.hub_ip, 'zone'), daemon=True).start()
+        else:
+            self.queues['hub'] = PeerQueue.from_config(self.config, 'hub', self.forward_to_hub,
+                                                       delay_histogram=self.queue_delay, log=self.log)
+            self.queues['zone'] = PeerQueue.from_config(self.config, 'zone', self.forward_to_zone,
+                                                        delay_histogram=self.queue_delay, log=self.log)
+            threading.Thread(target=self.listen_zone, daemon=True).start()
+            threading.Thread(target=self.listen_hub, daemon=True).start()
+        if self.clear_interval > 0:
+            threading.Thread(target=self.clear_packets_loop, daemon=True).start()
         while True:
             time.sleep(10)
+            for queue in self.queues.values():
+                if queue:
+                    self.log(f"Peer queue {queue.stats()}")
 
     def listen_zone(self):
         # Listen for IBC packets from Zone
@@ -49,12 +173,14 @@ class Relayer:
             self.log(f"Listening for IBC packets from Zone on {self.zone_ip}:{self.listen_port}")
             while True:
                 conn, addr = s.accept()
-                data = conn.recv(1024)
-                if data:
-                    message = data.decode()
-                    self.log(f"Received packet from Zone: {message}")
-                    self.forward_to_hub(message)
+                start = time.time()
+                messages = recv_messages(conn)
                 conn.close()
+                if messages:
+                    for message in messages:
+                        self.log(f"Received packet from Zone: {message}")
+                    self.relay(messages, 'hub')
+                    self.tracer.trace_messages(messages, 'relay to hub', start)
 
     def listen_hub(self):
         # Listen for IBC packets from Hub
@@ -64,40 +190,241 @@ class Relayer:
             self.log(f"Listening for IBC packets from Hub on {self.hub_ip}:{self.listen_port}")
             while True:
                 conn, addr = s.accept()
-                data = conn.recv(1024)
-                if data:
-                    message = data.decode()
-                    self.log(f"Received packet from Hub: {message}")
-                    self.forward_to_zone(message)
+                start = time.time()
+                messages = recv_messages(conn)
                 conn.close()
+                if messages:
+                    for message in messages:
+                        self.log(f"Received packet from Hub: {message}")
+                    self.relay(messages, 'zone')
+                    self.tracer.trace_messages(messages, 'relay to zone', start)
+
+    def relay(self, messages, destination):
+        forward = self.forward_to_hub if destination == 'hub' else self.forward_to_zone
+        queue = self.queues[destination]
+        if queue is None:
+            forward(messages)
+        elif not queue.put(messages):
+            # Still full after waiting; the messages are left to packet clearing
+            self.forward_errors.inc(len(messages), destination=destination)
+            self.log(f"Queue to {destination.capitalize()} full for {queue.timeout}s, dropping {len(messages)} messages")
+
+    def passthrough_listener(self, listen_ip, destination):
+        # Accept connections from the chain on `listen_ip` and relay their frames to `destination`
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.bind((listen_ip, self.listen_port))
+            s.listen()
+            self.log(f"Relaying frames to {destination.capitalize()} from {listen_ip}:{self.listen_port} (pass-through)")
+            while True:
+                conn, addr = s.accept()
+                threading.Thread(target=self.relay_connection, args=(conn, destination), daemon=True).start()
+
+    def relay_connection(self, conn, destination):
+        """
+        Relay every complete frame received on `conn` as soon as it arrives. Data is
+        received into a reusable buffer and sent from it; only a partial frame at
+        the end of a read is copied, to the front of the buffer.
+        """
+        if destination == 'hub':
+            source_chain, tracker = self.zone_id, self.zone_sequences
+        else:
+            source_chain, tracker = 'hub', self.hub_sequences
+        buffer = bytearray(self.passthrough_buffer_size)
+        view = memoryview(buffer)
+        filled = 0
+        with conn:
+            try:
+                while True:
+                    received = conn.recv_into(view[filled:])
+                    if not received:
+                        break
+                    start = time.time()
+                    filled += received
+                    end = buffer.rfind(b'\n', 0, filled) + 1
+                    if end:
+                        self.relay_frames(buffer, end, destination, source_chain, tracker, start)
+                        buffer[:filled - end] = buffer[end:filled]
+                        filled -= end
+                    elif filled == len(buffer):
+                        self.log(f"Dropping a frame longer than {len(buffer)} bytes bound for {destination.capitalize()}")
+                        filled = 0
+            except OSError as e:
+                self.log(f"Error relaying to {destination.capitalize()}: {e}")
+            finally:
+                view.release()
+
+    def relay_frames(self, buffer, end, destination, source_chain, tracker, start):
+        # Route buffer[:end] to `destination` from the frame headers alone
+        height = 0
+        counts = {}
+        traced = []
+        for msg_type, msg_height, sequence in frame_headers(buffer, end):
+            counts[msg_type] = counts.get(msg_type, 0) + 1
+            if msg_type == b'RECV_PACKET':
+                gaps = tracker.observe(sequence)
+                if gaps:
+                    self.log(f"Detected gap of {gaps} packets from {source_chain} before sequence {sequence}")
+            if msg_type != b'UPDATE_CLIENT':
+                height = max(height, msg_height)
+        # Only traced frames are decoded, for their spans
+        separator = TRACE_SEPARATOR.encode()
+        position = buffer.find(separator, 0, end)
+        while position >= 0:
+            line_start = buffer.rfind(b'\n', 0, position) + 1
+            line_end = buffer.find(b'\n', position, end)
+            traced.append(buffer[line_start:line_end].decode())
+            position = buffer.find(separator, line_end, end)
+
+        send_start = time.perf_counter()
+        with self.forward_locks[destination]:
+            buffers = [memoryview(buffer)[:end]]
+            update = height > self.client_heights[destination]
+            if update:
+                buffers.insert(0, (encode_client_update(source_chain, height) + '\n').encode())
+            try:
+                self.streams[destination].send_buffers(buffers)
+            except OSError as e:
+                self.forward_errors.inc(sum(counts.values()), destination=destination)
+                self.log(f"Error forwarding packet to {destination.capitalize()}: {e}")
+                return
+            if update:
+                self.client_heights[destination] = height
+                counts[UPDATE_CLIENT.encode()] = counts.get(UPDATE_CLIENT.encode(), 0) + 1
+                self.client_updates.inc(destination=destination)
 
-    def forward_to_hub(self, message):
-        # Forward packet to Hub
+        self.relay_time.observe(time.perf_counter() - send_start, destination=destination)
+        for msg_type, count in counts.items():
+            self.packets_relayed.inc(count, destination=destination, type=msg_type.decode())
+        self.bytes_relayed.inc(end + (len(buffers[0]) if update else 0), destination=destination)
+        self.log(f"Relayed {sum(counts.values())} messages to {destination.capitalize()}")
+        self.tracer.trace_messages(traced, f'relay to {destination}', start)
+
+    def with_client_update(self, messages, chain_id, client_height):
+        """
+        Prefix the messages with a MsgUpdateClient if they were committed at a height
+        the counterparty's light client has not seen yet. Returns (messages, new_height).
+        """
+        height = max((message_height(m) for m in messages if message_type(m) != UPDATE_CLIENT), default=0)
+        if height > client_height:
+            return [encode_client_update(chain_id, height)] + messages, height
+        return messages, client_height
+
+    def observe_sequences(self, messages, tracker, chain):
+        for message in messages:
+            if message_type(message) == RECV_PACKET:
+                gaps = tracker.observe(message_sequence(message))
+                if gaps:
+                    self.log(f"Detected gap of {gaps} packets from {chain} before sequence {message_sequence(message)}")
+
+    def forward_to_hub(self, messages):
+        # Forward packets to Hub
         dest_ip = self.hub_dest_ip  # '10.0.0.1', adjust if necessary
-        port = 8000
+        self.observe_sequences(messages, self.zone_sequences, self.zone_id)
+        with self.forward_locks['hub']:
+            messages, height = self.with_client_update(messages, self.zone_id, self.client_heights['hub'])
+            if not self.send(dest_ip, messages, 'hub'):
+                return False
+            self.client_heights['hub'] = height
+            return True
+
+    def forward_to_zone(self, messages):
+        # Forward packets to Zone
+        dest_ip = self.zone_dest_ip  # e.g., '10.0.1.1'
+        self.observe_sequences(messages, self.hub_sequences, 'hub')
+        with self.forward_locks['zone']:
+            messages, height = self.with_client_update(messages, 'hub', self.client_heights['zone'])
+            if not self.send(dest_ip, messages, 'zone'):
+                return False
+            self.client_heights['zone'] = height
+            return True
+
+    def send(self, dest_ip, messages, destination):
+        port = self.config.ibc_port
+        start = time.perf_counter()
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((dest_ip, port))
-                s.sendall(message.encode())
-                self.log(f"Forwarded packet to Hub at {dest_ip}:{port}")
+            if self.passthrough:
+                self.streams[destination].send(messages)  # Clearing shares the long-lived connection
+            else:
+                send_messages(dest_ip, port, messages)
         except Exception as e:
-            self.log(f"Error forwarding packet to Hub: {e}")
+            self.forward_errors.inc(len(messages), destination=destination)
+            self.log(f"Error forwarding packet to {destination.capitalize()}: {e}")
+            return False
+        self.relay_time.observe(time.perf_counter() - start, destination=destination)
+        for message in messages:
+            msg_type = message_type(message)
+            self.packets_relayed.inc(destination=destination, type=msg_type)
+            if msg_type == UPDATE_CLIENT:
+                self.client_updates.inc(destination=destination)
+        self.bytes_relayed.inc(sum(len(message) + 1 for message in messages), destination=destination)
+        self.log(f"Forwarded {len(messages)} messages to {destination.capitalize()} at {dest_ip}:{port}")
+        return True
 
-    def forward_to_zone(self, message):
-        # Forward packet to Zone
-        dest_ip = self.zone_dest_ip  # e.g., '10.0.1.1'
-        port = 8000
+    def clear_packets_loop(self):
+        # Clear right away so a restarted relayer picks up the backlog it missed
+        while True:
+            self.clear_packets(self.zone_id, self.zone_dest_ip, self.zone_channel, self.zone_sequences, self.forward_to_hub)
+            self.clear_packets('hub', self.hub_dest_ip, self.hub_channel, self.hub_sequences, self.forward_to_zone)
+            time.sleep(self.clear_interval)
+
+    def clear_packets(self, chain, query_ip, channel_id, tracker, forward):
+        """
+        Query the packet commitments still pending on `chain` and relay, in batches,
+        those that were never relayed or have been pending for a whole clearing interval.
+        """
+        start = time.time()
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((dest_ip, port))
-                s.sendall(message.encode())
-                self.log(f"Forwarded packet to Zone at {dest_ip}:{port}")
+            pending = query_messages(query_ip, self.query_port, [f"{QUERY_COMMITMENTS},{channel_id}"])
         except Exception as e:
-            self.log(f"Error forwarding packet to Zone: {e}")
+            self.log(f"Error querying packet commitments from {chain}: {e}")
+            return
+
+        # With commitment proofs on, the response starts with the headers of the packets' blocks
+        headers = {message_height(m): m for m in pending if message_type(m) == BLOCK_HEADER}
+        if headers:
+            pending = [m for m in pending if message_type(m) != BLOCK_HEADER]
+
+        to_clear = []
+        still_pending = set()
+        for message in pending:
+            sequence = message_sequence(message)
+            key = (chain, sequence)
+            still_pending.add(key)
+            first_seen = self.pending_since.setdefault(key, start)
+            if tracker.is_unrelayed(sequence) or start - first_seen >= self.clear_interval:
+                to_clear.append(message)
+                self.pending_since[key] = start
+
+        # Forget commitments that have been acknowledged since the last query
+        for key in [key for key in self.pending_since if key[0] == chain and key not in still_pending]:
+            del self.pending_since[key]
+
+        gaps = len(tracker.missing)
+        for i in range(0, len(to_clear), self.clear_batch_size):
+            batch = to_clear[i:i + self.clear_batch_size]
+            if headers:
+                heights = sorted({message_height(m) for m in batch})
+                batch = [headers[height] for height in heights if height in headers] + batch
+            forward(batch)
+
+        duration = time.time() - start
+        clearing_rate = len(to_clear) / duration if duration > 0 else 0.0
+        self.backlog.set(len(pending), chain=chain)
+        self.gaps.set(gaps, chain=chain)
+        self.cleared.inc(len(to_clear), chain=chain)
+        self.clearing_rate.set(clearing_rate, chain=chain)
+        if to_clear:
+            self.log(f"Cleared {len(to_clear)} of {len(pending)} pending packets from {chain} {channel_id} in {duration:.3f}s")
+        timestamp = datetime.fromtimestamp(start).strftime("%Y-%m-%d %H:%M:%S.%f")
+        with open(self.clearing_metrics_file, 'a') as f:
+            f.write(f"{timestamp},{chain},{channel_id},{len(pending)},{gaps},{len(to_clear)},{duration:.6f},{clearing_rate:.2f}\n")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python3 relayer.py <node_name> <zone_id>")
-        sys.exit(1)
-    relayer = Relayer(sys.argv[1], sys.argv[2])
+    parser = argparse.ArgumentParser(description='Run the relayer between a zone and the hub.')
+    parser.add_argument('node_name', help="Node name, e.g. 'rz1'")
+    parser.add_argument('zone_id', help="Zone to relay for, e.g. 'z1'")
+    parser.add_argument('index', type=int, nargs='?', default=0, help="Relayer's index among the zone's relayers (default 0)")
+    RunConfig.add_arguments(parser)
+    args = parser.parse_args()
+    relayer = Relayer(args.node_name, args.zone_id, RunConfig.load(args=args), args.index)
     relayer.start()
\ No newline at end of file
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+"""
+Measure relayer CPU time per packet with and without pass-through forwarding.
+
+A relayer process is started on loopback addresses for each mode. A stand-in
+zone sends batches of RECV_PACKET messages to it, the way a zone validator
+does, and a stand-in hub counts what arrives. The relayer's CPU time (user +
+system, from /proc) is sampled before and after the packets are sent, so the
+cost of the sender and the sink is not included.
+
+  copy         Messages are decoded, logged one by one and re-encoded, and a
+               new connection is opened per batch (the default relayer).
+  passthrough  Frames are relayed as bytes over long-lived connections from
+               their headers alone (--relayer-passthrough 1).
+
+Usage: python3 relayer_benchmark.py [--packets N] [--batch N] [--modes copy passthrough]
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from ibc_packet import MessageStream, Packet, iter_messages, send_messages
+from run_config import RunConfig
+
+ZONE_SIDE_IP = '127.0.0.1'  # Relayer listens here for the zone
+HUB_SIDE_IP = '127.0.0.2'   # Relayer listens here for the hub
+SINK_IP = '127.0.0.3'       # Stand-in hub (and zone) the relayer forwards to
+
+def process_cpu_seconds(pid):
+    # utime and stime are fields 14 and 15 of /proc/<pid>/stat, in clock ticks
+    with open(f'/proc/{pid}/stat', 'r') as f:
+        fields = f.read().rpartition(')')[2].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+class Sink:
+    """Stand-in hub that counts the packets it receives."""
+
+    def __init__(self, port):
+        self.received = 0
+        self.lock = threading.Lock()
+        self.server = socket.create_server((SINK_IP, port))
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def accept_loop(self):
+        while True:
+            try:
+                conn, addr = self.server.accept()
+            except OSError:
+                return  # Closed
+            threading.Thread(target=self.read, args=(conn,), daemon=True).start()
+
+    def read(self, conn):
+        with conn:
+            for message in iter_messages(conn):
+                if message.startswith('RECV_PACKET'):
+                    with self.lock:
+                        self.received += 1
+
+    def wait_for(self, count, timeout):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.received >= count:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def close(self):
+        # shutdown() wakes the blocked accept() so the port is released
+        self.server.shutdown(socket.SHUT_RDWR)
+        self.server.close()
+
+def run_relayer(config):
+    from relayer import Relayer
+
+    sys.stdout = open(os.devnull, 'w')  # The relayer echoes its log to stdout
+    relayer = Relayer('rbench', 'z1', config)
+    relayer.zone_ip, relayer.hub_ip = ZONE_SIDE_IP, HUB_SIDE_IP
+    relayer.hub_dest_ip = relayer.zone_dest_ip = SINK_IP
+    relayer.start()
+
+def wait_until_listening(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((ZONE_SIDE_IP, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('Relayer did not start listening')
+
+def make_batches(packets, batch_size):
+    batches = []
+    for first in range(1, packets + 1, batch_size):
+        height = len(batches) + 1  # One block per batch, so each batch carries a client update
+        batches.append([Packet(sequence, 'channel-0', 'channel-0', 10, 'z1', 'sender', 'z2', str(sequence),
+                               time.time() + 600, height).encode()
+                        for sequence in range(first, min(first + batch_size, packets + 1))])
+    return batches
+
+def measure(mode, args):
+    config = RunConfig(logs_dir=tempfile.mkdtemp(prefix='relayer_benchmark_'), ibc_port=args.port, metrics_port=0,
+                       relayer_clear_interval=0, trace_sample_rate=0, relayer_passthrough=(mode == 'passthrough'))
+    config.resolve_paths()
+    sink = Sink(args.port)
+    relayer = multiprocessing.Process(target=run_relayer, args=(config,), daemon=True)
+    relayer.start()
+    try:
+        wait_until_listening(args.port)
+        batches = make_batches(args.packets, args.batch)
+        stream = MessageStream(ZONE_SIDE_IP, args.port) if mode == 'passthrough' else None
+
+        cpu_before = process_cpu_seconds(relayer.pid)
+        start = time.perf_counter()
+        for batch in batches:
+            if stream:
+                stream.send(batch)
+            else:
+                send_messages(ZONE_SIDE_IP, args.port, batch)
+        complete = sink.wait_for(args.packets, args.timeout)
+        elapsed = time.perf_counter() - start
+        cpu = process_cpu_seconds(relayer.pid) - cpu_before
+        if stream:
+            stream.close()
+    finally:
+        relayer.terminate()
+        relayer.join()
+        sink.close()
+
+    if not complete:
+        print(f"{mode}: only {sink.received} of {args.packets} packets arrived within {args.timeout}s")
+    return {
+        'mode': mode,
+        'packets': sink.received,
+        'seconds': elapsed,
+        'packets_per_second': sink.received / elapsed if elapsed else 0.0,
+        'cpu_seconds': cpu,
+        'cpu_us_per_packet': cpu / sink.received * 1e6 if sink.received else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure relayer CPU time per packet in each forwarding mode.')
+    parser.add_argument('--packets', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=100, help='Messages per batch sent by the stand-in zone')
+    parser.add_argument('--modes', nargs='+', choices=['copy', 'passthrough'], default=['copy', 'passthrough'])
+    parser.add_argument('--port', type=int, default=18000)
+    parser.add_argument('--timeout', type=float, default=120, help='Seconds to wait for all packets to arrive')
+    args = parser.parse_args()
+
+    results = [measure(mode, args) for mode in args.modes]
+    print(f"{'mode':<12} {'packets':>9} {'seconds':>8} {'packets/s':>10} {'CPU s':>7} {'CPU us/packet':>14}")
+    for result in results:
+        print(f"{result['mode']:<12} {result['packets']:>9} {result['seconds']:>8.2f} {result['packets_per_second']:>10.0f} "
+              f"{result['cpu_seconds']:>7.2f} {result['cpu_us_per_packet']:>14.1f}")
+    if len(results) == 2 and results[1]['cpu_us_per_packet']:
+        print(f"CPU per packet: {results[0]['cpu_us_per_packet'] / results[1]['cpu_us_per_packet']:.1f}x lower with "
+              f"{results[1]['mode']}")
+
+if __name__ == '__main__':
+    main()
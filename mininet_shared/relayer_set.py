@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+from ibc_packet import BLOCK_HEADER, message_sequence, message_type
+
+RELAYER_MODES = ['race', 'share']
+
+def relayer_name(zone_id, index=0):
+    # 'rz1' for a zone's first relayer, then 'rz1_2', 'rz1_3', ...
+    return f"r{zone_id}" if index == 0 else f"r{zone_id}_{index + 1}"
+
+def relayer_addresses(zone_index, index=0):
+    """
+    (hub network IP, zone network IP) of relayer `index` of the zone with
+    1-based `zone_index`. Each relayer index takes a block of 40 addresses on
+    the hub network, starting at 10.0.0.10, below the controller's .200.
+    """
+    hub_host = 10 + zone_index - 1 + 40 * index
+    if zone_index > 40 or hub_host >= 200:
+        raise ValueError(f"No hub network address for relayer {index + 1} of zone {zone_index}")
+    return f"10.0.0.{hub_host}", f"10.0.{zone_index}.{10 + index}"
+
+class RelayerSet:
+    """
+    The relayers a chain sends one zone's messages to (--relayers-per-zone N).
+
+    In 'race' mode every relayer gets every message and the first copy to
+    land on the counterparty wins; the others are dropped there as
+    duplicates. In 'share' mode each packet and acknowledgement goes to
+    relayer `sequence % N` only, so nothing is relayed twice and the share
+    of a relayer that stops is left to the packet clearing of the others.
+    Block headers go to every relayer that gets messages of the block.
+    """
+
+    def __init__(self, addresses, mode='race'):
+        if mode not in RELAYER_MODES:
+            raise ValueError(f"Unknown relayer mode '{mode}', expected one of {RELAYER_MODES}")
+        self.addresses = addresses
+        self.mode = mode
+
+    @classmethod
+    def from_config(cls, config, zone_index, network):
+        # `network` is 'hub' or 'zone', the side the sending chain reaches the relayers on
+        side = 0 if network == 'hub' else 1
+        return cls([relayer_addresses(zone_index, index)[side] for index in range(max(1, config.relayers_per_zone))],
+                   config.relayer_mode)
+
+    def routes(self, messages):
+        """(relayer IP, messages) pairs to send `messages` on."""
+        if self.mode == 'race' or len(self.addresses) == 1:
+            return [(address, messages) for address in self.addresses]
+        headers = []
+        shares = {}
+        for message in messages:
+            if message_type(message) == BLOCK_HEADER:
+                headers.append(message)
+            else:
+                shares.setdefault(message_sequence(message) % len(self.addresses), []).append(message)
+        return [(self.addresses[index], headers + shares[index]) for index in sorted(shares)]
+
+    def __repr__(self):
+        return f"{'/'.join(self.addresses)} ({self.mode})" if len(self.addresses) > 1 else self.addresses[0]
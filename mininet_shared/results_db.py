@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+
+"""
+Load the results of every run into one SQLite database and query across runs.
+
+Ingesting a run reads its logs directory (as written by calculate_latency.py)
+into five tables, each keyed by the run's run_id:
+
+  runs          one row per run: where it came from, the number of zones
+                that sent transfers and a column for every RunConfig field,
+                taken from the run's run_config.json
+  transactions  every completed transfer from latency_results.csv
+  rates         per-second send rate, throughput, backlog and latency
+                percentiles from rates_per_second.csv
+  summaries     the run's row of summary_statistics.csv, looked up in the
+                logs directory and then in the shared directory above it
+  zone_stats    per-zone results from zone_statistics.csv
+
+A summary_statistics.csv file can be ingested too, such as the ones collected
+under ./Results/Medium/; each of its rows becomes a run of its own with only a
+summary. Rows are bulk-inserted with executemany in one transaction per run,
+so a run is either fully ingested or not at all, and a run already in the
+database is skipped unless --replace is given.
+
+Queries run on the same database, with a percentile(value, fraction)
+aggregate (nearest rank, as in compare_runs.py) registered. --query takes SQL
+or the name of one of the QUERIES below, e.g.
+
+  python3 results_db.py --query p99
+  python3 results_db.py --query "SELECT zones, tps, percentile(latency, 0.99) FROM transactions
+                                 JOIN runs USING (run_id) GROUP BY zones, tps"
+
+Usage: python3 results_db.py [RUNS...] [--db FILE] [--replace] [--query SQL|NAME] [--output FILE]
+
+RUNS are logs directories, directories of runs or summary_statistics.csv
+files. Without RUNS or --query the run in the configured logs directory is
+ingested. The database defaults to results.db in the shared directory.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+from dataclasses import fields
+from datetime import datetime
+
+from compare_runs import find_runs, percentile
+from run_config import RunConfig
+
+SCHEMA_VERSION = 1
+
+# summary_statistics.csv columns written by calculate_latency.py -> summaries columns
+SUMMARY_COLUMNS = {
+    'Time Taken to Finish Sending Transactions (seconds)': 'send_duration',
+    'Time Taken to Finish Processing All Transactions (seconds)': 'processing_duration',
+    'Time Taken for Simulation (seconds)': 'simulation_duration',
+    'Total Transactions Processed': 'transactions_processed',
+    'Average Throughput per Second (transactions/second)': 'throughput',
+    'Standard Deviation of Throughput': 'throughput_std',
+    'Average Send Rate per Second (transactions/second)': 'send_rate',
+    'Standard Deviation of Send Rate': 'send_rate_std',
+    'Total Number of Transactions Failed/Dropped': 'transactions_failed',
+    'Error Rate for Entire Run (%)': 'error_rate',
+    'Average Latency (seconds)': 'mean_latency',
+    'Maximum Latency (seconds)': 'max_latency',
+    'Average Round-Trip Latency (seconds)': 'round_trip_latency',
+    'Total Transactions Refunded': 'transactions_refunded',
+    'Steady-State Duration (seconds)': 'steady_duration',
+    'Steady-State Throughput (transactions/second)': 'steady_throughput',
+    'Standard Deviation of Steady-State Throughput': 'steady_throughput_std',
+    'Steady-State p50 Latency (seconds)': 'steady_p50_latency',
+    'Steady-State p90 Latency (seconds)': 'steady_p90_latency',
+    'Steady-State p99 Latency (seconds)': 'steady_p99_latency',
+}
+
+# Table -> (file in the logs directory, CSV columns in table order, SQL types); every table starts with run_id
+TABLES = {
+    'transactions': ('latency_results.csv',
+                     ['transaction_id', 'source_zone', 'destination_zone', 'amount', 'latency', 'init_time', 'completion_time'],
+                     ['TEXT', 'TEXT', 'TEXT', 'INTEGER', 'REAL', 'TEXT', 'TEXT']),
+    'rates': ('rates_per_second.csv',
+              ['second', 'time', 'send_rate', 'throughput', 'backlog', 'latency_p50', 'latency_p90', 'latency_p99', 'steady_state'],
+              ['INTEGER', 'TEXT', 'INTEGER', 'INTEGER', 'INTEGER', 'REAL', 'REAL', 'REAL', 'INTEGER']),
+    'zone_stats': ('zone_statistics.csv',
+                   ['source_zone', 'sent', 'completed', 'error_rate', 'throughput', 'mean_latency', 'p50_latency', 'p99_latency'],
+                   ['TEXT', 'INTEGER', 'INTEGER', 'REAL', 'REAL', 'REAL', 'REAL', 'REAL']),
+    'summaries': (None, list(SUMMARY_COLUMNS), ['REAL'] * len(SUMMARY_COLUMNS)),
+}
+
+INDEXES = [
+    'CREATE UNIQUE INDEX IF NOT EXISTS rates_run ON rates (run_id, second)',
+    'CREATE INDEX IF NOT EXISTS transactions_run ON transactions (run_id, source_zone, destination_zone)',
+    'CREATE INDEX IF NOT EXISTS transactions_id ON transactions (transaction_id)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS zone_stats_run ON zone_stats (run_id, source_zone)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS summaries_run ON summaries (run_id)',
+    'CREATE INDEX IF NOT EXISTS runs_load ON runs (zones, tps)',
+]
+
+# Named queries for --query
+QUERIES = {
+    'runs': """
+        SELECT run_id, zones, tps, duration, relayers_per_zone AS relayers, source,
+               (SELECT COUNT(*) FROM transactions t WHERE t.run_id = runs.run_id) AS transactions
+        FROM runs ORDER BY run_id""",
+    'p99': """
+        SELECT zones, tps, COUNT(DISTINCT run_id) AS runs, COUNT(*) AS transactions,
+               percentile(latency, 0.50) AS p50, percentile(latency, 0.90) AS p90, percentile(latency, 0.99) AS p99
+        FROM transactions JOIN runs USING (run_id)
+        GROUP BY zones, tps ORDER BY zones, tps""",
+    'throughput': """
+        SELECT zones, tps, COUNT(*) AS runs, AVG(throughput) AS throughput, AVG(steady_throughput) AS steady,
+               AVG(error_rate) AS error_rate, AVG(steady_p99_latency) AS steady_p99
+        FROM summaries JOIN runs USING (run_id)
+        GROUP BY zones, tps ORDER BY zones, tps""",
+    'zones': """
+        SELECT source_zone, COUNT(*) AS runs, SUM(sent) AS sent, SUM(completed) AS completed,
+               AVG(throughput) AS throughput, AVG(p99_latency) AS p99
+        FROM zone_stats GROUP BY source_zone ORDER BY source_zone""",
+}
+
+def sql_type(field):
+    field_type = RunConfig.field_type(field)
+    if field_type in (int, bool):
+        return 'INTEGER'
+    return 'REAL' if field_type is float else 'TEXT'
+
+RUN_COLUMNS = [('run_id', 'TEXT PRIMARY KEY'), ('source', 'TEXT'), ('path', 'TEXT'), ('ingested_at', 'TEXT'),
+               ('zones', 'INTEGER')] + [(field.name, sql_type(field)) for field in fields(RunConfig)] + [('config', 'TEXT')]
+
+class Percentile:
+    """percentile(value, fraction) aggregate: the nearest-rank percentile, NULL values ignored."""
+
+    def __init__(self):
+        self.values = []
+        self.fraction = None
+
+    def step(self, value, fraction):
+        self.fraction = fraction
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        if not self.values:
+            return None
+        return percentile(sorted(self.values), self.fraction)
+
+def connect(path):
+    db = sqlite3.connect(path)
+    db.create_aggregate('percentile', 2, Percentile)
+    db.execute('PRAGMA journal_mode = WAL')
+    db.execute('PRAGMA synchronous = NORMAL')  # With WAL this is still safe against a crash of the script
+    create_schema(db)
+    return db
+
+def create_schema(db):
+    with db:
+        db.execute(f"CREATE TABLE IF NOT EXISTS runs ({', '.join(f'{name} {kind}' for name, kind in RUN_COLUMNS)})")
+        # RunConfig fields added since the database was created get columns of their own
+        existing = {row[1] for row in db.execute('PRAGMA table_info(runs)')}
+        for name, kind in RUN_COLUMNS:
+            if name not in existing:
+                db.execute(f'ALTER TABLE runs ADD COLUMN {name} {kind}')
+        for table, (_, columns, types) in TABLES.items():
+            names = ['run_id'] + [SUMMARY_COLUMNS.get(column, column) for column in columns]
+            definitions = ', '.join(f'{name} {kind}' for name, kind in zip(names, ['TEXT'] + types))
+            db.execute(f'CREATE TABLE IF NOT EXISTS {table} ({definitions})')
+        for statement in INDEXES:
+            db.execute(statement)
+        db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+def csv_rows(path, run_id, columns):
+    """
+    Rows of a CSV file as tuples of (run_id, *columns); empty and missing
+    cells become NULL. A file with a run_id column of its own, such as the
+    appended rates_per_second.csv, only yields the rows of `run_id`.
+    """
+    with open(path, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            if row.get('run_id', run_id) != run_id:
+                continue
+            yield (run_id,) + tuple(row.get(column) or None for column in columns)
+
+def logs_run_id(logs_dir):
+    # calculate_latency.py stamps rates_per_second.csv with the run_id it also puts in the summary
+    rates = os.path.join(logs_dir, 'rates_per_second.csv')
+    run_id = None
+    if os.path.exists(rates):
+        with open(rates, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                run_id = row['run_id']
+    if run_id is None:
+        mtime = os.path.getmtime(os.path.join(logs_dir, 'latency_results.csv'))
+        run_id = datetime.fromtimestamp(mtime).strftime('%Y%m%d%H%M%S')
+    return run_id
+
+def find_summary(logs_dir, run_id):
+    # summary_statistics.csv is appended in the shared directory, one level above the logs
+    for directory in (logs_dir, os.path.dirname(os.path.abspath(logs_dir))):
+        path = os.path.join(directory, 'summary_statistics.csv')
+        if os.path.exists(path):
+            with open(path, 'r', newline='') as f:
+                for row in csv.DictReader(f):
+                    if row.get('run_id') == run_id:
+                        return row
+    return None
+
+def run_zones(logs_dir):
+    # Zones that sent transfers; zone_configs.json lists the zones of the last topology built, not this run's
+    zone_file = os.path.join(logs_dir, 'zone_statistics.csv')
+    if os.path.exists(zone_file):
+        with open(zone_file, 'r', newline='') as f:
+            return sum(1 for _ in csv.DictReader(f))
+    with open(os.path.join(logs_dir, 'latency_results.csv'), 'r', newline='') as f:
+        return len({row['source_zone'] for row in csv.DictReader(f)}) or None
+
+def insert_run(db, run_id, source, path, zones=None, config=None):
+    values = {'run_id': run_id, 'source': source, 'path': os.path.abspath(path),
+              'ingested_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'zones': zones}
+    if config is not None:
+        for name, _ in RUN_COLUMNS:
+            if name in config:
+                values[name] = config[name]
+        values['config'] = json.dumps(config, sort_keys=True)
+    db.execute(f"INSERT INTO runs ({', '.join(values)}) VALUES ({', '.join('?' * len(values))})", list(values.values()))
+
+def insert_summary(db, run_id, row):
+    db.execute(f"INSERT INTO summaries VALUES ({', '.join('?' * (len(SUMMARY_COLUMNS) + 1))})",
+               (run_id,) + tuple(row.get(column) or None for column in SUMMARY_COLUMNS))
+
+def delete_run(db, run_id):
+    for table in ['runs'] + list(TABLES):
+        db.execute(f'DELETE FROM {table} WHERE run_id = ?', (run_id,))
+
+def ingested(db, run_id):
+    return db.execute('SELECT 1 FROM runs WHERE run_id = ?', (run_id,)).fetchone() is not None
+
+def ingest_logs(db, logs_dir, replace=False):
+    """Ingest one logs directory. Returns the run_id, or None if it was already ingested."""
+    run_id = logs_run_id(logs_dir)
+    if ingested(db, run_id) and not replace:
+        return None
+    config = None
+    config_file = os.path.join(logs_dir, 'run_config.json')
+    if os.path.exists(config_file):
+        with open(config_file, 'r') as f:
+            config = json.load(f)
+    summary = find_summary(logs_dir, run_id)
+
+    with db:
+        delete_run(db, run_id)
+        insert_run(db, run_id, 'logs', logs_dir, run_zones(logs_dir), config)
+        for table, (name, columns, _) in TABLES.items():
+            if name is None or not os.path.exists(os.path.join(logs_dir, name)):
+                continue  # The summary is kept outside the logs directory
+            path = os.path.join(logs_dir, name)
+            db.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * (len(columns) + 1))})",
+                           csv_rows(path, run_id, columns))
+        if summary is not None:
+            insert_summary(db, run_id, summary)
+    return run_id
+
+def ingest_summary_file(db, path, replace=False):
+    """Ingest every row of a summary_statistics.csv file as a run. Returns the run_ids ingested."""
+    source = os.path.basename(os.path.dirname(os.path.abspath(path))) + '/' + os.path.basename(path)
+    run_ids = []
+    with db:
+        with open(path, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                run_id = row.get('run_id')
+                if not run_id or (ingested(db, run_id) and not replace):
+                    continue
+                delete_run(db, run_id)
+                insert_run(db, run_id, source, path)
+                insert_summary(db, run_id, row)
+                run_ids.append(run_id)
+    return run_ids
+
+def query(db, sql):
+    """(column names, rows) of a query, or of one of the named QUERIES."""
+    cursor = db.execute(QUERIES.get(sql, sql))
+    return [column[0] for column in cursor.description or []], cursor.fetchall()
+
+def cell(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float) and not value.is_integer():
+        return f'{value:.4f}'
+    return str(int(value)) if isinstance(value, float) else str(value)
+
+def print_table(columns, rows):
+    cells = [[cell(value) for value in row] for row in rows]
+    widths = [max([len(column)] + [len(row[i]) for row in cells]) for i, column in enumerate(columns)]
+    print(' '.join(f'{column:>{width}}' for column, width in zip(columns, widths)))
+    for row in cells:
+        print(' '.join(f'{value:>{width}}' for value, width in zip(row, widths)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest run results into a SQLite database and query across runs.')
+    parser.add_argument('runs', nargs='*', help='Logs directories, directories of runs or summary_statistics.csv files')
+    parser.add_argument('--db', help='Database file (default: results.db in the shared directory)')
+    parser.add_argument('--replace', action='store_true', help='Ingest runs that are already in the database again')
+    parser.add_argument('--query', help=f"SQL to run, or one of: {', '.join(QUERIES)}")
+    parser.add_argument('--output', help='Also write the query result to this CSV file')
+    RunConfig.add_arguments(parser)
+    args = parser.parse_args()
+    config = RunConfig.load(args=args)
+
+    db = connect(args.db or config.shared_path('results.db'))
+    paths = args.runs or ([] if args.query else [config.logs_dir])
+    for path in find_runs(paths, files=True):
+        if os.path.isfile(path):
+            run_ids = ingest_summary_file(db, path, args.replace)
+            print(f"Ingested {len(run_ids)} summaries from {path}")
+        else:
+            run_id = ingest_logs(db, path, args.replace)
+            print(f"Ingested run {run_id} from {path}" if run_id else f"Run in {path} is already ingested")
+
+    if args.query:
+        columns, rows = query(db, args.query)
+        print_table(columns, rows)
+        if args.output:
+            with open(args.output, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                writer.writerows(rows)
+    db.close()
+
+if __name__ == '__main__':
+    main()
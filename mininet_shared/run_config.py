@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+from dataclasses import asdict, dataclass, fields
+from typing import Optional
+
+@dataclass
+class RunConfig:
+    """
+    Parameters of one simulation run, shared by the topology, the nodes, the
+    controller and the analysis scripts.
+
+    Values are resolved in order of precedence: command line flags, then
+    IBC_SIM_<FIELD> environment variables, then the JSON file given with
+    --run-config (or IBC_SIM_CONFIG), then the defaults below. The topology
+    saves the resolved config as run_config.json in the logs directory and
+    passes it to every process it starts.
+    """
+
+    # Paths; empty directories are derived from shared_dir
+    shared_dir: str = '/home/ubuntu/IBC_Simulation/mininet_shared'
+    logs_dir: str = ''
+    zone_config_file: str = 'zone_configs.json'  # Written by the topology, relative to shared_dir
+    topology_file: str = ''                      # Zones to build (e.g. small.json); empty uses cosmos_topology's list
+
+    # Load generation
+    duration: Optional[float] = None  # Seconds; None is 5s of generated load or the whole replayed workload
+    tps: float = 1000.0
+    first_transaction_id: int = 1
+    replay_file: str = ''
+    time_scale: float = 1.0
+    zone_map_file: str = ''
+    replay_columns: str = ''  # 'timestamp=block_time,source=src_chain,...' for exported logs
+
+    # Ports
+    ibc_port: int = 8000
+    command_port: int = 8001
+    query_port: int = 8002
+    metrics_port: int = 9100  # 0 disables the metrics endpoints
+
+    # Chain model
+    block_interval: float = 1.0
+    block_max_txs: int = 5000
+    block_max_gas: int = 500000000
+    mempool_size: int = 50000
+    packet_timeout: float = 600.0
+    listener_workers: int = 8
+    node_workers: int = 1  # Processes reading the IBC port; above 1 they share it with SO_REUSEPORT
+    initial_balance: int = 100000
+
+    # Accounts
+    accounts: int = 0                      # Accounts per zone, held in an array; 0 models each zone as its node's one account
+    account_distribution: str = 'uniform'  # How the controller picks sender and receiver accounts: uniform, zipf or hotspot
+    account_skew: float = 1.0              # Zipf exponent, or for hotspot the share of transfers using the hottest 1% of accounts
+
+    # Denominations
+    denom_tracing: bool = False     # Transfers carry ICS-20 denom traces: native tokens are escrowed, vouchers minted as ibc/<hash>
+    voucher_share: float = 0.5      # Share of generated transfers that send a voucher of another zone's token
+    denom_cache_size: int = 10000   # Denom trace hashes memoized per node
+
+    # Hub scheduling
+    fair_scheduling: bool = False  # Fill hub blocks from per-zone lanes by deficit round-robin instead of FIFO
+    fair_weights: str = ''         # 'z1=2,z2=1'; zones not listed have weight 1
+    fair_rate_limits: str = ''     # 'z1=500'; transactions per second a zone gets into blocks, unlimited if not listed
+    fair_quantum: int = 10         # Transactions a lane of weight 1 may take per round
+
+    # Relayer
+    relayer_clear_interval: float = 10.0
+    relayer_clear_batch: int = 100
+    relayer_passthrough: bool = False  # Relay raw frames over long-lived connections, reading only their headers
+    relayers_per_zone: int = 1         # Relayers between each zone and the hub, each on links of its own (at most 4)
+    relayer_mode: str = 'race'         # race: every relayer relays every message; share: packets are split by sequence
+    receipt_window: int = 0            # Packet receipts kept per channel as a bitmap of this many sequences; 0 keeps all
+
+    # Backpressure
+    backpressure: bool = False         # Bounded per-peer queues and credit-based admission of transfers
+    peer_queue_size: int = 10000       # Messages queued per peer before producers block
+    backpressure_timeout: float = 5.0  # Seconds a producer blocks on a full queue or mempool before dropping
+    credit_poll_interval: float = 0.05 # Seconds between credit queries while the controller waits for a zone
+
+    # Commitment proofs
+    commitment_proofs: bool = False  # Messages carry Merkle proofs against their block's commitment root, verified on receipt
+    proof_cache_size: int = 100000   # Verified headers and proofs remembered so repeats are not verified again
+
+    # Durable state
+    durable_state: bool = False
+    state_dir: str = ''
+    snapshot_interval: int = 100
+    wal_fsync: bool = True
+
+    # Observability
+    profile: bool = False
+    profile_dir: str = ''
+    profile_interval: float = 0.005
+    trace_sample_rate: float = 0.01
+    trace_dir: str = ''
+
+    @classmethod
+    def field_type(cls, field):
+        # Optional[float] -> float
+        return getattr(field.type, '__args__', (field.type,))[0]
+
+    @classmethod
+    def parse_value(cls, field, value):
+        if value is None or not isinstance(value, str):
+            return value
+        field_type = cls.field_type(field)
+        if field_type is bool:
+            return value.strip().lower() in ('1', 'true', 'yes', 'on')
+        return field_type(value)
+
+    @classmethod
+    def add_arguments(cls, parser):
+        """Add --run-config and a --<field> flag for every field to an argparse parser."""
+        group = parser.add_argument_group('run configuration')
+        group.add_argument('--run-config', help='JSON file with run configuration')
+        for field in fields(cls):
+            flag = '--' + field.name.replace('_', '-')
+            if flag in parser._option_string_actions:
+                continue  # The script defines this flag itself
+            if cls.field_type(field) is bool:
+                group.add_argument(flag, dest=field.name, default=None, metavar='{0,1}')
+            else:
+                group.add_argument(flag, dest=field.name, default=None, type=cls.field_type(field))
+
+    @classmethod
+    def load(cls, path=None, args=None):
+        config = cls()
+        path = path or getattr(args, 'run_config', None) or os.environ.get('IBC_SIM_CONFIG')
+        if path:
+            with open(path, 'r') as f:
+                values = json.load(f)
+            for field in fields(cls):
+                if field.name in values:
+                    setattr(config, field.name, values[field.name])
+        for field in fields(cls):
+            value = os.environ.get(f'IBC_SIM_{field.name.upper()}')
+            if value is not None:
+                setattr(config, field.name, cls.parse_value(field, value))
+        if args is not None:
+            for field in fields(cls):
+                value = getattr(args, field.name, None)
+                if value is not None:
+                    setattr(config, field.name, cls.parse_value(field, value))
+        config.resolve_paths()
+        return config
+
+    @classmethod
+    def from_args(cls, description, argv=None):
+        """Parse a script's command line consisting only of run configuration flags."""
+        parser = argparse.ArgumentParser(description=description)
+        cls.add_arguments(parser)
+        return cls.load(args=parser.parse_args(argv))
+
+    def resolve_paths(self):
+        self.logs_dir = self.logs_dir or os.path.join(self.shared_dir, 'logs')
+        self.state_dir = self.state_dir or os.path.join(self.logs_dir, 'state')
+        self.profile_dir = self.profile_dir or os.path.join(self.logs_dir, 'profiles')
+        self.trace_dir = self.trace_dir or os.path.join(self.logs_dir, 'traces')
+
+    def shared_path(self, name):
+        return os.path.join(self.shared_dir, name)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(asdict(self), f, indent=4)
+
+    def to_dict(self):
+        return asdict(self)
+
+if __name__ == '__main__':
+    # For shell scripts: print one field of the config the given flags resolve to, e.g. `run_config.py logs_dir --tps 500`
+    parser = argparse.ArgumentParser(description='Print a field of the resolved run configuration.')
+    parser.add_argument('field', choices=[field.name for field in fields(RunConfig)])
+    RunConfig.add_arguments(parser)
+    args = parser.parse_args()
+    print(getattr(RunConfig.load(args=args), args.field))
@@ -2,28 +2,45 @@
 
 import sys
 import time
+import argparse
 import random
 import asyncio
 import socket
 import json
 import os
-import csv
 from datetime import datetime
 
+from metrics import MetricsRegistry, start_metrics_server
+from run_config import RunConfig
+from tracing import Tracer
+from buffered_writer import BufferedWriter
+from denom import TRANSFER_PORT, native_denom, voucher_path
+from workload import AccountSampler, read_workload
+
 class SimulationController:
-    def __init__(self, duration=60, tps=1000, config_file='zone_configs.json'):
-        self.duration = duration  # Simulation duration in seconds
-        self.tps = tps  # Desired transactions per second
+    def __init__(self, config):
+        self.config = config
+        self.duration = config.duration  # Simulation duration in seconds; None replays the whole workload
+        self.tps = config.tps  # Desired transactions per second
+
+        # Replay mode: transfers come from a recorded workload instead of being generated at `tps`
+        self.replay_file = config.replay_file or None
+        self.time_scale = config.time_scale  # 2.0 replays twice as fast as recorded
+        self.zone_map_file = config.zone_map_file or None
+        self.replay_columns = dict(column.split('=', 1) for column in config.replay_columns.split(',') if column)
+        if self.duration is None and not self.replay_file:
+            self.duration = 5
         self.start_time = None
         self.end_time = None
-        self.transaction_id = 0  # Counter for transaction IDs
+        self.transaction_id = config.first_transaction_id - 1  # Counter for transaction IDs; offset so repeated runs don't collide
 
         # Load zones and nodes from configuration file
         self.zones = []
         self.nodes = {}       # Mapping from zone ID to node IP address
         self.source_ips = {}  # Mapping from zone ID to source IP address
+        self.zone_indexes = {}  # Mapping from zone ID to its index, which numbers the hub's channel to it
 
-        self.cmd_port = 8001
+        self.cmd_port = config.command_port
 
         # Metrics storage
         self.transactions_sent = 0
@@ -37,33 +54,61 @@ class SimulationController:
         # Errors encountered
         self.errors = []
 
+        # Live metrics, served over HTTP while the simulation runs
+        self.metrics = MetricsRegistry('controller')
+        self.sent_counter = self.metrics.counter('controller_transactions_sent_total', 'Transfer commands sent, by source zone')
+        self.completed_counter = self.metrics.counter('controller_transactions_completed_total', 'Transfer commands delivered to the source zone')
+        self.failed_counter = self.metrics.counter('controller_transactions_failed_total', 'Transfer commands that could not be delivered')
+        self.send_duration = self.metrics.histogram('controller_send_seconds', 'Time to deliver one transfer command')
+        self.metrics.gauge('controller_transactions_in_flight', 'Commands sent but not yet delivered or failed',
+                           fn=lambda: self.transactions_sent - self.transactions_completed - self.transactions_failed)
+        self.metrics.gauge('controller_target_tps', 'Configured send rate', fn=lambda: self.tps)
+
+        # Backpressure (--backpressure 1): zones answer every transfer command with their credits, the
+        # transfers they can still take, and transfers to a zone without credits wait here instead of being lost
+        self.backpressure = config.backpressure
+        self.credit_poll_interval = config.credit_poll_interval
+        self.credits = {}    # Zone ID -> credits from the zone's last reply, minus commands sent since
+        self.in_flight = {}  # Zone ID -> commands sent and not yet answered
+        self.polling = set() # Zones whose credits are being queried
+        self.waiting_for_credit = 0
+        self.queue_delays = []
+        self.queue_delay = self.metrics.histogram('controller_queue_seconds', 'Time transfers waited for credit from their source zone')
+        self.busy_counter = self.metrics.counter('controller_transactions_busy_total', 'Transfer commands refused by a full zone and sent again')
+        self.metrics.gauge('controller_waiting_for_credit', 'Transfers waiting for credit', fn=lambda: self.waiting_for_credit)
+        self.metrics.gauge('controller_zone_credits', 'Credits left, by zone',
+                           fn=lambda: {(('zone', zone),): credits for zone, credits in self.credits.items()})
+
         # Load configuration
-        self.load_configuration(config_file)
+        self.load_configuration(config.shared_path(config.zone_config_file))
 
         # Path to shared logs directory
-        self.shared_logs_dir = '/home/ubuntu/IBC_Simulation/mininet_shared/logs'
+        self.shared_logs_dir = config.logs_dir
 
         # Ensure the logs directory exists
         if not os.path.exists(self.shared_logs_dir):
             os.makedirs(self.shared_logs_dir)
 
-        # Initialize simulation transactions file
+        # Transaction initiations are buffered in memory and written by a background thread,
+        # so the event loop never blocks on file I/O
         self.sim_transactions_file = os.path.join(self.shared_logs_dir, 'simulation_transactions.csv')
-        self.init_sim_transactions_file()
+        self.sim_transactions_writer = BufferedWriter(
+            self.sim_transactions_file, 'transaction_id,timestamp,source_zone,destination_zone,amount\n')
+        self.metrics.gauge('controller_log_flush_seconds_total', 'Time spent writing the transaction log',
+                           fn=lambda: self.sim_transactions_writer.flush_time)
 
-    def init_sim_transactions_file(self):
-        # Initialize simulation_transactions.csv file with headers
-        if not os.path.exists(self.sim_transactions_file):
-            with open(self.sim_transactions_file, 'w', newline='') as f:
-                fieldnames = ['transaction_id', 'timestamp', 'source_zone', 'destination_zone', 'amount']
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
+        # With --accounts N, every transfer moves tokens between accounts drawn from --account-distribution
+        self.account_sampler = AccountSampler.from_config(config)
 
-    def load_configuration(self, config_file):
-        # Define the path to the shared directory
-        shared_dir = '/home/ubuntu/IBC_Simulation/mininet_shared'
+        # With --denom-tracing 1, transfers send the source zone's native token or a voucher it holds
+        self.denom_tracing = config.denom_tracing
+        self.voucher_share = config.voucher_share
 
-        config_path = os.path.join(shared_dir, config_file)
+        # A sample of transfers is traced end to end through every node they touch
+        self.trace_sample_rate = config.trace_sample_rate
+        self.tracer = Tracer.from_config(config, 'controller')
+
+    def load_configuration(self, config_path):
         if not os.path.exists(config_path):
             raise FileNotFoundError(f"Configuration file '{config_path}' not found.")
 
@@ -85,20 +130,28 @@ class SimulationController:
 
             # Map zone IDs to controller IPs (source IPs)
             self.source_ips[zone_id] = controller_ip
+            self.zone_indexes[zone_id] = zone_config['index']
 
         print(f"Loaded configuration for zones: {self.zones}")
 
     async def start(self):
+        start_metrics_server(self.metrics, self.config.metrics_port)
         self.start_time = time.time()
-        self.end_time = self.start_time + self.duration
-        print(f"Simulation is running for {self.duration} seconds at {self.tps} TPS...")
-
-        await self.run_simulation()
+        self.end_time = self.start_time + self.duration if self.duration else None
+        if self.replay_file:
+            print(f"Replaying {self.replay_file} at {self.time_scale}x speed...")
+            await self.run_replay()
+        else:
+            print(f"Simulation is running for {self.duration} seconds at {self.tps} TPS...")
+            await self.run_simulation()
         await asyncio.sleep(0)  # Allow any pending tasks to complete
 
         self.print_summary()
+        self.sim_transactions_writer.close()
+        print(f"Transaction log: {self.sim_transactions_writer.stats()}")
         self.log_detailed_data()
         self.log_errors()
+        self.tracer.flush()
 
     async def run_simulation(self):
         delay = 1 / self.tps  # Delay between transactions based on TPS
@@ -107,6 +160,10 @@ class SimulationController:
         tasks = []
 
         while time.time() < self.end_time:
+            if self.backpressure and self.waiting_for_credit >= self.config.peer_queue_size:
+                # Enough transfers are already waiting for credit: stop generating until the zones catch up
+                await asyncio.sleep(self.credit_poll_interval)
+                continue
             now = time.time()
             if now >= next_transaction_time:
                 # Schedule the transaction
@@ -131,6 +188,33 @@ class SimulationController:
         await asyncio.gather(*tasks)
         print("Simulation completed.")
 
+    async def run_replay(self):
+        # Send each recorded transfer at its original offset from the first one, divided by the time scale.
+        # The workload is read lazily and finished tasks are dropped, so memory stays flat for long traces.
+        tasks = set()
+        first_timestamp = None
+        replayed = 0
+
+        for timestamp, source_zone, destination_zone, amount in read_workload(
+                self.replay_file, self.zones, self.zone_map_file, self.replay_columns):
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            send_at = self.start_time + (timestamp - first_timestamp) / self.time_scale
+            if self.end_time is not None and send_at >= self.end_time:
+                break
+            time_to_sleep = send_at - time.time()
+            if time_to_sleep > 0:
+                await asyncio.sleep(time_to_sleep)
+
+            task = asyncio.create_task(self.send_transaction(source_zone, destination_zone, amount))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            replayed += 1
+
+        print(f"Replayed {replayed} transfers. Waiting for completion...")
+        await asyncio.gather(*tasks)
+        print("Replay completed.")
+
     async def create_and_send_transaction(self):
         # Randomly select source and destination zones
         source_zone = random.choice(self.zones)
@@ -139,33 +223,34 @@ class SimulationController:
         # Random amount between 1 and 10 tokens
         amount = random.randint(1, 10)
 
+        await self.send_transaction(source_zone, destination_zone, amount)
+
+    async def send_transaction(self, source_zone, destination_zone, amount):
         # Increment transaction ID
         async with self.lock:
             self.transaction_id += 1
             transaction_id = self.transaction_id
 
         # Log transaction initiation
-        await self.log_transaction_initiation(transaction_id, source_zone, destination_zone, amount)
+        self.log_transaction_initiation(transaction_id, source_zone, destination_zone, amount)
 
         # Send transfer command
         await self.send_transfer_command(source_zone, destination_zone, amount, transaction_id)
 
-    async def log_transaction_initiation(self, transaction_id, source_zone, destination_zone, amount):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        async with self.lock:
-            with open(self.sim_transactions_file, 'a', newline='') as f:
-                fieldnames = ['transaction_id', 'timestamp', 'source_zone', 'destination_zone', 'amount']
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writerow({
-                    'transaction_id': transaction_id,
-                    'timestamp': timestamp,
-                    'source_zone': source_zone,
-                    'destination_zone': destination_zone,
-                    'amount': amount
-                })
+    def log_transaction_initiation(self, transaction_id, source_zone, destination_zone, amount):
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+        self.sim_transactions_writer.write(f"{transaction_id},{timestamp},{source_zone},{destination_zone},{amount}\n")
 
     async def send_transfer_command(self, source_zone, destination_zone, amount, transaction_id):
         command = f"transfer {destination_zone} {amount} {transaction_id}"
+        if self.account_sampler:
+            sender, receiver = self.account_sampler.pair()
+            command += f" {sender} {receiver}"
+        if self.denom_tracing:
+            command += f" denom={self.transfer_denom(source_zone)}"
+        traced = random.random() < self.trace_sample_rate
+        if traced:
+            command += " traced"
 
         node_ip = self.nodes.get(source_zone)
         source_ip = self.source_ips.get(source_zone)
@@ -175,32 +260,40 @@ class SimulationController:
             async with self.lock:
                 self.errors.append(error_msg)
                 self.transactions_failed += 1
+            self.failed_counter.inc()
             return
 
-        send_time = time.time()  # Time when the transaction is sent
-
-        # Update transactions sent per second
         async with self.lock:
             self.transactions_sent += 1
-            second = int(send_time - self.start_time)
-            self.transactions_per_second[second] = self.transactions_per_second.get(second, 0) + 1
+        self.sent_counter.inc(zone=source_zone)
 
         # Send the command to the source node using a per-transaction connection
         try:
-            reader, writer = await asyncio.open_connection(
-                host=node_ip,
-                port=self.cmd_port,
-                local_addr=(source_ip, 0)
-            )
-            writer.write(command.encode())
-            await writer.drain()
+            if self.backpressure:
+                scheduled_time = time.time()
+                await self.acquire_credit(source_zone)
+                queue_delay = time.time() - scheduled_time
+                self.queue_delay.observe(queue_delay)
+                self.queue_delays.append(queue_delay)
 
-            # Not waiting for server response
-            writer.close()
-            await writer.wait_closed()
+            send_time = time.time()  # Time when the transaction is sent
+
+            # Update transactions sent per second; with backpressure this is the throttled rate
+            async with self.lock:
+                second = int(send_time - self.start_time)
+                self.transactions_per_second[second] = self.transactions_per_second.get(second, 0) + 1
+
+            while not await self.deliver_transfer(source_zone, command):
+                # Refused by a full zone: wait for credit and send it again
+                self.busy_counter.inc(zone=source_zone)
+                await self.acquire_credit(source_zone)
 
             receive_time = time.time()  # Time after the data has been sent
             send_duration = receive_time - send_time  # Time taken to send the data
+            self.send_duration.observe(send_duration)
+            self.completed_counter.inc()
+            if traced:
+                self.tracer.span(transaction_id, 'controller send', send_time, receive_time)
 
             # Update metrics
             async with self.lock:
@@ -215,6 +308,75 @@ class SimulationController:
             async with self.lock:
                 self.errors.append(error_msg)
                 self.transactions_failed += 1
+            self.failed_counter.inc()
+
+    def transfer_denom(self, source_zone):
+        """
+        Denom trace for a transfer out of `source_zone`: its native token or, for a
+        `voucher_share` of transfers, the voucher of another zone's token it received
+        through the hub, two hops from its origin. A voucher sent to its origin zone
+        unwinds back to the native token there; the source zone refuses the transfer
+        if it has not received enough of that voucher yet.
+        """
+        if random.random() >= self.voucher_share or len(self.zones) < 2:
+            return native_denom(source_zone)
+        origin = random.choice([zone for zone in self.zones if zone != source_zone])
+        hops = [(TRANSFER_PORT, 'channel-0'), (TRANSFER_PORT, f'channel-{self.zone_indexes[origin]}')]
+        return voucher_path(hops, native_denom(origin))
+
+    async def deliver_command(self, zone, command):
+        # Send one command to a zone; with backpressure, returns the zone's reply
+        reader, writer = await asyncio.open_connection(
+            host=self.nodes[zone],
+            port=self.cmd_port,
+            local_addr=(self.source_ips[zone], 0)
+        )
+        try:
+            writer.write(command.encode())
+            await writer.drain()
+            if self.backpressure:
+                return await asyncio.wait_for(reader.readline(), self.config.backpressure_timeout)
+            return None  # Not waiting for server response
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    async def deliver_transfer(self, zone, command):
+        # Returns False if the zone refused the transfer because its mempool was full
+        if not self.backpressure:
+            await self.deliver_command(zone, command)
+            return True
+        self.in_flight[zone] = self.in_flight.get(zone, 0) + 1
+        try:
+            reply = await self.deliver_command(zone, command)
+        finally:
+            self.in_flight[zone] -= 1
+        return self.update_credits(zone, reply)
+
+    def update_credits(self, zone, reply):
+        # Replies are 'ok <credits>', 'busy <credits>' or 'credits <credits>'. Commands still
+        # in flight were sent after the zone counted its credits, so they are taken off.
+        status, credits = reply.decode().split()
+        self.credits[zone] = int(credits) - self.in_flight.get(zone, 0)
+        return status != 'busy'
+
+    async def acquire_credit(self, zone):
+        # Wait until `zone` can take one more transfer. One waiter polls the zone while it has no credits.
+        self.waiting_for_credit += 1
+        try:
+            while self.credits.get(zone, 1) <= 0:
+                if zone not in self.polling:
+                    self.polling.add(zone)
+                    try:
+                        self.update_credits(zone, await self.deliver_command(zone, 'credits'))
+                    finally:
+                        self.polling.discard(zone)
+                    if self.credits[zone] > 0:
+                        break
+                await asyncio.sleep(self.credit_poll_interval)
+        finally:
+            self.waiting_for_credit -= 1
+        self.credits[zone] = self.credits.get(zone, 1) - 1
 
     def print_summary(self):
         total_transactions = self.transactions_sent
@@ -229,6 +391,9 @@ class SimulationController:
         # Optionally print average send duration if recorded
         average_latency = sum(self.latencies) / len(self.latencies) if self.latencies else 0
         print(f"Average send duration: {average_latency * 1000:.2f} ms")
+        if self.queue_delays:
+            print(f"Average queueing delay for credit: {sum(self.queue_delays) / len(self.queue_delays) * 1000:.2f} ms, "
+                  f"max {max(self.queue_delays) * 1000:.2f} ms")
 
     def log_detailed_data(self):
         # Log detailed metrics to a file
@@ -264,7 +429,11 @@ class SimulationController:
                 print(error)
 
 if __name__ == '__main__':
-    controller = SimulationController(duration=5, tps=1000, config_file='zone_configs.json')
+    parser = argparse.ArgumentParser(description='Generate IBC transfer load against the running topology.')
+    RunConfig.add_arguments(parser)
+    args = parser.parse_args()
+
+    controller = SimulationController(RunConfig.load(args=args))
 
     # Run the simulation using asyncio event loop
-    asyncio.run(controller.start())
\ No newline at end of file
+    asyncio.run(controller.start())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+"""
+Assemble the span records written by every node into a Chrome trace-event file
+that can be opened in Perfetto (ui.perfetto.dev) or chrome://tracing.
+
+Each traced transfer becomes one process in the trace, with one track per node
+it touched, so a slow transfer shows where along the path its time went. Spans
+are numbered as hops in the order they started. The slowest transfers are also
+summarized on the console.
+
+Usage: python3 trace_export.py [trace_dir] [--output FILE] [--slowest N] [--transaction ID ...]
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+
+from run_config import RunConfig
+
+def load_spans(trace_dir):
+    traces = {}
+    for spans_file in sorted(glob.glob(os.path.join(trace_dir, '*.spans.csv'))):
+        with open(spans_file, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                traces.setdefault(row['trace_id'], []).append(
+                    (float(row['start']), float(row['end']), row['node'], row['name']))
+    for spans in traces.values():
+        spans.sort()
+    return traces
+
+def trace_duration(spans):
+    return max(end for _, end, _, _ in spans) - min(start for start, _, _, _ in spans)
+
+def node_order(node):
+    # Tracks in path order: controller, zones, relayers, hub
+    for rank, prefix in enumerate(('controller', 'z', 'r', 'hv')):
+        if node.startswith(prefix):
+            return rank, node
+    return 4, node
+
+def chrome_trace(traces):
+    events = []
+    for pid, (trace_id, spans) in enumerate(traces, start=1):
+        origin = spans[0][0]
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': pid,
+                       'args': {'name': f'transfer {trace_id} ({trace_duration(spans) * 1000:.1f} ms)'}})
+        events.append({'name': 'process_sort_index', 'ph': 'M', 'pid': pid, 'args': {'sort_index': pid}})
+        nodes = sorted({node for _, _, node, _ in spans}, key=node_order)
+        tids = {node: tid for tid, node in enumerate(nodes, start=1)}
+        for node, tid in tids.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': node}})
+            events.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'sort_index': tid}})
+        for hop, (start, end, node, name) in enumerate(spans, start=1):
+            events.append({
+                'name': name, 'cat': node, 'ph': 'X', 'pid': pid, 'tid': tids[node],
+                'ts': start * 1e6, 'dur': max(end - start, 0) * 1e6,
+                'args': {'trace_id': trace_id, 'hop': hop, 'offset_ms': round((start - origin) * 1000, 3)},
+            })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+def main():
+    parser = argparse.ArgumentParser(description='Export traced transfers as a Chrome/Perfetto trace.')
+    # Not dest='trace_dir': an absent positional would overwrite --trace-dir with None
+    parser.add_argument('directory', nargs='?', metavar='trace_dir',
+                        help='Directory to read (default: traces in the logs directory)')
+    parser.add_argument('--output', help='Trace file to write (default: <trace_dir>/trace.json)')
+    parser.add_argument('--slowest', type=int, default=0, help='Only export the N slowest transfers')
+    parser.add_argument('--transaction', nargs='+', help='Only export these transaction IDs')
+    RunConfig.add_arguments(parser)
+    args = parser.parse_args()
+    args.trace_dir = args.directory or RunConfig.load(args=args).trace_dir
+
+    traces = load_spans(args.trace_dir)
+    if not traces:
+        print(f"No spans found in {args.trace_dir}")
+        return
+
+    selected = sorted(traces.items(), key=lambda item: -trace_duration(item[1]))
+    if args.transaction:
+        selected = [(trace_id, spans) for trace_id, spans in selected if trace_id in args.transaction]
+    if args.slowest:
+        selected = selected[:args.slowest]
+
+    output = args.output or os.path.join(args.trace_dir, 'trace.json')
+    with open(output, 'w') as f:
+        json.dump(chrome_trace(selected), f)
+    print(f"Wrote {len(selected)} of {len(traces)} traced transfers to {output}")
+
+    print("\nSlowest transfers:")
+    for trace_id, spans in selected[:10]:
+        hops = ', '.join(f"{node} {name} {(end - start) * 1000:.1f}ms" for start, end, node, name in spans)
+        print(f"  {trace_id}: {trace_duration(spans) * 1000:.1f} ms over {len(spans)} spans ({hops})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+import time
+
+from buffered_writer import BufferedWriter
+from ibc_packet import message_trace, message_type
+
+class Tracer:
+    """
+    Span recorder for sampled transfers.
+
+    The controller decides which transfers are traced (a `trace_sample_rate`
+    fraction of them, 0 disables tracing) and every node records
+    spans only for messages that carry a trace context, so untraced traffic
+    costs a substring check per message. Spans are appended to
+    '<trace_dir>/<node>.spans.csv' through a BufferedWriter, one compact line
+    per span: trace_id,node,name,start,end.
+    """
+
+    max_open_spans = 10000  # Spans begun but never ended (e.g. dropped packets) are evicted past this
+
+    def __init__(self, node_name, trace_dir, flush_interval=1.0):
+        self.node_name = node_name
+        self.trace_dir = trace_dir
+        self.flush_interval = flush_interval
+        self.spans_file = os.path.join(trace_dir, f'{node_name}.spans.csv')
+        self.lock = threading.Lock()
+        self.open_spans = {}  # (trace_id, name) -> start time
+        self.writer = None
+
+    @classmethod
+    def from_config(cls, config, node_name):
+        return cls(node_name, config.trace_dir)
+
+    def begin(self, trace_id, name, start=None):
+        with self.lock:
+            if len(self.open_spans) >= self.max_open_spans:
+                self.open_spans.pop(next(iter(self.open_spans)))
+            self.open_spans[(trace_id, name)] = time.time() if start is None else start
+
+    def end(self, trace_id, name, end=None):
+        with self.lock:
+            start = self.open_spans.pop((trace_id, name), None)
+        if start is not None:
+            self.span(trace_id, name, start, end)
+
+    def span(self, trace_id, name, start, end=None):
+        end = time.time() if end is None else end
+        if self.writer is None:
+            with self.lock:
+                if self.writer is None:
+                    # Created on first use so nodes that never see a traced message write nothing
+                    os.makedirs(self.trace_dir, exist_ok=True)
+                    self.writer = BufferedWriter(self.spans_file, 'trace_id,node,name,start,end\n', self.flush_interval)
+        self.writer.write(f"{trace_id},{self.node_name},{name},{start:.6f},{end:.6f}\n")
+
+    def trace_messages(self, messages, name, start, end=None):
+        """Record a span named '<name> <message type>' for every traced message in a batch."""
+        for message in messages:
+            trace_id = message_trace(message)
+            if trace_id:
+                self.span(trace_id, f'{name} {message_type(message)}', start, end)
+
+    def flush(self):
+        if self.writer:
+            self.writer.flush()
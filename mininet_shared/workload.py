@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import csv
+import json
+import math
+import random
+from datetime import datetime, timezone
+
+# Columns read from exported mainnet transfer logs unless overridden
+DEFAULT_COLUMNS = {'timestamp': 'timestamp', 'source': 'source_chain', 'destination': 'destination_chain', 'amount': 'amount'}
+
+def parse_time(value):
+    """Seconds since the epoch from a Unix timestamp, our log format or an ISO 8601 string."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        return parsed.timestamp()  # Our logs are in local time
+    return parsed.astimezone(timezone.utc).timestamp()
+
+class ZoneMapper:
+    """
+    Maps chain IDs from a recorded workload onto the zones of the running topology.
+
+    Chains listed in the zone map file go to their configured zone; any other
+    chain is assigned the next zone round-robin the first time it is seen, so
+    logs with more chains than zones still spread over every zone.
+    """
+
+    def __init__(self, zones, zone_map_file=None):
+        self.zones = list(zones)
+        self.mapping = {}
+        if zone_map_file:
+            with open(zone_map_file, 'r') as f:
+                self.mapping = json.load(f)
+        self.next_zone = 0
+
+    def zone_for(self, chain_id):
+        if chain_id in self.zones:
+            return chain_id
+        zone = self.mapping.get(chain_id)
+        if zone is None:
+            zone = self.mapping[chain_id] = self.zones[self.next_zone % len(self.zones)]
+            self.next_zone += 1
+        return zone
+
+def read_workload(path, zones, zone_map_file=None, columns=None):
+    """
+    Lazily yield (timestamp, source_zone, destination_zone, amount) from a workload file.
+
+    Accepts the controller's own simulation_transactions.csv or an exported
+    mainnet transfer log whose column names are given by `columns`. Rows are
+    read one at a time so arbitrarily large files replay in constant memory.
+    Transfers that map onto a single zone or onto zones outside the topology
+    are skipped.
+    """
+    columns = dict(DEFAULT_COLUMNS, **(columns or {}))
+    mapper = ZoneMapper(zones, zone_map_file)
+    with open(path, 'r', newline='') as f:
+        reader = csv.DictReader(f)
+        if 'source_zone' in reader.fieldnames:
+            # A recorded simulation run
+            columns = {'timestamp': 'timestamp', 'source': 'source_zone', 'destination': 'destination_zone', 'amount': 'amount'}
+        for row in reader:
+            try:
+                timestamp = parse_time(row[columns['timestamp']])
+                source = mapper.zone_for(row[columns['source']])
+                destination = mapper.zone_for(row[columns['destination']])
+                amount = max(1, int(float(row.get(columns['amount']) or 1)))
+            except (KeyError, ValueError):
+                continue
+            if source == destination or source not in mapper.zones or destination not in mapper.zones:
+                continue
+            yield timestamp, source, destination, amount
+
+class AccountSampler:
+    """
+    Draws sender and receiver accounts for generated transfers (--accounts N).
+
+    'uniform' picks every account equally often. 'zipf' makes account k the
+    k-th most popular with weight 1 / (k + 1) ** skew, drawn by inverting the
+    continuous power law so millions of accounts need no table. 'hotspot'
+    sends a `skew` share of transfers to the hottest 1% of accounts and the
+    rest uniformly over all of them.
+    """
+
+    DISTRIBUTIONS = ('uniform', 'zipf', 'hotspot')
+
+    def __init__(self, accounts, distribution='uniform', skew=1.0, rng=None):
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown account distribution '{distribution}', expected one of {', '.join(self.DISTRIBUTIONS)}")
+        self.accounts = accounts
+        self.distribution = distribution
+        self.skew = skew
+        self.rng = rng or random.Random()
+        self.hot_accounts = max(1, accounts // 100)
+
+    @classmethod
+    def from_config(cls, config):
+        # Accounts are opt-in; returns None when every zone is a single account
+        if config.accounts <= 0:
+            return None
+        return cls(config.accounts, config.account_distribution, config.account_skew)
+
+    def sample(self):
+        if self.distribution == 'zipf':
+            u = self.rng.random()
+            if abs(self.skew - 1.0) < 1e-9:
+                rank = math.pow(self.accounts + 1, u)
+            else:
+                exponent = 1.0 - self.skew
+                rank = math.pow(1.0 + u * (math.pow(self.accounts + 1, exponent) - 1.0), 1.0 / exponent)
+            return min(int(rank) - 1, self.accounts - 1)
+        if self.distribution == 'hotspot' and self.rng.random() < self.skew:
+            return self.rng.randrange(self.hot_accounts)
+        return self.rng.randrange(self.accounts)
+
+    def pair(self):
+        # Sender and receiver are on different zones, so they are drawn independently
+        return self.sample(), self.sample()
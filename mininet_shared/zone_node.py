@@ -1,36 +1,128 @@
 #!/usr/bin/env python3
 
-import sys
+import argparse
 import threading
 import socket
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from block_engine import BlockEngine
+from commitment import CommitmentProver, ProofVerifier
+from denom import DenomTracer, native_denom
+from flow_control import PeerQueue, register_queue_metrics
+from listener_workers import ListenerWorkers
+from ledger import AccountLedger, Ledger
+from state_store import StateStore
+from metrics import MetricsRegistry, start_metrics_server
+from profiler import Profiler
+from receipts import EXPIRED, ReceiptWindows, export_receipts, import_receipts, register_receipt_metrics
+from relayer_set import RelayerSet
+from tracing import Tracer
+from run_config import RunConfig
+from ibc_packet import (Packet, Acknowledgement, QUERY_COMMITMENTS, ACK_SUCCESS, ACK_ERROR, MessageStream, decode_message,
+                        iter_messages, message_type, recv_messages, send_messages)
 
 class ZoneNode:
-    def __init__(self, node_name):
+    def __init__(self, node_name, config=None):
         self.node_name = node_name
+        self.config = config or RunConfig.load()
         self.zone_id = self.node_name.split('_')[0]  # Extract 'z1' from 'z1_v1'
         self.zone_index = int(self.zone_id[1:])  # Extract index 1 from 'z1'
-        self.balance = 100000  # Initial token balance
-        self.ibc_clients = {}  # Clients for other chains
-        self.connections = {}  # Connections to other chains
-        self.channels = {}     # Channels for applications
-        self.listen_port = 8000
+        # With --accounts N the zone holds N accounts numbered from 0, each starting with the initial balance;
+        # otherwise the whole zone is the node's one account
+        self.accounts = self.config.accounts
+        if self.accounts:
+            self.ledger = AccountLedger(self.accounts, self.config.initial_balance)
+        else:
+            self.ledger = Ledger({self.node_name: self.config.initial_balance})
+
+        # With --denom-tracing 1 the ledger above holds the zone's native token, and every IBC voucher the zone
+        # receives gets a ledger of the same kind. Native tokens sent out are escrowed per channel.
+        self.denoms = DenomTracer.from_config(self.config)
+        self.native_denom = native_denom(self.zone_id)
+        self.voucher_ledgers = {}  # ibc/ denom -> ledger of its balances
+        self.escrow = Ledger()     # (channel, denom) -> tokens escrowed for packets sent on the channel
+        self.listen_port = self.config.ibc_port
+        self.query_port = self.config.query_port  # Relayers query pending packet commitments here
+
+        # IBC state towards the hub. The hub opens one channel per zone, numbered by zone index.
+        hub_index = self.zone_index - 1
+        self.ibc_clients = {  # Clients for other chains
+            '07-tendermint-0': {'chain_id': 'hub', 'latest_height': 0},
+        }
+        self.connections = {  # Connections to other chains
+            'connection-0': {'client_id': '07-tendermint-0', 'counterparty_connection_id': f'connection-{hub_index}'},
+        }
+        self.channels = {     # Channels for applications
+            'channel-0': {'port_id': 'transfer', 'connection_id': 'connection-0',
+                          'counterparty_channel_id': f'channel-{hub_index}', 'next_sequence_send': 1},
+        }
+        self.packet_commitments = {}  # (channel, sequence) -> Packet sent and not yet acknowledged
+        # (channel, sequence) -> acknowledgement result of a received packet; with --receipt-window N only
+        # the latest N sequences of each channel are kept, in bitmaps
+        self.packet_receipts = ReceiptWindows.from_config(self.config) or {}
+        self.packet_timeout = self.config.packet_timeout  # Seconds
+        self.ibc_lock = threading.Lock()  # Guards sequences, commitments and receipts
+
+        # Connections are handled concurrently by a pool of worker threads
+        self.listener_pool = ThreadPoolExecutor(max_workers=self.config.listener_workers)
+        self.relayers = RelayerSet.from_config(self.config, self.zone_index, 'zone')  # Zone-side IPs of the zone's relayers
+        self.relayer_streams = {}  # Relayer IP -> MessageStream, with --relayer-passthrough 1
+        self.relayer_streams_lock = threading.Lock()
+
+        # Optional listener worker processes (--node-workers N); this process remains the only writer
+        self.listener_workers = ListenerWorkers.from_config(self.config, log=self.log)
 
         # Set up logging
-        self.logs_dir = '/home/ubuntu/IBC_Simulation/mininet_shared/logs'
+        self.logs_dir = self.config.logs_dir
         if not os.path.exists(self.logs_dir):
             os.makedirs(self.logs_dir)
         self.log_file = os.path.join(self.logs_dir, f'{self.node_name}_transfer_log.txt')
         self.transaction_results_file = os.path.join(self.logs_dir, f'{self.node_name}_transaction_results.csv')
+        self.ack_results_file = os.path.join(self.logs_dir, f'{self.node_name}_ack_results.csv')
         self.init_transaction_results_file()
         self.log('Node initialized.')
+        self.tracer = Tracer.from_config(self.config, self.node_name)
+
+        # Optional profiling (--profile 1): hot paths are wrapped before anything binds them
+        self.profiler = Profiler.from_config(self.config, self.node_name, log=self.log)
+        if self.profiler:
+            self.profiler.instrument(self, ['log', 'handle_ibc_connection', 'handle_ibc_message', 'handle_command_connection',
+                                            'commit_block', 'send_packet', 'recv_packet', 'acknowledge_packet',
+                                            'send_to_relayer', 'verify_proofs'])
+
+        # Transfers and received packets take effect when their block is committed
+        self.block_engine = BlockEngine.from_config(self.config, self.commit_block, log=self.log)
+        self.init_metrics()
+
+        # Optional backpressure (--backpressure 1): messages for the relayer go through a bounded queue,
+        # IBC messages wait for mempool space, and transfer commands are answered with the zone's credits
+        self.submit_wait = self.config.backpressure_timeout if self.config.backpressure else 0
+        self.relayer_queue = PeerQueue.from_config(self.config, 'relayer', self.deliver_to_relayer,
+                                                   delay_histogram=self.queue_delay, log=self.log)
+        self.peer_queues['relayer'] = self.relayer_queue
+
+        # Optional commitment proofs (--commitment-proofs 1): each block's messages to the relayer carry
+        # membership proofs against its commitment tree, and messages from the hub are verified before they apply
+        self.prover = CommitmentProver.from_config(self.config, self.zone_id, self.metrics)
+        self.verifier = ProofVerifier.from_config(self.config, self.metrics)
+
+        # Optional durable state: committed blocks are logged and replayed on restart
+        self.commit_lock = threading.Lock()
+        self.state_store = StateStore.from_config(self.config, self.node_name, log=self.log)
+        if self.state_store:
+            self.restore_state()
 
     def init_transaction_results_file(self):
         # Initialize transaction_results.csv file with headers
         if not os.path.exists(self.transaction_results_file):
             with open(self.transaction_results_file, 'w') as f:
                 f.write('transaction_id,timestamp,source_zone,destination_zone,amount\n')
+        if not os.path.exists(self.ack_results_file):
+            with open(self.ack_results_file, 'w') as f:
+                f.write('transaction_id,timestamp,result\n')
 
     def log(self, message):
         timestamp = time.strftime("[%Y-%m-%d %H:%M:%S]")
@@ -38,14 +130,55 @@ class ZoneNode:
             f.write(f"{timestamp} {message}\n")
         print(f"{timestamp} {message}")
 
+    def init_metrics(self):
+        self.metrics = MetricsRegistry(self.node_name)
+        self.packets_in = self.metrics.counter('ibc_packets_in_total', 'IBC messages received, by type')
+        self.packets_out = self.metrics.counter('ibc_packets_out_total', 'IBC messages sent, by type')
+        self.bytes_in = self.metrics.counter('ibc_bytes_in_total', 'Bytes of IBC messages received')
+        self.bytes_out = self.metrics.counter('ibc_bytes_out_total', 'Bytes of IBC messages sent')
+        self.forward_errors = self.metrics.counter('ibc_forward_errors_total', 'IBC messages that could not be sent')
+        self.block_processing = self.metrics.histogram('block_processing_seconds', 'Time to apply a committed block and send its messages')
+        self.metrics.gauge('block_height', 'Latest committed block height', fn=lambda: self.block_engine.height)
+        self.metrics.gauge('mempool_depth', 'Transactions waiting in the mempool', fn=self.block_engine.mempool_depth)
+        self.metrics.gauge('mempool_rejected_total', 'Transactions rejected because the mempool was full', fn=lambda: self.block_engine.txs_rejected)
+        self.metrics.gauge('pending_packet_commitments', 'Packets sent and not yet acknowledged', fn=lambda: len(self.packet_commitments))
+        self.metrics.gauge('account_balance', 'Balance of the node account, or total of all accounts', fn=lambda: self.balance)
+        if self.denoms:
+            self.denoms.register_metrics(self.metrics)
+            self.metrics.gauge('escrowed_tokens', 'Tokens escrowed for transfers out of the zone, by channel and denom',
+                               fn=lambda: {(('channel', channel), ('denom', denom)): amount
+                                           for (channel, denom), amount in self.escrow.snapshot().items()})
+        self.duplicates = self.metrics.counter('duplicate_messages_total', 'Packets and acknowledgements received more than once, by type')
+        if isinstance(self.packet_receipts, ReceiptWindows):
+            register_receipt_metrics(self.metrics, lambda: self.packet_receipts)
+        self.insufficient_balance = self.metrics.counter('insufficient_balance_total', 'Transfers refused at commit because the sender could not cover them')
+        self.metrics.gauge('transfer_credits', 'Transfers the zone can accept, as reported to the controller', fn=self.credits)
+        self.peer_queues = {}
+        self.queue_delay = register_queue_metrics(self.metrics, self.peer_queues)
+
     def start(self):
-        threading.Thread(target=self.ibc_listener, daemon=True).start()
+        if self.listener_workers:
+            # Forked before the block, metrics and listener threads start
+            self.listener_workers.start(self.handle_worker_batch)
+        if self.profiler:
+            self.profiler.start()
+        self.block_engine.start()
+        start_metrics_server(self.metrics, self.config.metrics_port, self.log)
+        if not self.listener_workers:
+            threading.Thread(target=self.ibc_listener, daemon=True).start()
+        threading.Thread(target=self.query_listener, daemon=True).start()
         threading.Thread(target=self.command_listener, daemon=True).start()
         self.run_node()
 
     def run_node(self):
         while True:
-            self.log(f"Running Zone node. Balance: {self.balance}")
+            self.log(f"Running Zone node. Balance: {self.balance}, height: {self.block_engine.height}, mempool: {self.block_engine.mempool_depth()}")
+            if self.state_store:
+                self.log(f"State store: {self.state_store.stats()}")
+            if self.denoms:
+                self.log(f"Denoms: {self.denoms.stats()}")
+            if self.relayer_queue:
+                self.log(f"Peer queue {self.relayer_queue.stats()}")
             time.sleep(10)
 
     def ibc_listener(self):
@@ -56,83 +189,462 @@ class ZoneNode:
             self.log(f"Listening for IBC messages on port {self.listen_port}")
             while True:
                 conn, addr = s.accept()
-                data = conn.recv(1024)
-                if data:
-                    message = data.decode()
-                    self.log(f"Received IBC message: {message} from {addr}")
-                    self.handle_ibc_message(message)
+                if self.config.relayer_passthrough:
+                    # Pass-through relayers keep their connection open, so it gets a reader of its own
+                    threading.Thread(target=self.handle_ibc_connection, args=(conn, addr), daemon=True).start()
+                else:
+                    self.listener_pool.submit(self.handle_ibc_connection, conn, addr)
+
+    def relayer_stream(self, relayer_ip):
+        # Long-lived connection to a pass-through relayer
+        with self.relayer_streams_lock:
+            stream = self.relayer_streams.get(relayer_ip)
+            if stream is None:
+                stream = self.relayer_streams[relayer_ip] = MessageStream(relayer_ip, self.config.ibc_port)
+            return stream
+
+    def handle_ibc_connection(self, conn, addr):
+        try:
+            for message in iter_messages(conn):
+                self.log(f"Received IBC message: {message} from {addr}")
+                self.packets_in.inc(type=message_type(message))
+                self.bytes_in.inc(len(message) + 1)
+                self.handle_ibc_message(message)
+        except Exception as e:
+            self.log(f"Error handling connection from {addr}: {e}")
+        finally:
+            conn.close()
+
+    def handle_worker_batch(self, txs, counts, size):
+        # Messages read, logged and decoded by a listener worker process
+        for msg_type, count in counts.items():
+            self.packets_in.inc(count, type=msg_type)
+        self.bytes_in.inc(size)
+        for tx in txs:
+            self.submit_tx(tx)
+
+    def query_listener(self):
+        # Answer relayer queries for packets that are committed but not yet acknowledged
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.bind(('', self.query_port))
+            s.listen()
+            self.log(f"Listening for queries on port {self.query_port}")
+            while True:
+                conn, addr = s.accept()
+                try:
+                    response = []
+                    for query in recv_messages(conn):
+                        parts = query.strip().split(',')
+                        if parts[0] == QUERY_COMMITMENTS and len(parts) == 2:
+                            response.extend(self.pending_messages(parts[1]))
+                        else:
+                            self.log(f"Unknown query: {query}")
+                    if response:
+                        conn.sendall(('\n'.join(response) + '\n').encode())
+                except Exception as e:
+                    self.log(f"Error answering query from {addr}: {e}")
                 conn.close()
 
+    def pending_packets(self, channel_id):
+        # Copy first: commitments are modified by the block thread
+        commitments = dict(self.packet_commitments)
+        return [commitments[key] for key in sorted(commitments) if key[0] == channel_id]
+
+    def pending_messages(self, channel_id):
+        packets = self.pending_packets(channel_id)
+        if self.prover:
+            return self.prover.pending_messages(packets)
+        return [packet.encode() for packet in packets]
+
     def handle_ibc_message(self, message):
-        # Simplified message handling
-        if message.startswith('IBC_TRANSFER'):
-            # Message format: 'IBC_TRANSFER,<amount>,<sender_zone>,<sender>,<destination_zone>,<transaction_id>'
-            parts = message.strip().split(',')
-            if len(parts) == 6:
-                _, amount_str, sender_zone, sender, dest_zone, transaction_id = parts
-                amount = int(amount_str)
-                self.balance += amount
-                timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-                self.log(f"Received {amount} tokens from {sender} (Zone {sender_zone}). New balance: {self.balance}")
-
-                # Log transaction completion
-                with open(self.transaction_results_file, 'a') as f:
-                    f.write(f"{transaction_id},{timestamp},{sender_zone},{dest_zone},{amount}\n")
-            else:
-                self.log(f"Malformed IBC_TRANSFER message: {message}")
+        # Validate the message and queue it for the next block
+        try:
+            tx = decode_message(message)
+        except ValueError as e:
+            self.log(str(e))
+            return
+        self.submit_tx(tx)
+
+    def submit_tx(self, tx):
+        if tx[0] in ('recv', 'ack') and tx[1].trace_id:
+            self.tracer.begin(tx[1].trace_id, f'block {tx[0]}')
+        if not self.block_engine.submit(tx, wait=self.submit_wait):
+            self.log(f"Mempool full, dropping IBC message: {self.encode_tx(tx)}")
+
+    def initiate_transfer(self, dest_zone, amount, transaction_id, trace_id=None, sender='', receiver='', denom=''):
+        # The transfer is queued as a transaction; the balance is checked and debited at commit.
+        # Returns False if it was rejected.
+        if trace_id:
+            self.tracer.begin(trace_id, 'block send')
+        if not self.block_engine.submit(('send', (dest_zone, amount, transaction_id, trace_id, sender, receiver, denom))):
+            self.log(f"Mempool full, dropping transfer {transaction_id}")
+            return False
+        return True
+
+    def credits(self):
+        # Transfers that fit before the mempool or the queue towards the relayer is full
+        credits = self.block_engine.free_slots()
+        if self.relayer_queue:
+            credits = min(credits, self.relayer_queue.credits)
+        return credits
+
+    def commit_block(self, height, txs, commit_time):
+        start = time.perf_counter()
+        if self.state_store is None:
+            self.finish_block(height, *self.apply_block(height, txs, commit_time))
         else:
-            self.log(f"Unknown IBC message type: {message}")
-
-    def initiate_transfer(self, dest_zone, amount, transaction_id):
-        # Reduce balance
-        if self.balance >= amount:
-            self.balance -= amount
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            self.log(f"Initiating transfer {transaction_id} of {amount} tokens to Zone {dest_zone}. New balance: {self.balance}")
-
-            # Send IBC packet to relayer
-            relayer_ip = f'10.0.{self.zone_index}.10'  # Adjust as per your IP scheme
-            relayer_port = 8000
-            packet = f'IBC_TRANSFER,{amount},{self.zone_id},{self.node_name},{dest_zone},{transaction_id}'
+            # With durable state, blocks are applied and logged one at a time, before their effects leave the node
+            with self.commit_lock:
+                effects = self.apply_block(height, txs, commit_time)
+                self.state_store.append_block(height, commit_time, [self.encode_tx(tx) for tx in txs])
+                if self.state_store.snapshot_due():
+                    self.state_store.snapshot(self.export_state(height))
+            self.finish_block(height, *effects)
+        self.block_processing.observe(time.perf_counter() - start)
+
+    def apply_block(self, height, txs, commit_time, verify=True):
+        # Apply a block's transactions. Returns the result lines and messages it produced.
+        timestamp = datetime.fromtimestamp(commit_time).strftime("%Y-%m-%d %H:%M:%S.%f")
+        results = []
+        ack_results = []
+        outgoing = []
+        if self.verifier and verify:
+            txs = self.verify_proofs(txs)
+        for kind, payload in txs:
+            if kind in ('recv', 'ack') and payload.trace_id:
+                self.tracer.end(payload.trace_id, f'block {kind}', commit_time)
+            if kind == 'send':
+                packet = self.send_packet(payload, height, commit_time)
+                if packet:
+                    outgoing.append(packet.encode())
+            elif kind == 'recv':
+                ack, received = self.recv_packet(payload, height, commit_time)
+                if received:
+                    results.append(f"{payload.transaction_id},{timestamp},{payload.sender_zone},{payload.destination_zone},{payload.amount}\n")
+                if ack:
+                    outgoing.append(ack.encode())
+            elif kind == 'ack':
+                if self.acknowledge_packet(payload, height):
+                    ack_results.append(f"{payload.transaction_id},{timestamp},{payload.result}\n")
+            elif kind == 'update_client':
+                self.update_client(*payload)
+        return results, ack_results, outgoing
+
+    def verify_proofs(self, txs):
+        # Trust the roots of the hub's headers in the block, then check the proofs of its packets and
+        # acknowledgements in one batch. Returns the transactions that passed.
+        for kind, payload in txs:
+            if kind == 'header' and not self.verifier.verify_header(*payload):
+                self.log(f"Invalid header from {payload[0]} at height {payload[1]}")
+        messages = [payload for kind, payload in txs if kind in ('recv', 'ack')]
+        valid = iter(self.verifier.verify_batch([('hub', message.height, *(message.proof or (None, None)), message.proof_root)
+                                                 for message in messages]))
+        verified = []
+        for kind, payload in txs:
+            if kind in ('recv', 'ack') and not next(valid):
+                self.log(f"Invalid proof for {kind} {payload.source_channel}/{payload.sequence} "
+                         f"(transaction {payload.transaction_id}) at hub height {payload.height}, dropping it")
+            elif kind != 'header':
+                verified.append((kind, payload))
+        return verified
+
+    def finish_block(self, height, results, ack_results, outgoing):
+        # Log transaction completions and acknowledgements, timestamped at block commit
+        if results:
+            with open(self.transaction_results_file, 'a') as f:
+                f.writelines(results)
+        if ack_results:
+            with open(self.ack_results_file, 'a') as f:
+                f.writelines(ack_results)
+
+        if outgoing:
+            if self.prover:
+                header, outgoing = self.prover.prove_block(height, outgoing)
+                outgoing = [header] + outgoing
+            self.send_to_relayer(outgoing)
+
+    def send_packet(self, transfer, height, commit_time):
+        # Debit the sender and commit a packet on the hub channel
+        dest_zone, amount, transaction_id, trace_id, sender, receiver, denom = transfer
+        if trace_id:
+            self.tracer.end(trace_id, 'block send', commit_time)
+        account = self.account(sender)
+        channel_id = 'channel-0'
+        try:
+            denom, trace, source = self.send_denom(denom, channel_id)
+        except KeyError:
+            self.log(f"Unknown denom {denom}, dropping transfer {transaction_id}")
+            return None
+        ledger = self.denom_ledger(denom, create=False)
+        if ledger is None or not ledger.debit(account, amount):
+            self.insufficient_balance.inc()
+            self.log(f"Insufficient balance in account {account} to transfer {amount} {denom or 'tokens'}")
+            return None
+        if source:
+            self.escrow.credit((channel_id, denom), amount)
+
+        with self.ibc_lock:
+            channel = self.channels[channel_id]
+            sequence = channel['next_sequence_send']
+            channel['next_sequence_send'] += 1
+            packet = Packet(sequence, channel_id, channel['counterparty_channel_id'], amount, self.zone_id,
+                            str(account), dest_zone, transaction_id, commit_time + self.packet_timeout, height, trace_id,
+                            receiver, trace)
+            self.packet_commitments[(channel_id, sequence)] = packet
+        self.log(f"Initiating transfer {transaction_id} of {amount} tokens to Zone {dest_zone} as packet {channel_id}/{sequence} in block {height}. New balance of {account}: {ledger.balance(account)}")
+        return packet
+
+    def recv_packet(self, packet, height, commit_time):
+        # Returns the acknowledgement to relay back and whether the packet was newly received
+        key = (packet.destination_channel, packet.sequence)
+        account = self.account(packet.receiver)
+        denom = None
+        with self.ibc_lock:
+            result = self.packet_receipts.get(key)
+            if result is None and not packet.has_timed_out(commit_time):
+                if account is not None:
+                    denom = self.receive_denom(packet)
+                self.packet_receipts[key] = ACK_SUCCESS if denom is not None else ACK_ERROR
+        if result == EXPIRED:
+            # Older than the receipt window: it may or may not have been received, so it is dropped unanswered
+            self.duplicates.inc(type='recv')
+            self.log(f"Packet {packet.destination_channel}/{packet.sequence} (transaction {packet.transaction_id}) is below the receipt window, dropping it")
+            return None, False
+        if result is not None:
+            # Already received: write the same acknowledgement again so the relayer can deliver it
+            self.duplicates.inc(type='recv')
+            self.log(f"Duplicate packet {packet.destination_channel}/{packet.sequence} (transaction {packet.transaction_id})")
+            return Acknowledgement.for_packet(packet, result, height), False
+        if packet.has_timed_out(commit_time):
+            self.log(f"Packet {packet.destination_channel}/{packet.sequence} (transaction {packet.transaction_id}) timed out")
+            return Acknowledgement.for_packet(packet, 'timeout', height), False
+        if account is None:
+            self.log(f"No account {packet.receiver} for packet {packet.destination_channel}/{packet.sequence} (transaction {packet.transaction_id})")
+            return Acknowledgement.for_packet(packet, ACK_ERROR, height), False
+        if denom is None:
+            self.log(f"Escrow cannot cover {packet.amount} {packet.denom} returning in packet {packet.destination_channel}/{packet.sequence} (transaction {packet.transaction_id})")
+            return Acknowledgement.for_packet(packet, ACK_ERROR, height), False
+
+        ledger = self.denom_ledger(denom)
+        ledger.credit(account, packet.amount)
+        self.log(f"Received {packet.amount} {denom or 'tokens'} from {packet.sender} (Zone {packet.sender_zone}) in block {height}. New balance of {account}: {ledger.balance(account)}")
+        return Acknowledgement.for_packet(packet, ACK_SUCCESS, height), True
+
+    def acknowledge_packet(self, ack, height):
+        # Delete the commitment, refunding the sender if the packet failed or timed out
+        packet = self.packet_commitments.pop((ack.source_channel, ack.sequence), None)
+        if packet is None:
+            self.duplicates.inc(type='ack')
+            self.log(f"No commitment for packet {ack.source_channel}/{ack.sequence}, ignoring {ack.result} acknowledgement")
+            return False
+        if self.prover:
+            self.prover.forget(ack.source_channel, ack.sequence)
+        if ack.success:
+            self.log(f"Transfer {ack.transaction_id} acknowledged in block {height}")
+        else:
+            account = self.account(packet.sender)
+            denom, _, source = self.send_denom(packet.denom, packet.source_channel)
+            if source:
+                self.escrow.debit((packet.source_channel, denom), packet.amount, allow_overdraft=True)
+            ledger = self.denom_ledger(denom)
+            ledger.credit(account, packet.amount)
+            self.log(f"Transfer {ack.transaction_id} failed ({ack.result}), refunded {packet.amount} {denom or 'tokens'}. New balance of {account}: {ledger.balance(account)}")
+        return True
+
+    def send_denom(self, denom, channel_id):
+        # (local denom, trace for the packet, whether the tokens are escrowed) of a transfer; raises KeyError
+        # for an unknown ibc/ denom. Without denom tracing everything is the one unnamed token.
+        if not self.denoms:
+            return '', '', False
+        return self.denoms.send(denom or self.native_denom, channel_id)
+
+    def receive_denom(self, packet):
+        # Denom to credit for a received packet. Tokens returning to the zone come out of escrow; None if
+        # the escrow cannot cover them. Anything else is minted as a voucher.
+        if not self.denoms:
+            return ''
+        denom, returning = self.denoms.receive(packet.denom or self.native_denom, packet.source_channel, packet.destination_channel)
+        if returning and not self.escrow.debit((packet.destination_channel, denom), packet.amount):
+            return None
+        return denom
+
+    def denom_ledger(self, denom, create=True):
+        # Ledger holding `denom`; vouchers get theirs when first received
+        if denom in ('', self.native_denom):
+            return self.ledger
+        ledger = self.voucher_ledgers.get(denom)
+        if ledger is None and create:
+            ledger = self.voucher_ledgers[denom] = AccountLedger(self.accounts) if self.accounts else Ledger()
+        return ledger
+
+    def encode_tx(self, tx):
+        kind, payload = tx
+        if kind in ('recv', 'ack'):
+            return [kind, payload.encode()]
+        return [kind, list(payload)]
+
+    def decode_tx(self, record):
+        kind, payload = record
+        if kind == 'recv':
+            return kind, Packet.decode(payload)
+        if kind == 'ack':
+            return kind, Acknowledgement.decode(payload)
+        return kind, tuple(payload)
+
+    def export_state(self, height):
+        with self.ibc_lock:
+            return {
+                'height': height,
+                'balances': self.ledger.encode() if self.accounts else self.ledger.snapshot(),
+                'vouchers': {denom: ledger.encode() if self.accounts else ledger.snapshot()
+                             for denom, ledger in self.voucher_ledgers.items()},
+                'escrow': [[channel, denom, amount] for (channel, denom), amount in self.escrow.snapshot().items()],
+                'denom_traces': dict(self.denoms.traces) if self.denoms else {},
+                'ibc_clients': {k: dict(v) for k, v in self.ibc_clients.items()},
+                'channels': {k: dict(v) for k, v in self.channels.items()},
+                'packet_commitments': [packet.encode() for packet in self.packet_commitments.values()],
+                'packet_receipts': export_receipts(self.packet_receipts),
+            }
+
+    def import_state(self, state):
+        self.ledger = AccountLedger.decode(state['balances']) if self.accounts else Ledger(state['balances'])
+        self.voucher_ledgers = {denom: AccountLedger.decode(balances) if self.accounts else Ledger(balances)
+                                for denom, balances in state.get('vouchers', {}).items()}
+        self.escrow = Ledger({(channel, denom): amount for channel, denom, amount in state.get('escrow', [])})
+        if self.denoms:
+            self.denoms.traces.update(state.get('denom_traces', {}))
+        self.ibc_clients = state['ibc_clients']
+        self.channels = state['channels']
+        self.packet_commitments = {}
+        for message in state['packet_commitments']:
+            packet = Packet.decode(message)
+            self.packet_commitments[(packet.source_channel, packet.sequence)] = packet
+        self.packet_receipts = import_receipts(state['packet_receipts'], self.config.receipt_window)
+
+    def restore_state(self):
+        # Load the latest snapshot and replay the blocks logged after it; effects were already sent before the restart
+        state, blocks = self.state_store.load()
+        height = 0
+        if state:
+            self.import_state(state)
+            height = state['height']
+        for block in blocks:
+            self.apply_block(block['height'], [self.decode_tx(tx) for tx in block['txs']], block['time'], verify=False)
+            height = max(height, block['height'])
+        self.block_engine.height = height
+        self.log(f"Restored state at height {height}, replayed {len(blocks)} blocks. Balance: {self.balance}")
+
+    @property
+    def balance(self):
+        if self.accounts:
+            return self.ledger.total_supply()
+        return self.ledger.balance(self.node_name)
+
+    def account(self, name):
+        # Ledger key of an account named in a transfer or packet; None if the zone has no such account
+        if not self.accounts:
+            return self.node_name
+        try:
+            account = int(name or 0)
+        except ValueError:
+            return None
+        return account if 0 <= account < self.accounts else None
+
+    def update_client(self, chain_id, height):
+        with self.ibc_lock:
+            for client in self.ibc_clients.values():
+                if client['chain_id'] == chain_id and height > client['latest_height']:
+                    client['latest_height'] = height
+
+    def send_to_relayer(self, messages):
+        # Send IBC packets and acknowledgements to the relayers, in one connection each
+        if self.relayer_queue:
+            # Blocks the block thread while the relayer is behind; retried by the queue's sender
+            if not self.relayer_queue.put(messages):
+                self.forward_errors.inc(len(messages))
+                self.log(f"Relayer queue full for {self.config.backpressure_timeout}s, dropping {len(messages)} IBC messages")
+            return
+        try:
+            self.deliver_to_relayer(messages)
+        except Exception as e:
+            self.forward_errors.inc(len(messages))
+            self.log(f"Error sending IBC messages to relayer: {e}")
+
+    def deliver_to_relayer(self, messages):
+        # With redundant relayers, a relayer that cannot be reached is skipped and its messages left to
+        # packet clearing; only a lone relayer's errors are raised to the caller
+        relayer_port = self.config.ibc_port
+        start = time.time()
+        routes = self.relayers.routes(messages)
+        for relayer_ip, batch in routes:
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    self.log(f"Connecting to relayer at {relayer_ip}:{relayer_port}")
-                    s.connect((relayer_ip, relayer_port))
-                    s.sendall(packet.encode())
-                    self.log(f"Sent IBC packet {transaction_id} to relayer at {relayer_ip}:{relayer_port}")
+                if self.config.relayer_passthrough:
+                    self.relayer_stream(relayer_ip).send(batch)
+                else:
+                    send_messages(relayer_ip, relayer_port, batch)
             except Exception as e:
-                self.log(f"Error sending IBC packet to relayer: {e}")
-        else:
-            self.log(f"Insufficient balance to transfer {amount} tokens")
+                if len(routes) == 1:
+                    raise
+                self.forward_errors.inc(len(batch))
+                self.log(f"Error sending IBC messages to relayer at {relayer_ip}: {e}")
+                continue
+            for message in batch:
+                self.packets_out.inc(type=message_type(message))
+            self.bytes_out.inc(sum(len(message) + 1 for message in batch))
+            self.log(f"Sent {len(batch)} IBC messages to relayer at {relayer_ip}:{relayer_port}")
+        self.tracer.trace_messages(messages, 'send', start)
 
     def command_listener(self):
         # Listen for commands on a separate port
-        cmd_port = 8001
+        cmd_port = self.config.command_port
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             s.bind(('', cmd_port))
             s.listen()
             self.log(f"Listening for transfer commands on port {cmd_port}")
             while True:
                 conn, addr = s.accept()
-                data = conn.recv(1024)
-                if data:
-                    message = data.decode()
-                    self.log(f"Received command: {message}")
-                    cmd_parts = message.strip().split()
-                    if cmd_parts[0] == 'transfer' and len(cmd_parts) == 4:
-                        destination_zone = cmd_parts[1]
-                        amount = int(cmd_parts[2])
-                        transaction_id = cmd_parts[3]
-                        self.initiate_transfer(destination_zone, amount, transaction_id)
-                    elif cmd_parts[0] == 'balance':
-                        self.log(f"Current balance: {self.balance}")
-                    else:
-                        self.log(f"Unknown command: {message}")
-                conn.close()
+                self.listener_pool.submit(self.handle_command_connection, conn)
+
+    def handle_command_connection(self, conn):
+        try:
+            data = conn.recv(1024)
+            if data:
+                message = data.decode()
+                self.log(f"Received command: {message}")
+                cmd_parts = message.strip().split()
+                # 'transfer <dest> <amount> <id> [<sender> <receiver>] [denom=<trace>] [traced]'; accounts are
+                # given with --accounts N, denoms with --denom-tracing 1
+                traced = cmd_parts[-1:] == ['traced']
+                options = cmd_parts[4:len(cmd_parts) - traced]
+                denom = next((option[len('denom='):] for option in options if option.startswith('denom=')), '')
+                accounts = [option for option in options if not option.startswith('denom=')]
+                if cmd_parts[0] == 'transfer' and len(accounts) in (0, 2) and len(cmd_parts) >= 4:
+                    destination_zone = cmd_parts[1]
+                    amount = int(cmd_parts[2])
+                    transaction_id = cmd_parts[3]
+                    trace_id = transaction_id if traced else None
+                    sender, receiver = accounts or ('', '')
+                    if self.account(sender) is None:
+                        raise ValueError(f"no account {sender}")
+                    accepted = self.initiate_transfer(destination_zone, amount, transaction_id, trace_id, sender, receiver, denom)
+                    if self.config.backpressure:
+                        # The controller waits for this reply and stops sending while credits are 0
+                        conn.sendall(f"{'ok' if accepted else 'busy'} {self.credits()}\n".encode())
+                elif cmd_parts[0] == 'credits':
+                    conn.sendall(f"credits {self.credits()}\n".encode())
+                elif cmd_parts[0] == 'balance':
+                    self.log(f"Current balance: {self.balance}")
+                else:
+                    self.log(f"Unknown command: {message}")
+        except Exception as e:
+            self.log(f"Error handling command: {e}")
+        finally:
+            conn.close()
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python3 zone_node.py <node_name>")
-        sys.exit(1)
-    node = ZoneNode(sys.argv[1])
+    parser = argparse.ArgumentParser(description='Run a zone node.')
+    parser.add_argument('node_name', help="Node name, e.g. 'z1_v1'")
+    RunConfig.add_arguments(parser)
+    args = parser.parse_args()
+    node = ZoneNode(args.node_name, RunConfig.load(args=args))
     node.start()
\ No newline at end of file
@@ -1,20 +1,29 @@
 #!/usr/bin/env python3
 
 import csv
+import json
+import os
+import sys
 from datetime import datetime
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mininet_shared'))
+from run_config import RunConfig
+
 def parse_timestamp(timestamp_str):
+    # Block commit timestamps carry microseconds; older logs only have whole seconds
+    if '.' in timestamp_str:
+        return datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S.%f")
     return datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
 
 def main():
-    # Paths to the log files
-    sim_log_file = '/home/ubuntu/mn_blockchain/cosmos_complex/mininet_shared/logs/simulation_transactions.csv'
-    result_files = [
-        '/home/ubuntu/mn_blockchain/cosmos_complex/mininet_shared/logs/za_v1_transaction_results.csv',
-        '/home/ubuntu/mn_blockchain/cosmos_complex/mininet_shared/logs/zb_v1_transaction_results.csv',
-        '/home/ubuntu/mn_blockchain/cosmos_complex/mininet_shared/logs/zc_v1_transaction_results.csv',
-    ]
+    config = RunConfig.from_args('Plot transfers and latencies of the last run.')
+
+    # Paths to the log files; every zone validator writes its own results
+    sim_log_file = os.path.join(config.logs_dir, 'simulation_transactions.csv')
+    with open(config.shared_path(config.zone_config_file), 'r') as f:
+        zone_ids = [zone_config['id'] for zone_config in json.load(f)]
+    result_files = [os.path.join(config.logs_dir, f'{zone_id}_v1_transaction_results.csv') for zone_id in zone_ids]
 
     # Read simulation transactions
     transactions = {}
@@ -30,6 +39,8 @@ def main():
 
     # Read transaction results
     for result_file in result_files:
+        if not os.path.exists(result_file):
+            continue
         with open(result_file, 'r') as f:
             reader = csv.DictReader(f)
             for row in reader:
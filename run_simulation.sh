@@ -20,7 +20,8 @@ do
     export RUN_DIR
 
     # Run the Python script, redirect output, and capture any errors
-    sudo python3 "$Simulation_Script"
+    # Extra arguments (e.g. --tps 500 or --run-config my_run.json) are passed through to every run
+    sudo python3 "$Simulation_Script" "$@"
 
     echo ""
     echo ""
@@ -28,9 +29,15 @@ do
     echo "Simulation run $run completed."
     echo "##############################" 
 
-    python3 ./mininet_shared/calculate_latency.py
-    sudo rm -rf ./mininet_shared/logs
-    mkdir ./mininet_shared/logs
+    # The same arguments resolve to the same config, and so to the logs directory the run wrote to
+    python3 ./mininet_shared/calculate_latency.py "$@"
+    # Keep the run's results in the results database before its logs are removed
+    python3 ./mininet_shared/results_db.py "$@"
+    LOGS_DIR=$(python3 ./mininet_shared/run_config.py logs_dir "$@")
+    if [ -n "$LOGS_DIR" ]; then
+        sudo rm -rf -- "$LOGS_DIR"
+        mkdir -p -- "$LOGS_DIR"
+    fi
 done
 
 echo ""
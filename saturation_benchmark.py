@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+"""
+Find the maximum sustainable transfer rate of each topology.
+
+For every topology file the network is started once and the simulation
+controller is run repeatedly at increasing offered load. After each level the
+benchmark waits for in-flight transfers to drain, then measures end-to-end
+latency (controller send to receipt at the destination zone) and the
+completion ratio from the run's logs. A level is sustainable when the
+controller kept up with the offered rate, at least --min-completion of the
+transfers completed and p99 latency stayed under --max-p99.
+
+Load is either stepped linearly (--mode step) or doubled until a level fails
+and then bisected (--mode binary). The latency-vs-load curve of each topology
+and a summary of the maximum sustainable TPS are written to --output
+(benchmark_results/saturation in the shared directory by default).
+
+Usage: sudo python3 saturation_benchmark.py [topology files ...] [--mode binary] [--duration 10]
+"""
+
+import argparse
+import csv
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from mininet.log import setLogLevel
+
+from cosmos_topology import load_zones, start_network
+# Importable once cosmos_topology has added mininet_shared to the path
+from compare_runs import percentile
+from run_config import RunConfig
+
+def parse_timestamp(timestamp_str):
+    if '.' in timestamp_str:
+        return datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S.%f")
+    return datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
+
+def read_send_times(logs_dir, first_id):
+    send_times = {}
+    path = os.path.join(logs_dir, 'simulation_transactions.csv')
+    if os.path.exists(path):
+        with open(path, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                if int(row['transaction_id']) >= first_id:
+                    send_times[row['transaction_id']] = parse_timestamp(row['timestamp'])
+    return send_times
+
+def read_completion_times(logs_dir, zone_ids, transaction_ids):
+    completion_times = {}
+    for zone_id in zone_ids:
+        path = os.path.join(logs_dir, f'{zone_id}_v1_transaction_results.csv')
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                if row['transaction_id'] in transaction_ids:
+                    completion_times[row['transaction_id']] = parse_timestamp(row['timestamp'])
+    return completion_times
+
+def wait_for_drain(logs_dir, zone_ids, transaction_ids, settle, timeout):
+    # Wait until no new transfer has completed for `settle` seconds (or all completed)
+    deadline = time.time() + timeout
+    completed = -1
+    last_change = time.time()
+    while time.time() < deadline:
+        completions = read_completion_times(logs_dir, zone_ids, transaction_ids)
+        if len(completions) == len(transaction_ids):
+            return completions
+        if len(completions) != completed:
+            completed = len(completions)
+            last_change = time.time()
+        elif time.time() - last_change >= settle:
+            return completions
+        time.sleep(1)
+    return read_completion_times(logs_dir, zone_ids, transaction_ids)
+
+def measure_level(controller, zone_ids, tps, first_id, config, args):
+    logs_dir = config.logs_dir
+    controller.cmd(f'python3 {config.shared_dir}/simulation_controller.py --run-config {logs_dir}/run_config.json '
+                   f'--duration {args.duration} --tps {tps} --first-transaction-id {first_id} '
+                   f'> {logs_dir}/controller_{first_id}_log.txt 2>&1')
+    send_times = read_send_times(logs_dir, first_id)
+    completions = wait_for_drain(logs_dir, zone_ids, set(send_times), args.settle, args.drain_timeout)
+
+    latencies = sorted((completions[tx] - send_times[tx]).total_seconds() for tx in completions)
+    sent = len(send_times)
+    achieved_tps = sent / args.duration
+    completion_ratio = len(completions) / sent if sent else 0.0
+    p99 = percentile(latencies, 0.99)
+    sustainable = (sent > 0 and achieved_tps >= 0.9 * tps and completion_ratio >= args.min_completion
+                   and p99 is not None and p99 <= args.max_p99)
+    result = {
+        'offered_tps': tps,
+        'achieved_tps': round(achieved_tps, 2),
+        'sent': sent,
+        'completed': len(completions),
+        'completion_ratio': round(completion_ratio, 4),
+        'p50_latency': percentile(latencies, 0.50),
+        'p99_latency': p99,
+        'max_latency': latencies[-1] if latencies else None,
+        'sustainable': sustainable,
+    }
+    print(f"  {tps:>8} TPS offered: {achieved_tps:.1f} sent/s, {completion_ratio * 100:.1f}% completed, "
+          f"p50 {result['p50_latency']}, p99 {p99} -> {'OK' if sustainable else 'SATURATED'}")
+    return result, max([int(tx) for tx in send_times], default=first_id - 1) + 1
+
+def search(measure, args):
+    """Return (max sustainable TPS, results by offered TPS) using the configured search mode."""
+    results = {}
+
+    def sustainable(tps):
+        if tps not in results:
+            results[tps] = measure(tps)
+        return results[tps]['sustainable']
+
+    best = 0
+    tps = args.start_tps
+    if args.mode == 'step':
+        while tps <= args.max_tps and sustainable(tps):
+            best = tps
+            tps += args.step
+        return best, results
+
+    # Double the load until a level fails, then bisect between the last good and the first bad level
+    high = None
+    while tps <= args.max_tps:
+        if sustainable(tps):
+            best = tps
+            tps *= 2
+        else:
+            high = tps
+            break
+    while high is not None and high - best > args.tolerance:
+        mid = (best + high) // 2
+        if sustainable(mid):
+            best = mid
+        else:
+            high = mid
+    return best, results
+
+def benchmark_topology(topology_file, config, args):
+    name = os.path.splitext(os.path.basename(topology_file))[0]
+    zones = load_zones(topology_file)
+    zone_ids = [zone['id'] for zone in zones]
+    print(f"\n=== {name}: {len(zones)} zones ===")
+
+    logs_dir = config.logs_dir
+    shutil.rmtree(logs_dir, ignore_errors=True)
+    os.makedirs(logs_dir)
+    net = start_network(zones, config)
+    try:
+        time.sleep(args.warmup)
+        controller = net.get('controller')
+        next_id = 1
+
+        def measure(tps):
+            nonlocal next_id
+            result, next_id = measure_level(controller, zone_ids, tps, next_id, config, args)
+            return result
+
+        best, results = search(measure, args)
+    finally:
+        net.stop()
+        # Node processes run in the background of the host shells; make sure none survive into the next topology
+        subprocess.run(['pkill', '-f', f'{config.shared_dir}/(hub_node|zone_node|relayer).py'])
+
+    # Keep the raw logs of every topology next to its results
+    topology_dir = os.path.join(args.output, name)
+    shutil.rmtree(topology_dir, ignore_errors=True)
+    shutil.copytree(logs_dir, os.path.join(topology_dir, 'logs'))
+
+    curve_file = os.path.join(args.output, f'{name}_latency_vs_load.csv')
+    with open(curve_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(next(iter(results.values())).keys()))
+        writer.writeheader()
+        for tps in sorted(results):
+            writer.writerow(results[tps])
+    print(f"Maximum sustainable TPS for {name}: {best} (curve written to {curve_file})")
+    return name, len(zones), best, results
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the maximum sustainable TPS of each topology.')
+    parser.add_argument('topologies', nargs='*',
+                        help='Topology files (default: small.json, medium.json and zone_configs.json in the shared directory)')
+    parser.add_argument('--mode', choices=['step', 'binary'], default='binary')
+    parser.add_argument('--start-tps', type=int, default=100)
+    parser.add_argument('--step', type=int, default=100, help='Load increment in step mode')
+    parser.add_argument('--max-tps', type=int, default=20000)
+    parser.add_argument('--tolerance', type=int, default=50, help='Stop bisecting once the bracket is this narrow')
+    parser.add_argument('--warmup', type=float, default=5, help='Seconds to wait for nodes to start')
+    parser.add_argument('--settle', type=float, default=5, help='Seconds without new completions before a level is considered drained')
+    parser.add_argument('--drain-timeout', type=float, default=60)
+    parser.add_argument('--max-p99', type=float, default=10.0, help='Highest acceptable p99 latency in seconds')
+    parser.add_argument('--min-completion', type=float, default=0.99, help='Lowest acceptable completion ratio')
+    parser.add_argument('--output', help='Results directory (default: benchmark_results/saturation in the shared directory)')
+    RunConfig.add_arguments(parser)
+    args = parser.parse_args()
+
+    # Nodes and the controller run with this configuration; --duration is the load per level
+    config = RunConfig.load(args=args)
+    args.duration = config.duration or 10
+    args.topologies = args.topologies or [config.shared_path(name) for name in ('small.json', 'medium.json', 'zone_configs.json')]
+    args.output = args.output or config.shared_path(os.path.join('benchmark_results', 'saturation'))
+
+    # Read every topology up front: starting a network rewrites zone_configs.json
+    topology_dir = tempfile.mkdtemp(prefix='saturation_')
+    topologies = []
+    for topology_file in args.topologies:
+        topology_copy = os.path.join(topology_dir, os.path.basename(topology_file))
+        shutil.copyfile(topology_file, topology_copy)
+        topologies.append(topology_copy)
+
+    setLogLevel('warning')
+    os.makedirs(args.output, exist_ok=True)
+    summary = []
+    for topology_file in topologies:
+        name, num_zones, best, results = benchmark_topology(topology_file, config, args)
+        sustainable = [results[tps] for tps in results if results[tps]['sustainable']]
+        best_result = results.get(best, {})
+        summary.append({
+            'topology': name,
+            'zones': num_zones,
+            'max_sustainable_tps': best,
+            'p99_latency_at_max': best_result.get('p99_latency'),
+            'levels_measured': len(results),
+            'levels_sustainable': len(sustainable),
+        })
+
+    summary_file = os.path.join(args.output, 'saturation_summary.csv')
+    with open(summary_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(summary[0].keys()))
+        writer.writeheader()
+        writer.writerows(summary)
+
+    print("\n--- Saturation Summary ---")
+    for row in summary:
+        print(f"{row['topology']:<16} {row['zones']:>3} zones: max sustainable {row['max_sustainable_tps']} TPS "
+              f"(p99 {row['p99_latency_at_max']} s)")
+    print(f"Summary written to {summary_file}")
+
+if __name__ == '__main__':
+    main()